@@ -3,24 +3,64 @@ Defines endpoints of our API
 Handles interactions with our users, does not handle interactions with external APIs
 """
 import __init__
-import io
+import os
 import json
-import dateutil.parser
+import asyncio
+import hashlib
+import inspect
+from urllib.parse import urlencode
+from functools import partial, wraps
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, request, Response, redirect, Markup
 from flask_caching import Cache
-from markdown import markdown
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-from src.revision import URL
 from src.exceptions import NoRevisionsException
-from src.userhistory import UserHistory
+from src.userhistory import UserHistory, MultiUserHistory
 from src.articlehistory import ArticleHistory
-from src.exceptions import BadRequestException
-from src.histogram import Histogram
-from src.pie import Pie
+from src.bulkhistory import BulkArticleHistory
+from src.history import make_timestamp
+from src.exceptions import BadRequestException, RenderUnavailableException, \
+    UpstreamUnavailableException
+from src.render import render_chart, IMAGE_FORMATS
+from src.cache import CacheStats, CACHE_DIR, revision_cache
+from src.scheduler import scheduler
+from src import metrics
 
 app = Flask("WikiWatcher")
-mem_cache = Cache(app, config={"CACHE-TYPE": "simple"})
+# responses are cached on disk by default, so every worker process on a host
+# shares them; WIKIWATCHER_RESPONSE_CACHE picks another flask-caching backend
+# (e.g. SimpleCache for a per-process cache, or RedisCache with CACHE_REDIS_URL)
+mem_cache = Cache(app, config={
+    "CACHE_TYPE": os.environ.get("WIKIWATCHER_RESPONSE_CACHE",
+                                 "FileSystemCache" if CACHE_DIR else "SimpleCache"),
+    "CACHE_DIR": os.environ.get("WIKIWATCHER_RESPONSE_CACHE_DIR",
+                                os.path.join(CACHE_DIR, "responses")),
+    "CACHE_THRESHOLD": 5000,
+    "CACHE_REDIS_URL": os.environ.get("CACHE_REDIS_URL"),
+})
+response_cache_stats = CacheStats("response")
 CACHE_TIMEOUT = 120 # seconds
+LISTING_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+# exceptions a history route answers with an error page, and that page's heading and status
+HISTORY_ERRORS = (BadRequestException, NoRevisionsException, RenderUnavailableException)
+ERROR_PAGES = {
+    BadRequestException: ("Bad Request", 400),
+    NoRevisionsException: ("No Revisions", 404),
+    RenderUnavailableException: ("Service Unavailable", 503),
+    UpstreamUnavailableException: ("Service Unavailable", 503),
+}
+
+@app.before_request
+def start_request_metrics():
+    """ starts counting this request's upstream calls, timings and cache lookups """
+    metrics.start_request(request.url_rule.rule if request.url_rule else "unmatched")
+
+@app.after_request
+def add_server_timing(response):
+    """ records the request's metrics and describes them in a Server-Timing header """
+    request_metrics = metrics.finish_request(response.status_code)
+    if request_metrics is not None:
+        response.headers["Server-Timing"] = request_metrics.server_timing()
+    return response
 
 def validate_tagstring(tagstring):
     """ ensures user passed a list of tags to endpoint """
@@ -35,6 +75,38 @@ def parse_tags(tagstring):
     tagstring = tagstring[1:-1]
     return tagstring.split(",")
 
+def parse_bool(boolstring):
+    """ parses a user true/false string into a python bool """
+    if boolstring is None:
+        return None
+    if boolstring.lower() in ("true", "1", "yes"):
+        return True
+    if boolstring.lower() in ("false", "0", "no"):
+        return False
+    raise BadRequestException("expected true or false, got " + boolstring)
+
+def visualize_history(history, visualize, granularity, top_n, image_format):
+    """ returns a Response holding the requested chart of a history,
+    served from the chart cache when the same chart was drawn recently """
+    # charting pulls in matplotlib, so it is only imported once a chart is requested
+    from src.histogram import Histogram # pylint: disable=import-outside-toplevel
+    from src.pie import Pie # pylint: disable=import-outside-toplevel
+    pie_options = {} if top_n is None else {"top_n": top_n}
+    match visualize:
+        case "revisions_per_time":
+            options = {"granularity": granularity}
+            make_chart = partial(Histogram, granularity=granularity)
+        case "revisions_per_user" if isinstance(history, ArticleHistory):
+            options = pie_options
+            make_chart = partial(Pie, **pie_options)
+        case "revisions_per_article" if isinstance(history, UserHistory):
+            options = pie_options
+            make_chart = partial(Pie, **pie_options)
+        case _:
+            raise BadRequestException("Invalid choice of visualization")
+    image = render_chart(history, visualize, options, image_format, make_chart)
+    return Response(image, mimetype=IMAGE_FORMATS[image_format])
+
 def add_params_to_url(parameter, value, base_url, operator):
     """ adds parameters to URL """
     if value:
@@ -47,6 +119,7 @@ def add_params_to_url(parameter, value, base_url, operator):
 @app.route("/")
 def index():
     """ Our index landing page """
+    from markdown import markdown # pylint: disable=import-outside-toplevel
     with open("README.md", "r", encoding="utf-8") as readme:
         content = markdown(readme.read())
     return render_template('index.html', content=content)
@@ -59,6 +132,7 @@ def form():
 @app.route("/formrequest")
 def formrequest():
     """ Route to handle form requests """
+    import dateutil.parser # pylint: disable=import-outside-toplevel
     base_url = "/"
     endpoint = request.args.get("endpoint")
     match endpoint:
@@ -164,8 +238,215 @@ def formrequest():
 
     return redirect(base_url)
 
+def history_filters() -> dict:
+    """ reads the filters shared by every history route from the query string
+    into keyword arguments for ArticleHistory and UserHistory """
+    filters = {
+        "tags": parse_tags(request.args.get("tags", default=None, type=str)),
+        "keyword": request.args.get("keyword", default=None, type=str),
+    }
+    for bound in ("start", "end"):
+        for unit in ("year", "month", "day", "hour", "minute", "second"):
+            filters[bound + unit] = request.args.get(bound + unit, default=None, type=int)
+    filters["minor"] = parse_bool(request.args.get("minor", default=None, type=str))
+    filters["min_size"] = request.args.get("minsize", default=None, type=int)
+    filters["max_size"] = request.args.get("maxsize", default=None, type=int)
+    filters["comment"] = request.args.get("comment", default=None, type=str)
+    order = request.args.get("order", default="oldest", type=str)
+    if order not in ("oldest", "newest"):
+        raise BadRequestException("order must be oldest or newest")
+    filters["newest_first"] = order == "newest"
+    return filters
+
+def chart_options() -> dict:
+    """ reads the chart parameters from the query string
+    into keyword arguments for visualize_history """
+    return {
+        "visualize": request.args.get("visualize", default=None, type=str),
+        "granularity": request.args.get("granularity", default="auto", type=str),
+        "top_n": request.args.get("top_n", default=None, type=int),
+        "image_format": request.args.get("format", default=None, type=str) or "png",
+    }
+
+def listing_format():
+    """ reads the format a revision listing is requested in from the query string
+    None keeps the original listing, whose revisions are separated by <br/> tags """
+    requested = request.args.get("format", default=None, type=str)
+    if requested is not None and requested not in LISTING_FORMATS:
+        raise BadRequestException("format must be one of " + ", ".join(LISTING_FORMATS))
+    return requested
+
+def encode_listing(rows, requested_format):
+    """ yields revision dicts as newline-delimited JSON, or as the pieces of
+    a JSON array with one revision per line """
+    if requested_format == "ndjson":
+        for row in rows:
+            yield json.dumps(row) + "\n"
+        return
+    separator = "["
+    for row in rows:
+        yield separator + json.dumps(row)
+        separator = ",\n"
+    yield "[]" if separator == "[" else "]\n"
+
+def listing_response(history, requested_format):
+    """ returns a streamed Response listing a history's revisions
+    an unfetched history is fetched one page at a time while the response
+    is being sent, so the first revisions go out before the last page arrives """
+    if history.revisions is None:
+        rows = history.stream_revisions()
+    else:
+        rows = history.revisions.iter_json()
+    return Response(encode_listing(rows, requested_format),
+                    mimetype=LISTING_FORMATS[requested_format])
+
+def page_limit():
+    """ reads the limit and cursor of a paged listing from the query string
+    returns a tuple of (limit, cursor), with limit None for an unpaged listing """
+    limit = request.args.get("limit", default=None, type=int)
+    cursor = request.args.get("cursor", default=None, type=str)
+    if cursor is not None and limit is None:
+        raise BadRequestException("cursor requires limit")
+    return limit, cursor
+
+def page_response(history, next_cursor, requested_format):
+    """ returns one filled page of a history's revisions, pointing at the next
+    page through X-Next-Cursor and Link headers when there is one """
+    if requested_format is None:
+        response = Response(history.revisions_as_json())
+    else:
+        response = listing_response(history, requested_format)
+    if next_cursor is not None:
+        args = request.args.to_dict(flat=False)
+        args["cursor"] = [next_cursor]
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = \
+            f'<{request.base_url}?{urlencode(args, doseq=True)}>; rel="next"'
+    return response
+
+def is_cacheable(response) -> bool:
+    """ only successful responses are cached, so that errors such as "try
+    again shortly" do not outlive what caused them; streamed responses are
+    consumed as they are sent, so are never cached either """
+    if isinstance(response, tuple):
+        status = response[1] if len(response) > 1 and isinstance(response[1], int) else 200
+        return status == 200
+    if isinstance(response, Response):
+        return response.status_code == 200 and not response.is_streamed
+    return True
+
+def article_history_from_request(title) -> ArticleHistory:
+    """ builds an unfetched ArticleHistory from the request's parameters """
+    return ArticleHistory(titles=title,
+                          user=request.args.get("user", default=None, type=str),
+                          fetch=False, **history_filters())
+
+def user_history_from_request(username) -> UserHistory:
+    """ builds an unfetched UserHistory from the request's parameters """
+    return UserHistory(user=username,
+                       titles=request.args.get("title", default=None, type=str),
+                       namespace=request.args.get("namespace", default=None, type=int),
+                       fetch=False, **history_filters())
+
+def multi_user_history_from_request() -> MultiUserHistory:
+    """ builds an unfetched MultiUserHistory from the request's parameters """
+    return MultiUserHistory(users=request.args.get("users", default=None, type=str),
+                            user_prefix=request.args.get("userprefix", default=None, type=str),
+                            titles=request.args.get("title", default=None, type=str),
+                            namespace=request.args.get("namespace", default=None, type=int),
+                            fetch=False, **history_filters())
+
+def response_cache_key(build_history, *args, **kwargs) -> str:
+    """ keys a response by what the request means rather than how it was spelled
+    history routes use the history's normalized query key (sorted tags,
+    canonical timestamps and titles) plus the output options; other routes,
+    and requests whose parameters do not parse, use the sorted query string """
+    key = [request.endpoint]
+    try:
+        if build_history is None:
+            raise BadRequestException("no history to normalize")
+        key.append(build_history(*args, **kwargs).query_key())
+        options = chart_options()
+        if options["visualize"]:
+            key.append(options)
+        else:
+            key.append([listing_format(), *page_limit()])
+    except BadRequestException:
+        key = [request.endpoint, kwargs, sorted(request.args.items(multi=True))]
+    return "response:" + hashlib.sha256(
+        json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def cached_response(timeout: int, build_history=None):
+    """ caches a route's responses in mem_cache under response_cache_key,
+    counting hits and misses in response_cache_stats
+    build_history takes the route's arguments and returns its unfetched
+    History, whose query key then stands for the request """
+    def decorator(view):
+        def lookup(args, kwargs):
+            key = response_cache_key(build_history, *args, **kwargs)
+            cached = mem_cache.get(key)
+            response_cache_stats.record(cached is not None)
+            return key, cached
+
+        def store(key, response):
+            if is_cacheable(response):
+                mem_cache.set(key, response, timeout=timeout)
+            return response
+
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                key, cached = lookup(args, kwargs)
+                if cached is not None:
+                    return cached
+                return store(key, await view(*args, **kwargs))
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key, cached = lookup(args, kwargs)
+            if cached is not None:
+                return cached
+            return store(key, view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+def error_page(err):
+    """ returns the error page and status answering one of the ERROR_PAGES exceptions """
+    for error_type, (heading, status) in ERROR_PAGES.items():
+        if isinstance(err, error_type):
+            return f"<h1>{heading}</h1>" + str(err), status
+    raise err
+
+@app.errorhandler(UpstreamUnavailableException)
+def upstream_unavailable(err):
+    """ answers any route with 503 when Wikipedia's API is still failing
+    after every retry; like other errors, the page is not cached """
+    return error_page(err)
+
+def history_response(build_history, *args):
+    """ serves a history route: build_history takes the route's arguments and
+    returns its unfetched History, which is then drawn as a chart, filled
+    one page at a time, streamed as a listing, or filled and returned whole """
+    try:
+        revisions = build_history(*args)
+        options = chart_options()
+        if options["visualize"]:
+            return visualize_history(revisions, **options)
+        requested_format = listing_format()
+        limit, cursor = page_limit()
+        if limit is not None:
+            return page_response(revisions, revisions.fill_page(limit, cursor),
+                                 requested_format)
+        if requested_format is not None:
+            return listing_response(revisions, requested_format)
+        revisions.fill_revisions()
+        return revisions.revisions_as_json()
+    except HISTORY_ERRORS as err:
+        return error_page(err)
+
 @app.route("/articleHistory/<title>")
-@mem_cache.cached(timeout=CACHE_TIMEOUT)
+@cached_response(CACHE_TIMEOUT, article_history_from_request)
 def get_article_history(title):
     """ /articleHistory/<title>?...
     Returns a JSON collection of revisions made to an article.
@@ -173,56 +454,21 @@ def get_article_history(title):
         tags,
         keyword (in content of revisions),
         username of editor,
+        minor (true/false) to keep only minor or only major edits,
+        minsize & maxsize bounds on the page size after the revision,
+        comment (a regular expression matched against the edit summary),
         starting & ending year, month, day, hour, minute, and second
             to filter revisions by datetime
+    format=json or format=ndjson streams the revisions as they arrive from
+    Wikipedia, as a JSON array or as one JSON object per line
+    order=newest lists the most recent revisions first
+    limit returns at most that many revisions; the X-Next-Cursor header
+    then holds a cursor parameter which resumes where the page ended
     """
-    # gather user inputs
-    tags: list[str] = parse_tags(request.args.get("tags", default=None, type=str))
-    keyword: str = request.args.get("keyword", default=None, type=str)
-    user: str = request.args.get("user", default=None, type=str)
-    startyear: int = request.args.get("startyear", default=None, type=int)
-    startmonth: int = request.args.get("startmonth", default=None, type=int)
-    startday: int = request.args.get("startday", default=None, type=int)
-    starthour: int = request.args.get("starthour", default=None, type=int)
-    startminute: int = request.args.get("startminute", default=None, type=int)
-    startsecond: int = request.args.get("startsecond", default=None, type=int)
-    endyear: int = request.args.get("endyear", default=None, type=int)
-    endmonth: int = request.args.get("endmonth", default=None, type=int)
-    endday: int = request.args.get("endday", default=None, type=int)
-    endhour: int = request.args.get("endhour", default=None, type=int)
-    endminute: int = request.args.get("endminute", default=None, type=int)
-    endsecond: int = request.args.get("endsecond", default=None, type=int)
-    visualize: str = request.args.get("visualize", default=None, type=str)
-    # gather and filter revisions
-    try:
-        revisions = ArticleHistory(titles=title,
-                                   startyear=startyear, startmonth=startmonth, startday=startday,
-                                   starthour=starthour, startminute=startminute,
-                                   startsecond=startsecond, endyear=endyear, endmonth=endmonth,
-                                   endday=endday, endhour=endhour, endminute=endminute,
-                                   endsecond=endsecond, tags=tags, user=user, keyword=keyword)
-        # https://stackoverflow.com/questions/50728328/
-        # python-how-to-show-matplotlib-in-flask/50728936#50728936
-        if visualize:
-            output = io.BytesIO()
-            chart = None
-            match visualize:
-                case "revisions_per_time":
-                    chart = Histogram(revisions)
-                case "revisions_per_user":
-                    chart = Pie(revisions)
-                case _:
-                    raise BadRequestException("Invalid choice of visualization")
-            FigureCanvas(chart.get_graph()).print_png(output)
-            return Response(output.getvalue(), mimetype="image/png")
-        return revisions.revisions_as_json()
-    except BadRequestException as bre:
-        return "<h1>Bad Request</h1>" + str(bre), 400
-    except NoRevisionsException as nre:
-        return "<h1>No Revisions</h1>" + str(nre), 404
+    return history_response(article_history_from_request, title)
 
 @app.route("/userHistory/<username>")
-@mem_cache.cached(timeout=CACHE_TIMEOUT)
+@cached_response(CACHE_TIMEOUT, user_history_from_request)
 def get_user_history(username):
     """ /userHistory/<username>?...
     Returns a JSON collection of revisions made by a user.
@@ -230,76 +476,142 @@ def get_user_history(username):
         tags,
         keyword (in content of revisions),
         article title,
+        namespace number (e.g. 0 for articles, 2 for user pages),
+        minor (true/false) to keep only minor or only major edits,
+        minsize & maxsize bounds on the page size after the revision,
+        comment (a regular expression matched against the edit summary),
         starting & ending year, month, day, hour, minute, and second
             to filter revisions by datetime
+    format=json or format=ndjson streams the revisions as they arrive from
+    Wikipedia, as a JSON array or as one JSON object per line
+    order=newest lists the most recent revisions first
+    limit returns at most that many revisions; the X-Next-Cursor header
+    then holds a cursor parameter which resumes where the page ended
     """
-    # temporarily disabling some pylint errors while waiting for class userhistory
-    #pylint: disable=E1123,E1120
-    # gather user inputs
-    tags: list[str] = parse_tags(request.args.get("tags", default=None, type=str))
-    keyword: str = request.args.get("keyword", default=None, type=str)
-    titles: str = request.args.get("title", default=None, type=str)
-    startyear: int = request.args.get("startyear", default=None, type=int)
-    startmonth: int = request.args.get("startmonth", default=None, type=int)
-    startday: int = request.args.get("startday", default=None, type=int)
-    starthour: int = request.args.get("starthour", default=None, type=int)
-    startminute: int = request.args.get("startminute", default=None, type=int)
-    startsecond: int = request.args.get("startsecond", default=None, type=int)
-    endyear: int = request.args.get("endyear", default=None, type=int)
-    endmonth: int = request.args.get("endmonth", default=None, type=int)
-    endday: int = request.args.get("endday", default=None, type=int)
-    endhour: int = request.args.get("endhour", default=None, type=int)
-    endminute: int = request.args.get("endminute", default=None, type=int)
-    endsecond: int = request.args.get("endsecond", default=None, type=int)
-    visualize: str = request.args.get("visualize", default=None, type=str)
-    # gather and filter revisions
+    return history_response(user_history_from_request, username)
+
+async def history_response_async(build_history, *args):
+    """ history_response() without blocking on Wikipedia: revisions are
+    awaited page by page, while chart drawing (which may also fill the
+    history, on a chart cache miss) is handed to a worker thread """
     try:
-        revisions = UserHistory(user=username,
-                                startyear=startyear, startmonth=startmonth, startday=startday,
-                                starthour=starthour, startminute=startminute,
-                                startsecond=startsecond, endyear=endyear, endmonth=endmonth,
-                                endday=endday, endhour=endhour, endminute=endminute,
-                                endsecond=endsecond, tags=tags, titles=titles, keyword=keyword)
-        # https://stackoverflow.com/questions/50728328/
-        # python-how-to-show-matplotlib-in-flask/50728936#50728936
-        if visualize:
-            output = io.BytesIO()
-            chart = None
-            match visualize:
-                case "revisions_per_time":
-                    chart = Histogram(revisions)
-                case "revisions_per_article":
-                    chart = Pie(revisions)
-                case _:
-                    raise BadRequestException("Invalid choice of visualization")
-            FigureCanvas(chart.get_graph()).print_png(output)
-            return Response(output.getvalue(), mimetype="image/png")
+        revisions = build_history(*args)
+        options = chart_options()
+        if options["visualize"]:
+            return await asyncio.to_thread(visualize_history, revisions, **options)
+        requested_format = listing_format()
+        limit, cursor = page_limit()
+        if limit is not None:
+            next_cursor = await asyncio.to_thread(revisions.fill_page, limit, cursor)
+            return page_response(revisions, next_cursor, requested_format)
+        await revisions.fetch()
+        if requested_format is not None:
+            return listing_response(revisions, requested_format)
         return revisions.revisions_as_json()
+    except HISTORY_ERRORS as err:
+        return error_page(err)
+
+@app.route("/async/articleHistory/<title>")
+@cached_response(CACHE_TIMEOUT, article_history_from_request)
+async def get_article_history_async(title):
+    """ /async/articleHistory/<title>?...
+    Takes the same parameters and returns the same results as /articleHistory,
+    fetching the revisions asynchronously
+    """
+    return await history_response_async(article_history_from_request, title)
+
+@app.route("/async/userHistory/<username>")
+@cached_response(CACHE_TIMEOUT, user_history_from_request)
+async def get_user_history_async(username):
+    """ /async/userHistory/<username>?...
+    Takes the same parameters and returns the same results as /userHistory,
+    fetching the revisions asynchronously
+    """
+    return await history_response_async(user_history_from_request, username)
+
+@app.route("/bulkArticleHistory")
+@cached_response(CACHE_TIMEOUT)
+def get_bulk_article_history():
+    """ /bulkArticleHistory?titles=<title>|<title>|...  or  ?category=<category>
+    Returns a JSON object listing, for every article, the revisions matching
+    the same optional filters as /articleHistory (tags, keyword, user, minor,
+    minsize, maxsize, comment, starting & ending date/time, order).
+    Articles are looked up 50 per request to Wikipedia, and full histories
+    are only fetched for articles edited since the starting date/time;
+    without one, at most 50 articles may be covered
+    """
+    try:
+        bulk = BulkArticleHistory(titles=request.args.get("titles", default=None, type=str),
+                                  category=request.args.get("category", default=None, type=str),
+                                  user=request.args.get("user", default=None, type=str),
+                                  **history_filters())
+        return Response(json.dumps(bulk.as_json()), mimetype="application/json")
     except BadRequestException as bre:
         return "<h1>Bad Request</h1>" + str(bre), 400
-    except NoRevisionsException as nre:
-        return "<h1>No Revisions</h1>" + str(nre), 404
+
+@app.route("/userHistories")
+@cached_response(CACHE_TIMEOUT, multi_user_history_from_request)
+def get_user_histories():
+    """ /userHistories?users=<user>|<user>|...  or  ?userprefix=<prefix>
+    Returns a JSON object mapping each user to their revisions matching the
+    same optional filters as /userHistory (tags, keyword, title, namespace,
+    minor, minsize, maxsize, comment, starting & ending date/time, order).
+    Contributions are listed for 50 users per request to Wikipedia
+    """
+    try:
+        history = multi_user_history_from_request()
+        history.fill_revisions()
+    except NoRevisionsException:
+        history.revisions = None
+    except BadRequestException as bre:
+        return "<h1>Bad Request</h1>" + str(bre), 400
+    return Response('{"users": ' + history.revisions_by_user_as_json() + "}",
+                    mimetype="application/json")
+
+@app.route("/cacheStats")
+def get_cache_stats():
+    """ /cacheStats
+    Returns hit and miss counts of this worker process's lookups in the
+    shared response cache and in the revision content cache
+    """
+    return {"pid": os.getpid(),
+            "responses": response_cache_stats.as_dict(),
+            "revisions": revision_cache.stats.as_dict()}
+
+@app.route("/upstreamStats")
+def get_upstream_stats():
+    """ /upstreamStats
+    Returns this worker process's rate limit, how often Wikipedia asked it to
+    slow down, and per-lane request counts and queue wait times
+    """
+    return {"pid": os.getpid()} | scheduler.stats()
+
+def request_timestamp(bound: str) -> str:
+    """ builds the timestamp given by the start or end date/time parameters
+    of the query string, or None if none were given """
+    return make_timestamp(*(request.args.get(bound + unit, default=None, type=int)
+                            for unit in ("year", "month", "day", "hour", "minute", "second")))
+
+@app.route("/metrics")
+def get_metrics():
+    """ /metrics
+    Returns this worker process's request counts and latency histograms,
+    upstream calls, bytes and timings, and cache lookups per route,
+    in the Prometheus text format
+    """
+    return Response(metrics.registry.exposition(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/getRevision/<title>")
-@mem_cache.cached(timeout=CACHE_TIMEOUT)
+@cached_response(CACHE_TIMEOUT)
 def get_revision(title):
     """ /getRevision/<title>?...
     Returns the contents of a single revision.
     Takes a mandatory argument for article title, as well as
     a mandatory year parameter and optional month, day, hour, minute, and second
     """
-    startyear: int = request.args.get("startyear", default=None, type=int)
-    startmonth: int = request.args.get("startmonth", default=None, type=int)
-    startday: int = request.args.get("startday", default=None, type=int)
-    starthour: int = request.args.get("starthour", default=None, type=int)
-    startminute: int = request.args.get("startminute", default=None, type=int)
-    startsecond: int = request.args.get("startsecond", default=None, type=int)
     try:
-        revisions = ArticleHistory(titles=title,
-                                    startyear=startyear, startmonth=startmonth,
-                                    startday=startday, starthour=starthour,
-                                    startminute=startminute, startsecond=startsecond)
-        ret = json.dumps(revisions.revisions[0].get_content())
+        revision = ArticleHistory.revision_at(title, request_timestamp("start"), "newer")
+        ret = json.dumps(revision.get_content())
         return ret
     except BadRequestException as bre:
         return "<h1>Bad Request</h1>" + str(bre), 400
@@ -307,7 +619,7 @@ def get_revision(title):
         return "<h1>No Revisions</h1>" + str(nre), 404
 
 @app.route("/compareRevisions/<title>")
-@mem_cache.cached(timeout=CACHE_TIMEOUT*2)
+@cached_response(CACHE_TIMEOUT*2)
 def get_difference(title):
     """ /getRevision/<title>?...
     Returns the difference between two revisions a and b.
@@ -317,29 +629,19 @@ def get_difference(title):
     a mandatory year parameter and optional month, day, hour, minute, and second
     for revision b.
     """
-    startyear: int = request.args.get("startyear", default=None, type=int)
-    startmonth: int = request.args.get("startmonth", default=None, type=int)
-    startday: int = request.args.get("startday", default=None, type=int)
-    starthour: int = request.args.get("starthour", default=None, type=int)
-    startminute: int = request.args.get("startminute", default=None, type=int)
-    startsecond: int = request.args.get("startsecond", default=None, type=int)
-    endyear: int = request.args.get("endyear", default=None, type=int)
-    endmonth: int = request.args.get("endmonth", default=None, type=int)
-    endday: int = request.args.get("endday", default=None, type=int)
-    endhour: int = request.args.get("endhour", default=None, type=int)
-    endminute: int = request.args.get("endminute", default=None, type=int)
-    endsecond: int = request.args.get("endsecond", default=None, type=int)
     try:
-        revisions = ArticleHistory(titles=title,
-                                    startyear=startyear, startmonth=startmonth,
-                                    startday=startday, starthour=starthour,
-                                    startminute=startminute, startsecond=startsecond,
-                                    endyear=endyear, endmonth=endmonth,
-                                    endday=endday, endhour=endhour,
-                                    endminute=endminute, endsecond=endsecond)
-        ret = revisions.revisions[0].get_diff(revisions.revisions[-1].revid)
-        new = revisions.revisions[-1].get_content()
-        prev = revisions.revisions[0].get_content()
+        start, end = request_timestamp("start"), request_timestamp("end")
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            # the first revision in the range, and the last
+            first = pool.submit(metrics.carry(ArticleHistory.revision_at), title, start, "newer")
+            last = pool.submit(metrics.carry(ArticleHistory.revision_at), title, end, "older")
+            first, last = first.result(), last.result()
+            if first.timestamp > last.timestamp:
+                raise NoRevisionsException("No revisions matching filter parameters")
+            ret = pool.submit(metrics.carry(first.get_diff), last.revid)
+            new = pool.submit(metrics.carry(last.get_content))
+            prev = pool.submit(metrics.carry(first.get_content))
+            ret, new, prev = ret.result(), new.result(), prev.result()
 
         return render_template("diff.html", title=title,
                                diff=Markup(ret),
@@ -0,0 +1 @@
+""" Benchmarks for WikiWatcher; run each module as a script from the repository root """
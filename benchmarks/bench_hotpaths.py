@@ -0,0 +1,235 @@
+""" Times the in-process hot paths on 1k, 10k and 100k revisions, offline.
+Revisions come from a synthetic fixture (random users, tags, sizes and
+timestamps spread over a few years) or from the recorded API response in
+tests/resources, repeated with fresh ids and timestamps. No request ever
+reaches Wikipedia: histories are built unfetched and handed the fixture.
+
+Each operation reports its best wall time over --repeat runs, and the peak
+memory it allocated (measured with tracemalloc in a separate run, since
+tracing slows everything down). Times are also stored relative to a fixed
+calibration workload run alongside them, so a baseline recorded on one
+machine can be compared on another. --save writes the results as a baseline;
+--compare reads one back and exits non-zero when any operation got slower
+relative to the calibration (or hungrier) than the baseline by more than
+--tolerance.
+
+usage: python benchmarks/bench_hotpaths.py [--sizes 1000 10000 100000]
+           [--fixture synthetic|recorded] [--repeat N]
+           [--save FILE | --compare FILE [--tolerance 1.5]]
+"""
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.revision import Revision # pylint: disable=wrong-import-position
+from src.revisiontable import RevisionTable # pylint: disable=wrong-import-position
+from src.articlehistory import ArticleHistory # pylint: disable=wrong-import-position
+from src.histogram import Histogram # pylint: disable=wrong-import-position
+from src.pie import Pie # pylint: disable=wrong-import-position
+
+SIZES = [1000, 10000, 100000]
+RECORDED = os.path.join(ROOT, "tests", "resources", "wikipedia_responses.json")
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline_hotpaths.json")
+TAGS = ["mobile edit", "mobile web edit", "visualeditor", "wikieditor",
+        "mw-reverted", "mw-undo", "mw-rollback", "discussiontools"]
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def synthetic_rows(count: int, seed: int = 0) -> list[dict]:
+    """ count revision rows of one article, with a few hundred editors
+    (some far busier than others) and revisions in time order """
+    rng = random.Random(seed)
+    ranks = list(range(300))
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in ranks))
+    seconds = sorted(rng.randrange(0, 3 * 365 * 86400) for _ in range(count))
+    rows = []
+    for i, offset in enumerate(seconds):
+        rank = rng.choices(ranks, cum_weights=cum_weights)[0]
+        rows.append({
+            "revid": 1000000 + i, "parentid": 1000000 + i - 1 if i else 0,
+            "minor": rng.random() < 0.3, "user": f"Editor{rank}", "userid": rank + 1,
+            "timestamp": (EPOCH + timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "size": rng.randrange(1000, 200000),
+            "comment": rng.choice(["", "copyedit", "rv vandalism", "add source", "/* Career */"]),
+            "tags": rng.sample(TAGS, rng.choice((0, 0, 1, 1, 2))),
+            "pageid": 61495838, "title": "Benchmark"})
+    return rows
+
+
+def recorded_rows(count: int) -> list[dict]:
+    """ count revision rows copied from the recorded API response, each
+    with its own revid and a timestamp an hour after the last """
+    with open(RECORDED, "r", encoding="utf-8") as file:
+        page = json.load(file)["query"]["pages"][0]
+    recorded = [dict(revision, pageid=page["pageid"], title=page["title"])
+                for revision in page["revisions"]]
+    rows = []
+    for i in range(count):
+        row = dict(recorded[i % len(recorded)])
+        row["revid"] = row["revid"] + i
+        row["timestamp"] = (EPOCH + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        rows.append(row)
+    return rows
+
+
+def history_of(table: RevisionTable, **filters) -> ArticleHistory:
+    """ an unfetched article history holding a copy of table """
+    history = ArticleHistory(titles="Benchmark", fetch=False, **filters)
+    history.revisions = table.select(np.arange(len(table)))
+    return history
+
+
+def operations(rows: list[dict]) -> dict:
+    """ maps each operation's name to a function of no arguments running it
+    once on rows; set-up work happens here, outside the timed call """
+    table = RevisionTable.from_json(rows)
+    plain = history_of(table)
+    histogram = Histogram(plain)
+
+    def filtered():
+        history_of(table, min_size=50000, comment="source|rv", minor=False).filter()
+
+    def filtered_by_tags():
+        history_of(table, tags=["mobile edit"]).filter_by_tags()
+
+    return {
+        "Revision.__init__": lambda: [Revision(row) for row in rows],
+        "RevisionTable.from_json": lambda: RevisionTable.from_json(rows),
+        "History.filter": filtered,
+        "History.filter_by_tags": filtered_by_tags,
+        "get_list_of_revision_key_data": lambda: plain.get_list_of_revision_key_data("user"),
+        "Histogram.get_x_axis_data": histogram.get_x_axis_data,
+        "Histogram.set_num_bins": histogram.set_num_bins,
+        "Pie.__init__": lambda: Pie(plain),
+        "revisions_as_json": plain.revisions_as_json,
+    }
+
+
+def best_time(func, repeat: int) -> float:
+    """ the fastest of repeat calls to func, in seconds """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibration_workload():
+    """ a fixed mix of interpreter and numpy work, like the hot paths' """
+    rows = [{"size": i % 9973, "user": f"Editor{i % 300}"} for i in range(20000)]
+    users = {}
+    for row in rows:
+        users[row["user"]] = users.get(row["user"], 0) + row["size"]
+    values = np.arange(200000) % 9973
+    np.unique(values, return_counts=True)
+
+
+def calibrate(repeat: int) -> float:
+    """ the best time of the calibration workload on this machine, in seconds """
+    return best_time(calibration_workload, max(repeat, 5))
+
+
+def peak_memory(func) -> int:
+    """ the most memory func had allocated at once during one call, in bytes """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes: list[int], fixture: str, repeat: int) -> dict:
+    """ runs every operation at every size; returns results keyed by
+    "operation@size", each time also given relative to the calibration
+    workload, timed around every size (the fastest timing is kept, as the
+    one least disturbed by other load) """
+    results = {}
+    calibrations = [calibrate(repeat)]
+    for size in sizes:
+        rows = synthetic_rows(size) if fixture == "synthetic" else recorded_rows(size)
+        for name, func in operations(rows).items():
+            results[f"{name}@{size}"] = {"seconds": best_time(func, repeat),
+                                         "peak_bytes": peak_memory(func)}
+        calibrations.append(calibrate(repeat))
+    for result in results.values():
+        result["relative"] = result["seconds"] / min(calibrations)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ returns the keys of results which regressed past tolerance times
+    the baseline, in time relative to the calibration or in peak memory """
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if result["relative"] > before["relative"] * tolerance or \
+                result["peak_bytes"] > before["peak_bytes"] * tolerance:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    """ prints a table of timings, then saves or compares against a baseline """
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                            help="revision counts to run at (default 1000 10000 100000)")
+    arg_parser.add_argument("--fixture", choices=("synthetic", "recorded"),
+                            default="synthetic", help="where revisions come from")
+    arg_parser.add_argument("--repeat", type=int, default=5,
+                            help="timed runs per operation; the best is kept (default 5)")
+    arg_parser.add_argument("--save", metavar="FILE", nargs="?", const=BASELINE,
+                            help=f"write results as a baseline (default {BASELINE})")
+    arg_parser.add_argument("--compare", metavar="FILE", nargs="?", const=BASELINE,
+                            help="compare results against a saved baseline")
+    arg_parser.add_argument("--tolerance", type=float, default=1.5,
+                            help="slowdown factor counted as a regression (default 1.5)")
+    args = arg_parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)["results"].get(args.fixture, {})
+        if any("relative" not in before for before in baseline.values()):
+            sys.exit(f"{args.compare} holds absolute timings only; re-record it with --save")
+    results = run(args.sizes, args.fixture, args.repeat)
+
+    print(f"{'operation':<40} {'best ms':>10} {'peak KiB':>10} {'vs baseline':>12}")
+    for key, result in results.items():
+        before = baseline.get(key)
+        ratio = f"{result['relative'] / before['relative']:>11.2f}x" if before else ""
+        print(f"{key:<40} {result['seconds'] * 1000:>10.2f} "
+              f"{result['peak_bytes'] / 1024:>10.0f} {ratio:>12}")
+
+    if args.save:
+        saved = {"results": {}}
+        if os.path.exists(args.save):
+            with open(args.save, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+        saved["python"] = sys.version.split()[0]
+        saved["results"].setdefault(args.fixture, {}).update(results)
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(saved, file, indent=2, sort_keys=True)
+            file.write("\n")
+    if args.compare:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"regressed by more than {args.tolerance}x: " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
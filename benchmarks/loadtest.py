@@ -0,0 +1,167 @@
+""" Drives load through each Flask route and reports throughput and latency.
+Every route is requested --requests times from --concurrency threads, and
+the driver reports requests per second and p50/p99 latency per route,
+with its 4xx and 5xx counts. Any response other than 200 makes the driver
+exit non-zero, since a broken route would otherwise look like a fast one.
+
+By default WikiWatcher runs in this process (through Flask's test client)
+against a stand-in API from benchmarks/replay_server.py, started here with
+the same latency, error and recording options, so no request reaches
+Wikipedia. --api-url uses a stand-in (or real API) already running instead,
+and --target sends requests over HTTP to a WikiWatcher server already
+running (started with WIKIWATCHER_API_URL pointing at a stand-in).
+
+The response cache is switched off unless --cache is given, so every
+request does its full upstream work, and the upstream rate limit is lifted
+unless --upstream-rate sets one.
+
+usage: python benchmarks/loadtest.py [--routes NAME ...] [--requests N]
+           [--concurrency C] [--target URL | --api-url URL] [--cache]
+           [--upstream-rate R] [stand-in options, see replay_server.py]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import replay_server # pylint: disable=wrong-import-position
+
+ARTICLES = 40  # distinct articles and users the requests rotate through
+ROUTES = {
+    "articleHistory": lambda i: f"/articleHistory/Article {i % ARTICLES}"
+                                "?startyear=2021&endyear=2022",
+    "articleHistory-limit": lambda i: f"/articleHistory/Article {i % ARTICLES}?limit=50",
+    "articleHistory-ndjson": lambda i: f"/articleHistory/Article {i % ARTICLES}?format=ndjson",
+    "articleHistory-chart": lambda i: f"/articleHistory/Article {i % ARTICLES}"
+                                      "?visualize=revisions_per_time",
+    "userHistory": lambda i: f"/userHistory/Editor{i % ARTICLES}?startyear=2021&endyear=2022",
+    "async-articleHistory": lambda i: f"/async/articleHistory/Article {i % ARTICLES}"
+                                      "?startyear=2021&endyear=2022",
+    "async-userHistory": lambda i: f"/async/userHistory/Editor{i % ARTICLES}"
+                                   "?startyear=2021&endyear=2022",
+    "userHistories": lambda i: "/userHistories?users=" + "|".join(
+        f"Editor{(i + n) % ARTICLES}" for n in range(3)) + "&startyear=2021&endyear=2022",
+    "bulkArticleHistory": lambda i: f"/bulkArticleHistory?category=Stand-in {i % 4}"
+                                    "&startyear=2022&startmonth=12",
+    "getRevision": lambda i: f"/getRevision/Article {i % ARTICLES}?startyear=2021",
+    "compareRevisions": lambda i: f"/compareRevisions/Article {i % ARTICLES}"
+                                  "?startyear=2021&endyear=2022",
+}
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """ the value below which fraction of sorted_values fall (nearest rank) """
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def in_process_client(api_url: str, cache: bool):
+    """ returns a get(path) function calling WikiWatcher in this process """
+    os.environ["WIKIWATCHER_API_URL"] = api_url
+    if not cache:
+        os.environ["WIKIWATCHER_RESPONSE_CACHE"] = "NullCache"
+    import app # pylint: disable=import-outside-toplevel
+    from src import upstream # pylint: disable=import-outside-toplevel
+    upstream.configure(url=api_url)
+    client = app.app.test_client()
+    def get(path):
+        response = client.get(path)
+        response.get_data()
+        return response.status_code
+    return get
+
+
+def http_client(target: str):
+    """ returns a get(path) function calling a running WikiWatcher server """
+    session = requests.Session()
+    def get(path):
+        return session.get(target.rstrip("/") + path, timeout=120).status_code
+    return get
+
+
+def drive(get, path_for, count: int, concurrency: int) -> dict:
+    """ requests count paths from concurrency threads; returns the route's report """
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            status = get(path_for(i))
+        except Exception: # pylint: disable=broad-except
+            status = None
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(count)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {"requests": count,
+            "client_errors": sum(1 for _, status in results
+                                 if status is not None and 400 <= status < 500),
+            "errors": sum(1 for _, status in results if status is None or status >= 500),
+            "non_ok": sum(1 for _, status in results if status != 200),
+            "throughput": count / elapsed,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "mean": statistics.fmean(latencies)}
+
+
+def main():
+    """ runs each route in turn and prints a table of results """
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES),
+                            help="routes to drive (default all)")
+    arg_parser.add_argument("--requests", type=int, default=100,
+                            help="requests per route (default 100)")
+    arg_parser.add_argument("--concurrency", type=int, default=8,
+                            help="requests in flight at once (default 8)")
+    arg_parser.add_argument("--target", help="base URL of a running WikiWatcher server")
+    arg_parser.add_argument("--api-url", help="API for an in-process WikiWatcher to call")
+    arg_parser.add_argument("--cache", action="store_true",
+                            help="keep the response cache switched on")
+    arg_parser.add_argument("--upstream-rate", type=float, default=0,
+                            help="upstream requests per second, 0 for no limit (default 0)")
+    replay_server.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    server = stand_in = None
+    if args.target:
+        get = http_client(args.target)
+    else:
+        api_url = args.api_url
+        if api_url is None:
+            stand_in = replay_server.stand_in_from(args)
+            server, api_url = replay_server.serve_in_thread(stand_in)
+        get = in_process_client(api_url, args.cache)
+        from src.scheduler import scheduler # pylint: disable=import-outside-toplevel
+        scheduler.configure(rate=args.upstream_rate)
+
+    print(f"{'route':<24} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} "
+          f"{'4xx':>5} {'5xx':>5}")
+    failing = []
+    try:
+        for name in args.routes:
+            report = drive(get, ROUTES[name], args.requests, args.concurrency)
+            print(f"{name:<24} {report['throughput']:>8.1f} {report['p50'] * 1000:>9.1f} "
+                  f"{report['p99'] * 1000:>9.1f} {report['mean'] * 1000:>9.1f} "
+                  f"{report['client_errors']:>5} {report['errors']:>5}")
+            if report["non_ok"]:
+                failing.append(name)
+    finally:
+        if server is not None:
+            server.close()
+            if args.record:
+                stand_in.save()
+    if failing:
+        # a route answering errors is fast for the wrong reason, so its timings mean nothing
+        print("routes with responses other than 200: " + ", ".join(failing))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
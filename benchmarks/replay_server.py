@@ -0,0 +1,283 @@
+""" A local stand-in for the MediaWiki API, for load testing without Wikipedia.
+Point WikiWatcher at it with WIKIWATCHER_API_URL=http://127.0.0.1:<port>/w/api.php.
+
+Answers come from a recording when one matches the request, and otherwise
+are made up: every article has a few thousand deterministic revisions and
+every user a few thousand contributions, served in pages chained by
+rvcontinue/uccontinue exactly as the real API chains them. The made-up data
+covers what WikiWatcher asks for: prop=revisions (by title or for a
+category's members), list=usercontribs, action=parse and
+action=compare.
+
+--record forwards every request to the real API (or --upstream) and saves
+its answer, so a later run with --recording can replay the same traffic.
+--latency, --jitter, --error-rate and --maxlag-rate slow answers down and
+inject 503s and maxlag errors, to see how the scheduler copes.
+
+usage: python benchmarks/replay_server.py [--port 8001] [--recording FILE [--record]]
+           [--latency S] [--jitter S] [--error-rate P] [--maxlag-rate P]
+"""
+import os
+import sys
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import upstream # pylint: disable=wrong-import-position
+from tests.stubserver import StubServer # pylint: disable=wrong-import-position
+
+REVISIONS_PER_ARTICLE = 3000
+CONTRIBS_PER_USER = 3000
+CATEGORY_SIZE = 120
+IGNORED_PARAMS = ("maxlag", "format", "formatversion", "utf8", "requestid")
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+SPACING = timedelta(hours=9)  # time between made-up revisions
+TAGS = ["mobile edit", "visualeditor", "wikieditor", "mw-reverted", "mw-undo"]
+
+
+def request_key(params: dict) -> str:
+    """ identifies a request by its parameters, ignoring order and the
+    parameters which do not change the answer """
+    return urlencode(sorted((key, value) for key, value in params.items()
+                            if key not in IGNORED_PARAMS))
+
+
+def stamp(moment: datetime) -> str:
+    """ formats a time the way the API does """
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def seed_of(name: str) -> int:
+    """ a stable number derived from a title or user name """
+    return zlib.crc32(name.encode("utf-8"))
+
+
+@lru_cache(maxsize=1024)
+def made_up_revisions(title: str, count: int = REVISIONS_PER_ARTICLE) -> list[dict]:
+    """ an article's revisions, oldest first; the same title always gets
+    the same revisions (the same list, in fact, so callers must not change it) """
+    seed = seed_of(title)
+    pageid = seed % 10000000
+    revisions = []
+    for i in range(count):
+        revid = pageid * 10000 + i + 1
+        mixed = seed_of(f"{title}/{i}")
+        revisions.append({
+            "revid": revid, "parentid": revid - 1 if i else 0,
+            "minor": mixed % 4 == 0, "user": f"Editor{mixed % 200}",
+            "userid": mixed % 200 + 1, "timestamp": stamp(EPOCH + SPACING * i),
+            "size": 20000 + mixed % 5000, "comment": ("copyedit", "rv", "add source")[mixed % 3],
+            "tags": [TAGS[mixed % len(TAGS)]] if mixed % 2 else []})
+    return revisions
+
+
+@lru_cache(maxsize=1024)
+def made_up_contribs(user: str, count: int = CONTRIBS_PER_USER) -> list[dict]:
+    """ a user's contributions, oldest first; shared like made_up_revisions """
+    seed = seed_of(user)
+    contribs = []
+    for i in range(count):
+        mixed = seed_of(f"{user}/{i}")
+        title = f"Article {mixed % 300}"
+        contribs.append({
+            "userid": seed % 100000, "user": user, "pageid": seed_of(title) % 10000000,
+            "revid": seed % 100000 * 100000 + i + 1, "parentid": seed % 100000 * 100000 + i,
+            "ns": 0, "title": title,
+            "timestamp": stamp(EPOCH + SPACING * i + timedelta(minutes=seed % 60)),
+            "minor": mixed % 4 == 0, "size": 1000 + mixed % 9000,
+            "comment": ("copyedit", "rv", "add source")[mixed % 3],
+            "tags": [TAGS[mixed % len(TAGS)]] if mixed % 2 else []})
+    return contribs
+
+
+def in_window(rows: list[dict], params: dict, prefix: str) -> list[dict]:
+    """ orders rows by rvdir/ucdir and keeps those between start and end """
+    newer = params.get(prefix + "dir") == "newer"
+    start, end = params.get(prefix + "start"), params.get(prefix + "end")
+    start = start and start.rstrip("Z")
+    end = end and end.rstrip("Z")
+    kept = []
+    for row in rows if newer else reversed(rows):
+        moment = row["timestamp"].rstrip("Z")
+        if newer and ((start and moment < start) or (end and moment > end)):
+            continue
+        if not newer and ((start and moment > start) or (end and moment < end)):
+            continue
+        kept.append(row)
+    tag = params.get(prefix + "tag")
+    if tag:
+        kept = [row for row in kept if tag in row["tags"]]
+    return kept
+
+
+def one_page(rows: list[dict], params: dict, prefix: str) -> tuple:
+    """ slices rows into the page asked for; returns (rows, continue dict or None) """
+    offset = int(params.get(prefix + "continue", 0))
+    limit = int(params.get(prefix + "limit", 10))
+    page = rows[offset:offset + limit]
+    if offset + limit < len(rows):
+        return page, {prefix + "continue": str(offset + limit), "continue": "-||"}
+    return page, None
+
+
+def made_up_answer(params: dict) -> dict:
+    """ answers a request from made-up data """
+    action = params.get("action", "query")
+    if action == "parse":
+        revid = params.get("oldid")
+        return {"parse": {"title": "Stand-in", "revid": int(revid or 0),
+                          "text": {"*": f"<div><p>Content of revision {revid}.</p></div>"}}}
+    if action == "compare":
+        return {"compare": {"fromrevid": params.get("fromrev"), "torevid": params.get("torev"),
+                            "*": f"<tr><td><ins>change {params.get('fromrev')}</ins></td></tr>"}}
+    if params.get("list") == "usercontribs":
+        users = params["ucuser"].split("|") if "ucuser" in params else \
+            [f"{params.get('ucuserprefix', 'Editor')}{i}" for i in range(3)]
+        rows = [row for user in users for row in made_up_contribs(user)]
+        rows.sort(key=lambda row: row["timestamp"])
+        page, more = one_page(in_window(rows, params, "uc"), params, "uc")
+        body = {"batchcomplete": True, "query": {"usercontribs": page}}
+        return body | ({"continue": more} if more else {})
+    if params.get("generator") == "categorymembers":
+        titles = [f"Article {i}" for i in range(CATEGORY_SIZE)]
+        page, more = one_page(titles, params, "gcm")
+        return {"query": {"pages": [latest_page(title) for title in page]}} | \
+            ({"continue": more} if more else {})
+    titles = params.get("titles", "").split("|")
+    if len(titles) > 1 or "rvlimit" not in params:
+        return {"batchcomplete": True, "query": {"pages": [latest_page(title) for title in titles]}}
+    title = titles[0]
+    page, more = one_page(in_window(made_up_revisions(title), params, "rv"), params, "rv")
+    body = {"batchcomplete": True, "query": {"pages": [
+        {"pageid": seed_of(title) % 10000000, "ns": 0, "title": title, "revisions": page}]}}
+    return body | ({"continue": more} if more else {})
+
+
+def latest_page(title: str) -> dict:
+    """ a page entry carrying only its latest revision, as multi-title queries return """
+    latest = made_up_revisions(title)[-1]
+    return {"pageid": seed_of(title) % 10000000, "ns": 0, "title": title,
+            "revisions": [{"revid": latest["revid"], "timestamp": latest["timestamp"]}]}
+
+
+class StandIn:
+    """ decides each answer: recorded, made up, delayed or failed """
+
+    def __init__(self, recording: str = None, record: bool = False, upstream_url: str = None,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 maxlag_rate: float = 0.0, seed: int = 0):
+        self.recording = recording
+        self.record = record
+        self.upstream_url = upstream_url or upstream.DEFAULT_URL
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.maxlag_rate = maxlag_rate
+        self.responses: dict = {}
+        self.served = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if recording and os.path.exists(recording):
+            with open(recording, "r", encoding="utf-8") as file:
+                self.responses = json.load(file)["responses"]
+
+    def answer(self, params: dict) -> dict:
+        """ the recorded answer to params, recording it first in record mode,
+        or else a made-up one """
+        key = request_key(params)
+        if key in self.responses:
+            return self.responses[key]
+        if not self.record:
+            return made_up_answer(params)
+        response = upstream.get_session().get(self.upstream_url, params=params,
+                                              timeout=upstream.TIMEOUT)
+        body = response.json()
+        with self._lock:
+            self.responses[key] = body
+        return body
+
+    def respond(self, params: dict) -> tuple:
+        """ returns (status, body, headers) for one request """
+        with self._lock:
+            self.served += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            roll = self._rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < self.error_rate:
+            return 503, {"error": {"code": "unavailable"}}, {"Retry-After": "0"}
+        if roll < self.error_rate + self.maxlag_rate:
+            return 200, {"error": {"code": "maxlag", "info": "Waiting for a database server",
+                                   "lag": 6}}, {"Retry-After": "0"}
+        return 200, self.answer(params), {}
+
+    def save(self):
+        """ writes everything recorded so far """
+        if self.recording:
+            with open(self.recording, "w", encoding="utf-8") as file:
+                json.dump({"responses": self.responses}, file)
+
+
+def serve_in_thread(stand_in: StandIn, port: int = 0) -> tuple:
+    """ starts answering every GET through stand_in from a background thread;
+    returns (server, api url), and server.close() stops it """
+    server = StubServer(stand_in.respond, port, keep_requests=False).start()
+    return server, server.url
+
+
+def add_arguments(arg_parser: argparse.ArgumentParser):
+    """ adds the stand-in's options to a command line parser """
+    arg_parser.add_argument("--recording", metavar="FILE",
+                            help="replay answers from FILE (and save to it with --record)")
+    arg_parser.add_argument("--record", action="store_true",
+                            help="forward unrecorded requests upstream and save the answers")
+    arg_parser.add_argument("--upstream", default=upstream.DEFAULT_URL,
+                            help="API to record from (default Wikipedia)")
+    arg_parser.add_argument("--latency", type=float, default=0.0,
+                            help="seconds added to every answer (default 0)")
+    arg_parser.add_argument("--jitter", type=float, default=0.0,
+                            help="latency varies by up to this many seconds either way")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0,
+                            help="fraction of requests answered with a 503")
+    arg_parser.add_argument("--maxlag-rate", type=float, default=0.0,
+                            help="fraction of requests answered with a maxlag error")
+
+
+def stand_in_from(args) -> StandIn:
+    """ builds a StandIn from parsed add_arguments options """
+    return StandIn(recording=args.recording, record=args.record, upstream_url=args.upstream,
+                   latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   maxlag_rate=args.maxlag_rate)
+
+
+def main():
+    """ serves until interrupted, then saves any recording """
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--port", type=int, default=8001, help="port (default 8001)")
+    add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    stand_in = stand_in_from(args)
+    server = StubServer(stand_in.respond, args.port, keep_requests=False)
+    print(f"WIKIWATCHER_API_URL={server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        if args.record:
+            stand_in.save()
+            print(f"saved {len(stand_in.responses)} responses to {args.recording}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+""" Measures cold-start import time of app.py and of each module in src/.
+Every import runs in a fresh interpreter, so nothing is already cached in
+sys.modules. Also reports which heavy third-party packages each import
+drags in, which should only be numpy for everything outside the charting
+modules.
+
+usage: python benchmarks/startup.py [--runs N]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MODULES = ["app", "src.upstream", "src.cache", "src.exceptions", "src.revision",
+           "src.revisiontable", "src.filters", "src.history", "src.articlehistory",
+           "src.userhistory", "src.render", "src.plot", "src.histogram", "src.pie"]
+HEAVY_PACKAGES = ["matplotlib", "numpy", "mwparserfromhell", "markdown", "dateutil", "flask"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed,
+                  "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def time_cold_import(module: str) -> dict:
+    """ imports module in a new interpreter and returns its timing report """
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    """ prints the median cold import time of every module """
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--runs", type=int, default=5,
+                            help="fresh interpreters per module (default 5)")
+    args = arg_parser.parse_args()
+    print(f"{'module':<20} {'median ms':>10} {'min ms':>8}  heavy packages loaded")
+    for module in MODULES:
+        reports = [time_cold_import(module) for _ in range(args.runs)]
+        seconds = [report["seconds"] for report in reports]
+        print(f"{module:<20} {statistics.median(seconds) * 1000:>10.1f} "
+              f"{min(seconds) * 1000:>8.1f}  {', '.join(reports[0]['heavy'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,116 @@
 """defines the collection class for article history"""
 try:
-    from src.revision import Revision, URL
+    from src import upstream
+    from src.revision import Revision
+    from src.revisiontable import RevisionTable
+    from src.filters import TagPredicate
     from src.history import History
     from src.exceptions import NoRevisionsException, BadRequestException
 except ModuleNotFoundError:
-    from revision import Revision, URL
+    import upstream
+    from revision import Revision
+    from revisiontable import RevisionTable
+    from filters import TagPredicate
     from history import History
     from exceptions import NoRevisionsException, BadRequestException
-import requests
+
+REVISION_PROPS = "comment|ids|flags|size|tags|timestamp|user|userid"
+
 class ArticleHistory(History):
     """article revision collection class"""
+    limit_param = "rvlimit"
+    continue_param = "rvcontinue"
+    fetched_attributes = History.fetched_attributes + ("pageid",)
 
     def __init__(self, titles, user=None, keyword=None, tags=None,
                  startyear=None, startmonth=None, startday=None,
                  starthour=None, startminute=None, startsecond=None,
                  endyear=None, endmonth=None, endday=None, endhour=None,
-                 endminute=None, endsecond=None):
+                 endminute=None, endsecond=None, minor=None, min_size=None,
+                 max_size=None, comment=None, newest_first=False, fetch=True):
         super().init_to_none()
         self.init_to_none()
         super().__init__(titles, user, keyword, tags,
                          startyear, startmonth, startday,
                          starthour, startminute, startsecond,
                          endyear, endmonth, endday,
-                         endhour, endminute, endsecond)
-        self.fill_revisions()
+                         endhour, endminute, endsecond,
+                         minor, min_size, max_size, comment, newest_first)
+        if fetch:
+            self.fill_revisions()
 
     def init_to_none(self):
         """sets up class data members and initalizes to none"""
         self.pageid: int = None
 
-    def call_wikipedia_api(self):
-        """pulls down an article's revision history from the API"""
-        session = requests.Session()
+    def push_down(self, predicate):
+        """ prop=revisions can filter by a single tag (rvtag) """
+        if isinstance(predicate, TagPredicate):
+            tag, residual = predicate.split()
+            if tag is not None:
+                return {"rvtag": tag}, residual
+        return None, predicate
 
+    @staticmethod
+    def revision_at(titles, timestamp=None, direction="older"):
+        """returns the one revision of an article nearest to a timestamp:
+        the last made at or before it (direction "older") or the first made
+        at or after it ("newer"). without a timestamp, the newest or oldest
+        revision. costs a single API request for a single revision"""
+        if titles is None:
+            raise BadRequestException("Title Missing")
+        if direction not in ("older", "newer"):
+            raise BadRequestException("direction must be older or newer")
         params = {
+            "action": "query",
+            "format": "json",
+            "formatversion": "2",
+            "prop": "revisions",
+            "titles": titles,
+            "rvprop": REVISION_PROPS,
+            "rvstart": timestamp,
+            "rvdir": direction,
+            "rvlimit": "1"
+        }
+        data = upstream.get(params)
+        try:
+            page = data["query"]["pages"][0]
+            revision = page["revisions"][0]
+        except (KeyError, IndexError) as lookup_err:
+            raise NoRevisionsException("No revisions matching filter parameters") \
+                from lookup_err
+        revision["pageid"] = page.get("pageid")
+        revision["title"] = page.get("title", titles)
+        return Revision(revision)
+
+    def revision_params(self):
+        """parameters requesting an article's revision history from the API"""
+        if self.titles is None:
+            raise BadRequestException("Title Missing")
+        return {
             "prop": "revisions",
             "titles": self.titles,
-            "rvprop": "comment|ids|flags|size|tags|timestamp|user|userid",
+            "rvprop": REVISION_PROPS,
             "rvuser": self.user,
-            "rvstart": self.rvstart, # pylint: disable=access-member-before-definition
-            "rvend": self.rvend,
-            "rvdir": "newer",
             "rvlimit": "500"
-        } | self.base_params
-        if self.titles is None:
-            raise BadRequestException("Title Missing")
-
-        rev = session.get(url=URL, params=params)
-        data = rev.json()
+        } | dict(zip(("rvstart", "rvend", "rvdir"), self.direction_params())) \
+          | self.base_params | self.plan_query()[0]
 
+    def batch_from_page(self, data):
+        """reads one page of an article's revision history"""
         try:
             pages = data["query"]["pages"]
-            self.json = pages[0]
+            revisions = pages[0]["revisions"]
+            self.json = {key: value for key, value in pages[0].items()
+                         if key != "revisions"}
             self.pageid = self.json["pageid"]
-            for each_revision in self.json["revisions"]:
+            for each_revision in revisions:
                 each_revision["pageid"] = self.pageid
-                each_revision["title"] = self.titles
-                self.revisions.append(Revision(each_revision))
-            if not data.get("continue") is None:
-                wp_continue_timestamp_and_id = data["continue"]["rvcontinue"]
-                separator_index = wp_continue_timestamp_and_id.index("|")
-                self.rvstart = wp_continue_timestamp_and_id[:separator_index]
-                self.call_wikipedia_api()
+                each_revision["title"] = self.json.get("title", self.titles)
+            return RevisionTable.from_json(revisions)
         except KeyError:
             print("Error accessing API with given parameters")
+            return None
 
 if __name__ == "__main__":
     art = ArticleHistory(titles="fdjaklfgd;jsa")
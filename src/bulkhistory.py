@@ -0,0 +1,153 @@
+"""defines the collection class for the histories of many articles at once
+The API only returns a page's full revision history one page per request,
+but it returns the latest revision of up to 50 pages per request, and can
+list a category's members in the same request. A bulk history first learns
+the latest revision of every article that way, then fetches full histories
+only for the articles edited since the start of the requested period.
+For watch jobs over thousands of mostly unchanged articles, that replaces
+one request per article with one request per 50 articles.
+Without a start date every article needs its full history fetched, so such
+bulk histories may only cover BULK_MAX_UNDATED_PAGES articles.
+"""
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from src.scheduler import in_lane, BULK
+    from src.metrics import carry
+    from src.history import History
+    from src.articlehistory import ArticleHistory
+    from src.exceptions import NoRevisionsException, BadRequestException
+except ModuleNotFoundError:
+    from scheduler import in_lane, BULK
+    from metrics import carry
+    from history import History
+    from articlehistory import ArticleHistory
+    from exceptions import NoRevisionsException, BadRequestException
+
+TITLES_PER_REQUEST = 50  # most pages the API accepts per request
+BULK_MAX_PAGES = 5000    # most articles one bulk history may cover
+BULK_MAX_UNDATED_PAGES = TITLES_PER_REQUEST  # most articles covered without a start date
+BULK_MAX_IN_FLIGHT = 8   # concurrent full-history fetches
+
+
+class BulkArticleHistory:
+    """revision histories of many articles, given as a list of titles
+    or as the members of a category
+    takes the same filters as ArticleHistory, which are applied to every article"""
+
+    def __init__(self, titles=None, category=None, fetch=True, **filters):
+        self.init_to_none()
+        if (titles is None) == (category is None):
+            raise BadRequestException("give either a list of titles or a category")
+        if isinstance(titles, str):
+            titles = titles.split("|")
+        self.titles = [title for title in titles if title] if titles is not None else None
+        self.category = category
+        self.template = ArticleHistory(titles=None, fetch=False, **filters)
+        self.filters = filters
+        if self.titles is not None:
+            self.check_page_count(len(self.titles))
+        if fetch:
+            self.fill_histories()
+
+    def init_to_none(self):
+        """sets up class data members and initializes them to None"""
+        self.titles: list[str] = None
+        self.category: str = None
+        self.template: ArticleHistory = None
+        self.filters: dict = None
+        self.pages: dict[str, dict] = None
+        self.histories: dict[str, ArticleHistory] = None
+
+    def check_page_count(self, count: int):
+        """raises BadRequestException if count articles are more than this
+        bulk history may cover: BULK_MAX_PAGES, or BULK_MAX_UNDATED_PAGES
+        without a start date, since then none can be skipped"""
+        if self.template.rvstart is None and count > BULK_MAX_UNDATED_PAGES:
+            raise BadRequestException("give a starting date/time to cover more than "
+                                      f"{BULK_MAX_UNDATED_PAGES} articles")
+        if count > BULK_MAX_PAGES:
+            raise BadRequestException(f"at most {BULK_MAX_PAGES} articles may be covered")
+
+    def base_params(self) -> dict:
+        """parameters asking for the latest revision of each page"""
+        return {
+            "action": "query",
+            "format": "json",
+            "formatversion": "2",
+            "prop": "revisions",
+            "rvprop": "ids|timestamp",
+        }
+
+    def iter_page_batches(self):
+        """yields the pages of each API response, up to TITLES_PER_REQUEST at a time,
+        each carrying its latest revision (or marked missing)"""
+        if self.titles is not None:
+            for i in range(0, len(self.titles), TITLES_PER_REQUEST):
+                params = self.base_params() | \
+                    {"titles": "|".join(self.titles[i:i + TITLES_PER_REQUEST])}
+                for data in History.paginate(params):
+                    yield data.get("query", {}).get("pages", [])
+            return
+        category = self.category
+        if not category.lower().startswith("category:"):
+            category = "Category:" + category
+        params = self.base_params() | {
+            "generator": "categorymembers",
+            "gcmtitle": category,
+            "gcmlimit": str(TITLES_PER_REQUEST),
+        }
+        for data in History.paginate(params):
+            yield data.get("query", {}).get("pages", [])
+
+    def find_pages(self) -> dict:
+        """returns a dict of title to page info, including the latest revision
+        a page split across two responses keeps whichever part has revisions"""
+        pages = {}
+        for batch in self.iter_page_batches():
+            for page in batch:
+                title = page.get("title")
+                if title is not None and (page.get("revisions") or title not in pages):
+                    pages[title] = page
+            self.check_page_count(len(pages))
+        return pages
+
+    def may_have_revisions(self, page: dict) -> bool:
+        """whether a page could hold revisions in the requested period:
+        it exists and was last edited no earlier than the period's start"""
+        if page.get("missing") or not page.get("revisions"):
+            return False
+        start = self.template.rvstart
+        return start is None or page["revisions"][0]["timestamp"].rstrip("Z") >= start
+
+    def fetch_history(self, title: str):
+        """fetches one article's filtered history, or None if nothing matches"""
+        try:
+            with in_lane(BULK):
+                return ArticleHistory(titles=title, **self.filters)
+        except NoRevisionsException:
+            return None
+
+    def fill_histories(self):
+        """finds every article's latest revision, then fetches the full
+        histories of the articles which may have changed, several at once
+        all of it waits in the scheduler's BULK lane, behind interactive requests"""
+        with in_lane(BULK):
+            self.pages = self.find_pages()
+        changed = [title for title, page in self.pages.items() if self.may_have_revisions(page)]
+        with ThreadPoolExecutor(max_workers=BULK_MAX_IN_FLIGHT) as pool:
+            histories = pool.map(carry(self.fetch_history), changed)
+        self.histories = {title: history for title, history in zip(changed, histories)
+                          if history is not None}
+
+    def as_json(self) -> dict:
+        """returns one entry per article, with its matching revisions
+        (empty for articles not edited in the requested period)"""
+        entries = []
+        for title, page in self.pages.items():
+            entry = {"title": title, "pageid": page.get("pageid")}
+            if page.get("missing") or page.get("invalid"):
+                entry["missing"] = True
+            history = self.histories.get(title)
+            entry["revisions"] = list(history.revisions.iter_json()) if history else []
+            entries.append(entry)
+        return {"pages": entries}
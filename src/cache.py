@@ -0,0 +1,175 @@
+""" Caches for data that never changes once Wikipedia has produced it.
+A revision's content and its diff against another revision are immutable,
+so they are kept indefinitely: first in a byte-bounded in-memory LRU,
+then in an on-disk store which survives restarts and is shared between
+worker processes on the same host.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+try:
+    from src import metrics
+except ModuleNotFoundError:
+    import metrics
+
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+CACHE_DIR = os.environ.get("WIKIWATCHER_CACHE_DIR",
+                           os.path.join(tempfile.gettempdir(), "wikiwatcher-cache"))
+
+
+def size_of(value) -> int:
+    """ number of bytes a cached str or bytes value occupies """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(value)
+
+
+class LRUCache:
+    """ thread-safe least-recently-used cache which evicts by total byte size
+    rather than by number of entries """
+
+    def __init__(self, max_bytes: int = MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ returns the cached value for key, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        """ stores value under key, evicting the oldest entries as needed
+        values larger than the whole cache are not stored """
+        size = size_of(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def clear(self):
+        """ empties the cache """
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskStore:
+    """ stores one file per key under a directory
+    writes go through a temporary file so readers never see partial values """
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+
+    def path_for(self, key: str) -> str:
+        """ maps a cache key onto a file path """
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key: str):
+        """ returns the stored str for key, or None """
+        try:
+            with open(self.path_for(key), "r", encoding="utf-8") as in_file:
+                return in_file.read()
+        except OSError:
+            return None
+
+    def set(self, key: str, value: str):
+        """ writes value to disk; failures leave the cache cold but are not fatal """
+        path = self.path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False,
+                                             dir=os.path.dirname(path)) as out_file:
+                out_file.write(value)
+            os.replace(out_file.name, path)
+        except OSError:
+            print("Could not write cache entry to " + path)
+
+
+class CacheStats:
+    """ thread-safe hit and miss counters for a cache
+    a named cache also counts its lookups in the current request's metrics """
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        """ counts one lookup """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if self.name is not None:
+            metrics.record_cache(self.name, hit)
+
+    def as_dict(self) -> dict:
+        """ returns the counters and the resulting hit ratio """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else None}
+
+
+class TieredCache:
+    """ in-memory LRU in front of a DiskStore """
+
+    def __init__(self, memory: LRUCache, disk: DiskStore = None, name: str = None):
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats(name)
+
+    def get(self, key: str):
+        """ checks memory, then disk (promoting disk hits into memory) """
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        self.stats.record(value is not None)
+        return value
+
+    def set(self, key: str, value: str):
+        """ stores value in both tiers """
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+
+def content_key(revid: int) -> str:
+    """ cache key for the rendered content of a revision """
+    return f"content:{revid}"
+
+
+def wikitext_key(revid: int) -> str:
+    """ cache key for the raw wikitext of a revision """
+    return f"wikitext:{revid}"
+
+
+def diff_key(fromrev: int, torev: int) -> str:
+    """ cache key for the diff between two revisions """
+    return f"diff:{fromrev}:{torev}"
+
+
+revision_cache = TieredCache(LRUCache(), DiskStore() if CACHE_DIR else None, name="revision")
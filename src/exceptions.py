@@ -9,3 +9,13 @@ class NoRevisionsException(Exception):
     """ to be raised throughout codebase
     upon discovery of no revisions fitting request's filters
     """
+
+class RenderUnavailableException(Exception):
+    """ to be raised when a chart cannot be rendered right now,
+    because the rendering queue is full or the render timed out
+    """
+
+class UpstreamUnavailableException(Exception):
+    """ to be raised when the MediaWiki API is still failing, throttling us
+    or lagging after every retry, so there is no answer to give
+    """
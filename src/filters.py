@@ -0,0 +1,241 @@
+""" Predicates for filtering a RevisionTable and the pipeline which applies them.
+Each predicate returns a boolean mask over the rows of a table. Cheap
+predicates work on whole columns at once; expensive ones (such as the
+keyword search, which fetches a diff per revision) declare a higher cost
+and only see the rows which survived everything cheaper.
+"""
+import re
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+try:
+    from src.revision import fetch_wikitext
+    from src.revisiontable import RevisionTable, MISSING
+    from src.scheduler import in_lane, BULK
+    from src.metrics import timed, carry
+except ModuleNotFoundError:
+    from revision import fetch_wikitext
+    from revisiontable import RevisionTable, MISSING
+    from scheduler import in_lane, BULK
+    from metrics import timed, carry
+
+KEYWORD_MAX_IN_FLIGHT = 8 # concurrent diff requests per keyword filter
+
+LOCAL = 0       # vectorised over columns
+PER_ROW = 1     # Python work per row, no I/O
+NETWORK = 100   # an upstream request per row
+
+
+def normalize_title(title: str) -> str:
+    """ applies MediaWiki's default title normalization: underscores become
+    spaces and the first letter is capitalized """
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+class Predicate:
+    """ base class for a test applied to every row of a RevisionTable """
+    cost = LOCAL
+
+    @abstractmethod
+    def mask(self, table: RevisionTable) -> np.ndarray:
+        """ returns a boolean array, True for rows which pass """
+
+
+class TagPredicate(Predicate):
+    """ keeps revisions carrying every one of the given tags """
+    def __init__(self, tags):
+        self.tags = frozenset(tags)
+
+    def mask(self, table):
+        return table.tag_mask(self.tags)
+
+    def split(self):
+        """ picks one tag for the API to filter by (it accepts only one)
+        returns a tuple of (tag or None, predicate for the remaining tags or None) """
+        pushable = sorted(tag for tag in self.tags if tag)
+        if not pushable:
+            return None, self
+        remaining = self.tags - {pushable[0]}
+        return pushable[0], TagPredicate(remaining) if remaining else None
+
+
+class StringPredicate(Predicate):
+    """ keeps revisions whose interned string column equals a value """
+    column = None
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def mask(self, table):
+        code = table.pools[self.column].codes.get(self.value, MISSING)
+        if code == MISSING:
+            return np.zeros(len(table), dtype=bool)
+        return table.column(self.column) == code
+
+
+class TitlePredicate(StringPredicate):
+    """ keeps revisions made to the given article """
+    column = "title"
+
+    def __init__(self, value: str):
+        super().__init__(normalize_title(value))
+
+
+class SizeRangePredicate(Predicate):
+    """ keeps revisions whose resulting page size (in bytes) lies within
+    [min_size, max_size]; either bound may be None """
+    def __init__(self, min_size: int = None, max_size: int = None):
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def mask(self, table):
+        sizes = table.column("size")
+        mask = sizes != MISSING
+        if self.min_size is not None:
+            mask &= sizes >= self.min_size
+        if self.max_size is not None:
+            mask &= sizes <= self.max_size
+        return mask
+
+
+class MinorPredicate(Predicate):
+    """ keeps only minor edits (minor=True) or only major edits (minor=False) """
+    def __init__(self, minor: bool):
+        self.minor = minor
+
+    def mask(self, table):
+        return table.column("minor") == self.minor
+
+
+class CommentPredicate(Predicate):
+    """ keeps revisions whose edit summary matches a regular expression """
+    cost = PER_ROW
+
+    def __init__(self, pattern: str):
+        self.pattern = re.compile(pattern)
+
+    def mask(self, table):
+        return np.fromiter((comment is not None and self.pattern.search(comment) is not None
+                            for comment in table.column("comment")),
+                           dtype=bool, count=len(table))
+
+
+class KeywordPredicate(Predicate):
+    """ keeps revisions whose diff contains a keyword
+    a diff is made of lines of the revision and of its parent, so revisions
+    where neither page text contains the keyword are ruled out first, from
+    wikitext fetched CONTENT_BATCH_SIZE revisions per request. diffs are then
+    fetched for the rest in parallel, with at most max_in_flight requests
+    outstanding at once. all of it goes through the scheduler's BULK lane """
+    cost = NETWORK
+
+    def __init__(self, keyword: str, max_in_flight: int = KEYWORD_MAX_IN_FLIGHT):
+        self.keyword = keyword
+        self.max_in_flight = max_in_flight
+
+    def candidates(self, table: RevisionTable) -> np.ndarray:
+        """ returns a boolean mask, False for rows whose wikitext and whose
+        parent's wikitext both lack the keyword. page creations (which have
+        no parent to compare with) and rows whose text is hidden stay True """
+        revids, parentids = table.column("revid"), table.column("parentid")
+        screened = np.flatnonzero((revids != MISSING) & (parentids > 0))
+        mask = np.ones(len(table), dtype=bool)
+        if len(screened) < 2:
+            return mask
+        with in_lane(BULK):
+            texts = fetch_wikitext(sorted(set(revids[screened].tolist()) |
+                                          set(parentids[screened].tolist())))
+        for position in screened.tolist():
+            text, parent_text = texts.get(int(revids[position])), \
+                texts.get(int(parentids[position]))
+            if text is not None and parent_text is not None and \
+                    self.keyword not in text and self.keyword not in parent_text:
+                mask[position] = False
+        return mask
+
+    def matches(self, rev) -> bool:
+        """ checks one revision's diff, yielding to interactive requests """
+        with in_lane(BULK):
+            return rev.contains_keyword(self.keyword)
+
+    def mask(self, table):
+        mask = self.candidates(table)
+        candidates = table.select(mask)
+        if self.max_in_flight <= 1 or len(candidates) <= 1:
+            matches = [self.matches(rev) for rev in candidates]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+                matches = list(pool.map(carry(self.matches), candidates))
+        mask[mask] = np.array(matches, dtype=bool)
+        return mask
+
+
+class FilterPipeline:
+    """ applies a set of predicates to a RevisionTable
+    all LOCAL predicates are combined into a single mask and applied in one
+    selection; costlier predicates then run in order of cost, each on the
+    rows that are still left """
+
+    def __init__(self, predicates: list[Predicate] = None):
+        self.predicates = sorted(predicates or [], key=lambda predicate: predicate.cost)
+
+    def add(self, predicate: Predicate):
+        """ adds a predicate, keeping the pipeline ordered by cost """
+        self.predicates.append(predicate)
+        self.predicates.sort(key=lambda predicate: predicate.cost)
+
+    def apply(self, table: RevisionTable) -> RevisionTable:
+        """ returns a new table holding only the rows passing every predicate """
+        return self.narrow(table)[0]
+
+    def first(self, table: RevisionTable, count: int) -> tuple:
+        """ returns a tuple of (positions in table of the first count rows
+        passing every predicate, how many rows from the start of table they
+        account for). LOCAL predicates see the whole table; costlier ones see
+        what is left in chunks of count rows, and stop once count have passed,
+        so a short page does not fetch a diff for every row of a long one """
+        cheap = [predicate for predicate in self.predicates if predicate.cost == LOCAL]
+        costly = [predicate for predicate in self.predicates if predicate.cost != LOCAL]
+        with timed("filter"):
+            candidates = self._narrow(table, cheap)[1]
+            if costly:
+                passed = []
+                for start in range(0, len(candidates), count):
+                    chunk = candidates[start:start + count]
+                    passed.extend(chunk[self._narrow(table.select(chunk), costly)[1]])
+                    if len(passed) >= count:
+                        break
+                candidates = np.array(passed, dtype=int)
+        if len(candidates) < count:
+            return candidates, len(table)
+        return candidates[:count], int(candidates[count - 1]) + 1
+
+    def narrow(self, table: RevisionTable) -> tuple:
+        """ returns a tuple of (table of the rows passing every predicate,
+        their positions in the original table) """
+        with timed("filter"):
+            return self._narrow(table)
+
+    def _narrow(self, table: RevisionTable, predicates: list[Predicate] = None) -> tuple:
+        """ narrow(), untimed, applying predicates (in cost order) if given
+        instead of the whole pipeline """
+        predicates = self.predicates if predicates is None else predicates
+        positions = np.arange(len(table))
+        cheap = [predicate for predicate in predicates if predicate.cost == LOCAL]
+        if cheap:
+            mask = np.ones(len(table), dtype=bool)
+            for predicate in cheap:
+                mask &= predicate.mask(table)
+            table = table.select(mask)
+            positions = positions[mask]
+        for predicate in predicates:
+            if predicate.cost == LOCAL or len(table) == 0:
+                continue
+            mask = predicate.mask(table)
+            table = table.select(mask)
+            positions = positions[mask]
+        return table, positions
+
+    def __len__(self):
+        return len(self.predicates)
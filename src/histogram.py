@@ -1,63 +1,126 @@
-""" temporary to calm pylint down - should be filled in by author """
-import matplotlib.pyplot as plt
+""" Histogram of revisions over time """
 import matplotlib.dates as mdates
+from matplotlib.figure import Figure
 import numpy as np
-from datetime import datetime
-from dateutil import parser
 try:
     from src.articlehistory import ArticleHistory
+    from src.exceptions import BadRequestException
     from src.plot import Plot
 except ModuleNotFoundError:
     from articlehistory import ArticleHistory
+    from exceptions import BadRequestException
     from plot import Plot
 
+GRANULARITIES = ("hour", "day", "week", "month", "auto")
+MAX_AUTO_BINS = 200 # "auto" picks the finest granularity giving at most this many bins
+WEEK_OFFSET_DAYS = 3 # 1970-01-01 was a Thursday; shifting by 3 days starts weeks on Monday
+
 class Histogram(Plot):
-    """ temporary to calm pylint down - should be filled in by author """
-    def __init__(self, history):
+    """ histogram of the number of revisions in a history per unit of time
+    timestamps are binned with numpy and the chart is drawn from the counts """
+    def __init__(self, history, granularity: str = "auto"):
         super().__init__(history)
+        if granularity not in GRANULARITIES:
+            raise BadRequestException("granularity must be one of " + ", ".join(GRANULARITIES))
+        self.granularity = granularity
         self.num_bins = None
+        self.counts = None
+        self.timestamps = self.history.revisions.column("timestamp")
+        self.timestamps = self.timestamps[~np.isnat(self.timestamps)]
         self.y_axis_label = "Number of edits"
         self.x_axis_label = "Date"
         self.title = "Number of Edits per Date"
         self.x_axis = self.get_x_axis_data()
 
     def get_x_axis_data(self, revision_property: str = "timestamp"):
-        """pulls the datetime from each history object
-        turns the datetime into a format useable by matplotlib
-        then puts it into a numpy array"""
-        timestamp_list = super().get_x_axis_data(revision_property)
-        new_datetime = []
-        for each_timestamp in timestamp_list:
-            new_datetime.append(mdates.date2num(parser.isoparse(each_timestamp)))
-        return np.array(new_datetime)
+        """pulls the timestamp column straight from the history's revision table
+        and turns it into a numpy array of matplotlib date numbers"""
+        return mdates.date2num(self.history.revisions.column(revision_property))
+
+    def resolve_granularity(self) -> str:
+        """ returns the requested granularity, or for "auto" the finest one
+        which keeps the number of bins under MAX_AUTO_BINS """
+        if self.granularity != "auto":
+            return self.granularity
+        span = self.timestamps.max() - self.timestamps.min()
+        for granularity, unit in (("hour", "h"), ("day", "D"), ("week", "W")):
+            if span // np.timedelta64(1, unit) < MAX_AUTO_BINS:
+                return granularity
+        return "month"
+
+    def bin_indices(self, granularity: str) -> np.ndarray:
+        """ maps each timestamp onto an integer bin number """
+        match granularity:
+            case "hour":
+                return self.timestamps.astype("datetime64[h]").astype(np.int64)
+            case "day":
+                return self.timestamps.astype("datetime64[D]").astype(np.int64)
+            case "week":
+                days = self.timestamps.astype("datetime64[D]").astype(np.int64)
+                return (days + WEEK_OFFSET_DAYS) // 7
+            case _:
+                return self.timestamps.astype("datetime64[M]").astype(np.int64)
+
+    @staticmethod
+    def bin_edges(granularity: str, first: int, last: int) -> np.ndarray:
+        """ returns the datetime64 edges of bins first through last inclusive """
+        indices = np.arange(first, last + 2)
+        match granularity:
+            case "hour":
+                return indices.astype("datetime64[h]")
+            case "day":
+                return indices.astype("datetime64[D]")
+            case "week":
+                return (indices * 7 - WEEK_OFFSET_DAYS).astype("datetime64[D]")
+            case _:
+                return indices.astype("datetime64[M]")
 
     def set_num_bins(self):
-        """sets the number of bins - approximately one bin per day"""
-        bin_width = 1
-        minimum = np.min(self.x_axis)
-        maximum = np.max(self.x_axis)
-        bound_min = -1.0 * (minimum % bin_width - minimum)
-        bound_max = maximum - maximum % bin_width + bin_width
-        num = int((bound_max - bound_min) / bin_width) + 1
-        self.num_bins = np.linspace(bound_min, bound_max, num)
+        """counts revisions per bin in one np.bincount call
+        sets num_bins to the bin edges (as matplotlib date numbers) and counts
+        to the number of revisions in each bin"""
+        granularity = self.resolve_granularity()
+        indices = self.bin_indices(granularity)
+        first = indices.min()
+        self.counts = np.bincount(indices - first)
+        edges = self.bin_edges(granularity, first, indices.max())
+        self.num_bins = mdates.date2num(edges.astype("datetime64[s]"))
+        self.title = f"Number of Edits per {granularity.capitalize()}"
 
-    def get_graph(self):
-        """graphs the histogram using matplot lib"""
-        fig, axe = plt.subplots(layout="constrained")
+    def render_data(self) -> dict:
+        """ returns the pre-binned data needed to draw this histogram """
         self.set_num_bins()
-        axe.hist(self.x_axis, bins=self.num_bins, color="lightblue",
-                edgecolor="black", range=(self.x_axis[0], self.x_axis[len(self.x_axis)-1]))
-        locator = mdates.AutoDateLocator()
-        axe.xaxis.set_major_locator(locator)
-        axe.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+        return {
+            "edges": self.num_bins,
+            "counts": self.counts,
+            "x_axis_label": self.x_axis_label,
+            "y_axis_label": self.y_axis_label,
+            "title": self.title,
+        }
+
+    def drawing_function(self):
+        """ the module-level function which turns render_data() into a Figure """
+        return draw_histogram
+
+    def get_graph(self) -> Figure:
+        """graphs the histogram using matplot lib"""
+        return draw_histogram(self.render_data())
 
-        plt.xticks(rotation=45)
-        plt.ylabel(self.y_axis_label)
-        plt.xlabel(self.x_axis_label)
-        plt.title(self.title)
-        plt.rcParams['figure.constrained_layout.use'] = True
-        #plt.show()
-        return fig
+def draw_histogram(data: dict) -> Figure:
+    """ draws a histogram from Histogram.render_data() output
+    needs no History, so it can run in a separate rendering process """
+    fig = Figure(layout="constrained")
+    axe = fig.add_subplot()
+    axe.stairs(data["counts"], data["edges"], fill=True,
+               facecolor="lightblue", edgecolor="black")
+    locator = mdates.AutoDateLocator()
+    axe.xaxis.set_major_locator(locator)
+    axe.xaxis.set_major_formatter(mdates.AutoDateFormatter(locator))
+    axe.tick_params(axis="x", labelrotation=45)
+    axe.set_ylabel(data["y_axis_label"])
+    axe.set_xlabel(data["x_axis_label"])
+    axe.set_title(data["title"])
+    return fig
 
 if __name__=="__main__":
     article = ArticleHistory(titles="Cat", startyear=2021, startmonth=2,
@@ -1,45 +1,69 @@
 """contains history base class attributes and timestamp modification"""
 
+import re
 import json
 from datetime import datetime
 from abc import abstractmethod
 try:
-    from src.revision import Revision
+    from src.revision import fetch_wikitext
+    from src.revisiontable import RevisionTable
+    from src.filters import (FilterPipeline, TagPredicate, MinorPredicate,
+                             SizeRangePredicate, CommentPredicate, KeywordPredicate,
+                             KEYWORD_MAX_IN_FLIGHT, normalize_title)
     from src.exceptions import BadRequestException, NoRevisionsException
+    from src.singleflight import history_flights
+    from src.pagination import PaginationMixin
 except ModuleNotFoundError:
-    from revision import Revision
+    from revision import fetch_wikitext
+    from revisiontable import RevisionTable
+    from filters import (FilterPipeline, TagPredicate, MinorPredicate,
+                         SizeRangePredicate, CommentPredicate, KeywordPredicate,
+                         KEYWORD_MAX_IN_FLIGHT, normalize_title)
     from exceptions import BadRequestException, NoRevisionsException
+    from singleflight import history_flights
+    from pagination import PaginationMixin
 
-class History:
+
+def make_timestamp(year=None, month=None, day=None, hour=None, minute=None,
+                   second=None) -> str:
+    """ builds an ISO 8601 timestamp from date/time parts, each unspecified
+    part taking its earliest value; returns None if no part is given """
+    if not (year or month or day or hour or minute or second):
+        return None
+    try:
+        return datetime(year=year, month=month or 1, day=day or 1, hour=hour or 0,
+                        minute=minute or 0, second=second or 0).isoformat()
+    except (ValueError, TypeError) as val_err:
+        raise BadRequestException("invalid date/time specification") from val_err
+
+
+class History(PaginationMixin):
     """history base class initalization"""
+    limit_param: str = None # API parameter setting the number of revisions per page
+    continue_param: str = None # API parameter carrying the listing's continuation token
+    fetched_attributes = ("_revisions", "json") # set by fill_revisions
 
     def __init__(self, titles=None, user=None, keyword=None, tags=None,
                  start_year=None, start_month=None, start_day=None, start_hour=None,
                  start_minute=None, start_second=None, end_year=None, end_month=None,
-                 end_day=None, end_hour=None, end_minute=None, end_second=None):
+                 end_day=None, end_hour=None, end_minute=None, end_second=None,
+                 minor=None, min_size=None, max_size=None, comment=None,
+                 newest_first=False):
         self.init_to_none()
         self.titles = titles
         self.user = user
         self.keyword = keyword
         self.tags = tags
-        start_timestamp_is_specified = start_year or start_month or start_day \
-                                    or start_hour or start_minute or start_second
-        end_timestamp_is_specified = end_year or end_month or end_day \
-                                  or end_hour or end_minute or end_second
-        try:
-            if start_timestamp_is_specified:
-                self.rvstart = datetime(year=start_year, month=start_month or 1,
-                                        day=start_day or 1, hour=start_hour or 0,
-                                        minute=start_minute or 0, second = start_second or 0
-                                        ).isoformat()
-                self.init_rvstart_for_charts = self.rvstart
-            if end_timestamp_is_specified:
-                self.rvend = datetime(year=end_year, month=end_month or 1,
-                                        day=end_day or 1, hour=end_hour or 0,
-                                        minute=end_minute or 0, second = end_second or 0
-                                        ).isoformat()
-        except (ValueError, TypeError) as val_err:
-            raise BadRequestException("invalid date/time specification") from val_err
+        self.minor = minor
+        self.min_size = min_size
+        self.max_size = max_size
+        self.comment = comment
+        self.newest_first = newest_first
+        self.rvstart = make_timestamp(start_year, start_month, start_day,
+                                      start_hour, start_minute, start_second)
+        self.init_rvstart_for_charts = self.rvstart
+        self.rvend = make_timestamp(end_year, end_month, end_day,
+                                    end_hour, end_minute, end_second)
 
         self.base_params = {
            "action": "query",
@@ -54,66 +78,186 @@ class History:
         self.user: str = None
         self.keyword: str = None
         self.tags: list[str] = None
+        self.minor: bool = None
+        self.min_size: int = None
+        self.max_size: int = None
+        self.comment: str = None
+        self.newest_first: bool = False
         self.rvstart: str = None
         self.init_rvstart_for_charts: str = None
         self.rvend: str = None
-        self.revisions: list[Revision] = None
+        self.revisions: RevisionTable = None
+        self.max_in_flight: int = KEYWORD_MAX_IN_FLIGHT
+
+    def query_key(self) -> dict:
+        """ returns this history's query parameters in a normalized form,
+        so that equivalent queries produce equal keys """
+        return {
+            "type": type(self).__name__,
+            "titles": normalize_title(self.titles) if self.titles else None,
+            "user": normalize_title(self.user) if self.user else None,
+            "keyword": self.keyword,
+            "tags": sorted(set(self.tags)) if self.tags is not None else None,
+            "start": self.rvstart,
+            "end": self.rvend,
+            "minor": self.minor,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "comment": self.comment,
+            "newest_first": self.newest_first,
+        }
+
+    @property
+    def revisions(self) -> RevisionTable:
+        """ the revisions in this history, stored column-wise
+        indexing or iterating yields Revision objects built on demand """
+        return self._revisions
+
+    @revisions.setter
+    def revisions(self, revisions):
+        """ accepts a RevisionTable, any iterable of Revisions, or None """
+        if revisions is None or isinstance(revisions, RevisionTable):
+            self._revisions = revisions
+        else:
+            self._revisions = RevisionTable.from_revisions(revisions)
 
     def revisions_as_json(self) -> str:
         """ returns internal revisions list as a JSON string
          where revisions are separated by newlines for readability """
         if self.revisions is None:
             return None  # raise error?
-        ret = [rev.json for rev in self.revisions]
+        ret = list(self.revisions.iter_json())
         ret_json = json.dumps(ret)
         # adding break tags makes this invalid json!
         # just for display/testing
         ret_json = ret_json.replace("},", "},<br/>")
         return ret_json
 
-    def filter(self):
-        """calls filter helper functions"""
+    def filter_pipeline(self) -> FilterPipeline:
+        """ builds the pipeline of predicates matching this history's filters """
+        pipeline = FilterPipeline()
         if self.tags is not None:
-            self.filter_by_tags()
+            pipeline.add(TagPredicate(self.tags))
+        if self.minor is not None:
+            pipeline.add(MinorPredicate(self.minor))
+        if self.min_size is not None or self.max_size is not None:
+            pipeline.add(SizeRangePredicate(self.min_size, self.max_size))
+        if self.comment is not None:
+            try:
+                pipeline.add(CommentPredicate(self.comment))
+            except re.error as re_err:
+                raise BadRequestException("invalid comment pattern") from re_err
         if self.keyword is not None:
-            self.filter_by_keyword()
+            pipeline.add(KeywordPredicate(self.keyword, self.max_in_flight))
+        return pipeline
+
+    def push_down(self, predicate) -> tuple:
+        """ history subclasses may override this to translate a predicate into
+        API parameters. returns a tuple of (params dict, residual predicate),
+        where the residual is whatever part of the predicate the API cannot
+        apply (or None), or (None, predicate) if nothing can be pushed down """
+        return None, predicate
+
+    def plan_query(self) -> tuple:
+        """ splits this history's filters into extra API parameters, for the
+        filters the API can apply server-side, and a FilterPipeline of the
+        filters which must still be applied locally """
+        api_params = {}
+        pipeline = FilterPipeline()
+        for predicate in self.filter_pipeline().predicates:
+            params, residual = self.push_down(predicate)
+            if params is not None:
+                api_params |= params
+            if residual is not None:
+                pipeline.add(residual)
+        return api_params, pipeline
+
+    def filter(self):
+        """applies every requested filter the API could not apply itself
+        in a single pass, cheapest first, so keyword diffs are only fetched
+        for revisions which survive the other filters"""
+        _, pipeline = self.plan_query()
+        if len(pipeline) > 0:
+            self.revisions = pipeline.apply(self.revisions)
 
         if len(self.revisions) == 0:
             print("No revisions found matching your search parameters")
 
     def filter_by_keyword(self):
         """filters list of revisions by keyword"""
-        for rev in self.revisions.copy():
-            if rev.contains_keyword(self.keyword) is False:
-                self.revisions.remove(rev)
+        pipeline = FilterPipeline([KeywordPredicate(self.keyword, self.max_in_flight)])
+        self.revisions = pipeline.apply(self.revisions)
 
     def filter_by_tags(self):
         """filters list of revisions by tags"""
-        for rev in self.revisions.copy():
-            if rev.contains_tag(self.tags) is False:
-                self.revisions.remove(rev)
+        self.revisions = FilterPipeline([TagPredicate(self.tags)]).apply(self.revisions)
+
+    def fetch_wikitext(self, revids: list[int] = None) -> dict:
+        """ returns a dict of revid to raw wikitext for the given revids
+        (by default every revision in this history), requested
+        CONTENT_BATCH_SIZE at a time; cached revisions are not requested """
+        if revids is None:
+            revids = self.revisions.column("revid").tolist()
+        return fetch_wikitext(revids)
+
+    def direction_params(self) -> tuple:
+        """ returns the (start, end, dir) values to send to the API
+        listing newest first walks backwards in time, so the API expects
+        the later bound as its start """
+        if self.newest_first:
+            return self.rvend, self.rvstart, "older"
+        return self.rvstart, self.rvend, "newer"
+
+    @abstractmethod
+    def revision_params(self) -> dict:
+        """ history subclasses must implement this to return the API parameters
+        of the first page of revisions """
 
     @abstractmethod
-    def call_wikipedia_api(self):
-        """ history subclasses must implement a call to the external API """
+    def batch_from_page(self, data: dict) -> RevisionTable:
+        """ history subclasses must implement this to turn one page of API
+        results into a RevisionTable, or None if the page holds no revisions """
+
+    def revision_param_sets(self) -> list[dict]:
+        """ the API parameters of each separate listing which together make up
+        this history; most histories are a single listing """
+        return [self.revision_params()]
 
     def fill_revisions(self):
         """ uses derived class call_wikipedia_api and filter methods
         to retrieve revisions from wikipedia
+        histories with the same query filled at the same time share one
+        fetch: the first does the work and the others adopt its results
         """
-        self.revisions = []
+        leader = history_flights.do(self.flight_key(), self.fetch_revisions)
+        if leader is not self:
+            self.adopt(leader)
+
+    def flight_key(self) -> str:
+        """ identifies this history's query among concurrent fetches """
+        return json.dumps(self.query_key(), sort_keys=True, default=str)
+
+    def fetch_revisions(self):
+        """ does the work of fill_revisions and returns this history """
+        self.revisions = RevisionTable()
         self.call_wikipedia_api()
         self.filter()
         if len(self.revisions) == 0:
             raise NoRevisionsException("No revisions matching filter parameters")
+        self.revisions.consolidated() # other threads may read the table from here on
+        return self
+
+    def adopt(self, other):
+        """ takes on the fetched results of another history with the same query """
+        for name in self.fetched_attributes:
+            setattr(self, name, getattr(other, name))
 
     def get_list_of_revision_key_data(self, revision_key):
         """returns a list of attributes pulled from revisions list
         argument is the attribute to pull from each revision"""
         revision_key_list = []
         try:
-            for each_rev in self.revisions:
-                revision_key_list.append(each_rev.get_revision_key(revision_key))
+            revision_key_list = self.revisions.values(revision_key)
         except KeyError:
             print("Revisions do not contain this key")
         return revision_key_list
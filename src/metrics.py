@@ -0,0 +1,248 @@
+""" Where the time goes in each request, per request and per process.
+While a request is being answered, every upstream call, cache lookup and
+timed step (waiting for the scheduler, reading the response, decoding JSON,
+filtering, rendering) is added to that request's RequestMetrics, which ends
+up in the response's Server-Timing header. The same figures are added up
+per route in a process-wide registry, which /metrics exposes in the
+Prometheus text format, along with latency histograms.
+
+The current request is found through a context variable, which follows the
+request into coroutines and asyncio.to_thread, but not into thread pools:
+wrap work handed to a pool with carry(). Work done on a thread which has
+not answered a request (such as a benchmark) is counted under the route
+"none". Like /cacheStats, the registry is per worker process.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Server-Timing entries, and what each one measures
+TIMINGS = {
+    "queue": "waiting for the upstream scheduler",
+    "upstream": "upstream requests",
+    "json": "decoding upstream JSON",
+    "filter": "filtering revisions",
+    "render": "rendering charts",
+}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+NO_ROUTE = "none"
+
+# name: (type, help)
+METRICS = {
+    "wikiwatcher_requests_total":
+        ("counter", "Requests answered, by route and status."),
+    "wikiwatcher_request_duration_seconds":
+        ("histogram", "Time taken to answer a request, by route."),
+    "wikiwatcher_upstream_calls_total":
+        ("counter", "Requests sent to the MediaWiki API, by route."),
+    "wikiwatcher_upstream_bytes_total":
+        ("counter", "Response bytes received from the MediaWiki API, by route."),
+    "wikiwatcher_upstream_request_duration_seconds":
+        ("histogram", "Time taken by each MediaWiki API request, by route."),
+    "wikiwatcher_step_seconds_total":
+        ("counter", "Time spent in each step of answering requests, by route and step."),
+    "wikiwatcher_cache_lookups_total":
+        ("counter", "Cache lookups, by route, cache and result."),
+}
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class RequestMetrics:
+    """ the upstream calls, timings and cache lookups of one request """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.start = time.perf_counter()
+        self.duration: float = None
+        self.upstream_calls = 0
+        self.upstream_bytes = 0
+        self.seconds = dict.fromkeys(TIMINGS, 0.0)
+        self.cache_lookups: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, step: str, seconds: float):
+        """ adds seconds spent in step """
+        with self._lock:
+            self.seconds[step] += seconds
+
+    def add_upstream_call(self, num_bytes: int, seconds: float):
+        """ counts one upstream request """
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_bytes += num_bytes
+            self.seconds["upstream"] += seconds
+
+    def add_cache_lookup(self, cache: str, hit: bool):
+        """ counts one lookup in the named cache """
+        key = (cache, "hit" if hit else "miss")
+        with self._lock:
+            self.cache_lookups[key] = self.cache_lookups.get(key, 0) + 1
+
+    def server_timing(self) -> str:
+        """ the value of a Server-Timing header describing this request """
+        with self._lock:
+            entries = [f'total;dur={(self.duration or 0) * 1000:.1f}']
+            for step, description in TIMINGS.items():
+                if step == "upstream":
+                    description = f"{self.upstream_calls} calls, {self.upstream_bytes} bytes"
+                entries.append(f'{step};dur={self.seconds[step] * 1000:.1f};desc="{description}"')
+            for (cache, result), count in sorted(self.cache_lookups.items()):
+                entries.append(f'cache-{cache}-{result};desc="{count}"')
+        return ", ".join(entries)
+
+
+class HistogramData:
+    """ bucket counts, sum and count of one labelled histogram """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """ counts one observation """
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels: tuple) -> str:
+    """ renders ((name, value), ...) as a Prometheus label set """
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Registry:
+    """ thread-safe, process-wide counters and histograms """
+
+    def __init__(self):
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, HistogramData] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """ adds amount to a counter """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        """ adds an observation to a histogram """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = HistogramData(buckets)
+            self.histograms[key].observe(value)
+
+    def exposition(self) -> str:
+        """ every metric in the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            for name, (kind, description) in METRICS.items():
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self.counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                for (metric, labels), data in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    bounds = [f"{bound:g}" for bound in data.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, data.counts + [data.count]):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))}"
+                                     f" {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {data.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {data.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def current_route() -> str:
+    """ the route of the request being answered, or NO_ROUTE """
+    request_metrics = current_request.get()
+    return request_metrics.route if request_metrics is not None else NO_ROUTE
+
+
+def start_request(route: str) -> RequestMetrics:
+    """ starts collecting metrics for a request to route """
+    request_metrics = RequestMetrics(route)
+    current_request.set(request_metrics)
+    return request_metrics
+
+
+def finish_request(status: int) -> RequestMetrics:
+    """ fixes the current request's duration and adds it to the registry
+    returns its RequestMetrics, or None if no request is in progress
+    work done afterwards (streaming a response body) still counts toward
+    the request's route, though not toward its Server-Timing header """
+    request_metrics = current_request.get()
+    if request_metrics is None or request_metrics.duration is not None:
+        return None
+    request_metrics.duration = time.perf_counter() - request_metrics.start
+    registry.inc("wikiwatcher_requests_total", route=request_metrics.route, status=str(status))
+    registry.observe("wikiwatcher_request_duration_seconds", request_metrics.duration,
+                     route=request_metrics.route)
+    return request_metrics
+
+
+def record_time(step: str, seconds: float):
+    """ counts seconds spent in one of the TIMINGS steps """
+    registry.inc("wikiwatcher_step_seconds_total", seconds, route=current_route(), step=step)
+    request_metrics = current_request.get()
+    if request_metrics is not None:
+        request_metrics.add_time(step, seconds)
+
+
+@contextmanager
+def timed(step: str):
+    """ counts the time spent inside the block as step """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(step, time.perf_counter() - start)
+
+
+def record_upstream_call(num_bytes: int, seconds: float):
+    """ counts one upstream request, which received num_bytes in seconds """
+    route = current_route()
+    registry.inc("wikiwatcher_upstream_calls_total", route=route)
+    registry.inc("wikiwatcher_upstream_bytes_total", num_bytes, route=route)
+    registry.inc("wikiwatcher_step_seconds_total", seconds, route=route, step="upstream")
+    registry.observe("wikiwatcher_upstream_request_duration_seconds", seconds, route=route)
+    request_metrics = current_request.get()
+    if request_metrics is not None:
+        request_metrics.add_upstream_call(num_bytes, seconds)
+
+
+def record_cache(cache: str, hit: bool):
+    """ counts one lookup in the named cache """
+    registry.inc("wikiwatcher_cache_lookups_total", route=current_route(), cache=cache,
+                 result="hit" if hit else "miss")
+    request_metrics = current_request.get()
+    if request_metrics is not None:
+        request_metrics.add_cache_lookup(cache, hit)
+
+
+def carry(func):
+    """ wraps func so that, when a thread pool runs it, it is counted as
+    part of the request which wrapped it """
+    request_metrics = current_request.get()
+    def run(*args, **kwargs):
+        token = current_request.set(request_metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current_request.reset(token)
+    return run
@@ -0,0 +1,206 @@
+""" Paging through the API's revision listings on behalf of a history.
+Histories read their listing all at once (call_wikipedia_api), one page at a
+time behind an opaque cursor (fill_page), page by page as a stream
+(stream_revisions), or on an event loop (fetch); PaginationMixin holds all of
+these, so History only has to describe its listing and turn a page of results
+into a RevisionTable.
+
+Cursors are handed to clients and come back from them, so decode_cursor
+checks that a cursor belongs to the query presenting it and carries nothing
+but a continuation token.
+"""
+import json
+import base64
+import asyncio
+import hashlib
+import itertools
+try:
+    from src import upstream
+    from src.revisiontable import RevisionTable
+    from src.exceptions import BadRequestException, NoRevisionsException
+except ModuleNotFoundError:
+    import upstream
+    from revisiontable import RevisionTable
+    from exceptions import BadRequestException, NoRevisionsException
+
+MAX_PAGE_SIZE = 500     # most revisions the API returns per request
+
+
+def query_fingerprint(query_key: dict) -> str:
+    """ short digest of a query key, tying a cursor to the query which issued it """
+    return hashlib.sha256(json.dumps(query_key, sort_keys=True, default=str)
+                          .encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(query_key: dict, continue_params: dict, skip: int) -> str:
+    """ packs a resume point into an opaque, URL-safe string: the API
+    continuation parameters of a page, and how many of that page's revisions
+    were already returned """
+    state = {"q": query_fingerprint(query_key), "c": continue_params, "s": skip}
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(query_key: dict, cursor: str, continue_param: str) -> tuple:
+    """ unpacks a cursor made by encode_cursor for the same query
+    returns a tuple of (continue params, skip)
+    cursors come from clients, so the continue params may only hold the
+    listing's continuation token (continue_param, e.g. rvcontinue) and the
+    generic "continue", as strings; anything else could override the query """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        continue_params, skip = dict(state["c"]), int(state["s"])
+        fingerprint = state["q"]
+    except (ValueError, TypeError, KeyError) as cursor_err:
+        raise BadRequestException("invalid cursor") from cursor_err
+    if fingerprint != query_fingerprint(query_key):
+        raise BadRequestException("cursor belongs to a different query")
+    if skip < 0 or any(key not in ("continue", continue_param) or not isinstance(value, str)
+                       for key, value in continue_params.items()):
+        raise BadRequestException("invalid cursor")
+    return continue_params, skip
+
+
+class PaginationMixin:
+    """ fetching a history's revisions page by page
+    the class mixing this in provides limit_param, continue_param,
+    newest_first, query_key(), plan_query(), filter(), revision_params(),
+    revision_param_sets() and batch_from_page() """
+
+    @staticmethod
+    def paginate(params: dict):
+        """ yields each page of API results in turn, passing the continuation
+        token (e.g. rvcontinue, uccontinue) from one page into the next request
+        """
+        params = dict(params)
+        while True:
+            data = upstream.get(params)
+            yield data
+            if data.get("continue") is None:
+                return
+            params.update(data["continue"])
+
+    @staticmethod
+    async def paginate_async(params: dict, client):
+        """ asynchronous paginate(): yields each page of API results in turn,
+        requesting them through the given httpx.AsyncClient """
+        params = dict(params)
+        while True:
+            data = await upstream.aget(params, client)
+            yield data
+            if data.get("continue") is None:
+                return
+            params.update(data["continue"])
+
+    def iter_revision_batches(self):
+        """ generator over the external API which yields one RevisionTable
+        per page of results """
+        param_sets = self.revision_param_sets()
+        if len(param_sets) == 1:
+            for data in self.paginate(param_sets[0]):
+                batch = self.batch_from_page(data)
+                if batch is None:
+                    return
+                yield batch
+            return
+        # separate listings are each in time order, but must be merged
+        merged = RevisionTable()
+        for params in param_sets:
+            for data in self.paginate(params):
+                batch = self.batch_from_page(data)
+                if batch is None:
+                    break
+                merged.extend(batch)
+        if len(merged) > 0:
+            yield merged.sorted_by_time(self.newest_first)
+
+    def call_wikipedia_api(self):
+        """ consumes iter_revision_batches into the internal revisions table """
+        for batch in self.iter_revision_batches():
+            self.revisions.extend(batch)
+
+    def fill_page(self, limit: int, cursor: str = None) -> str:
+        """ fills revisions with at most limit matching revisions, starting
+        where the page which returned cursor ended (or at the beginning)
+        returns the cursor of the next page, or None after the last one.
+        pages are requested only as large as needed, so when every filter is
+        applied by the API a page of up to MAX_PAGE_SIZE revisions costs one
+        upstream request; keyword filters fetch diffs only until the page is
+        full, not for every revision of the upstream page """
+        if limit is None or limit < 1:
+            raise BadRequestException("limit must be a positive number")
+        continue_params, skip = {}, 0
+        if cursor is not None:
+            continue_params, skip = decode_cursor(self.query_key(), cursor, self.continue_param)
+        _, pipeline = self.plan_query()
+        params = self.revision_params()
+        self.revisions = RevisionTable()
+        while True:
+            page_size = MAX_PAGE_SIZE if len(pipeline) > 0 else \
+                min(MAX_PAGE_SIZE, skip + limit - len(self.revisions))
+            data = upstream.get(params | {self.limit_param: str(page_size)} | continue_params)
+            batch = self.batch_from_page(data)
+            if batch is None:
+                break
+            unseen = batch[skip:]
+            wanted = limit - len(self.revisions)
+            positions, examined = pipeline.first(unseen, wanted)
+            self.revisions.extend(unseen.select(positions))
+            if len(positions) >= wanted:
+                consumed = skip + examined
+                if consumed < len(batch):
+                    return encode_cursor(self.query_key(), continue_params, consumed)
+                if data.get("continue") is None:
+                    return None
+                return encode_cursor(self.query_key(), data["continue"], 0)
+            if data.get("continue") is None:
+                break
+            continue_params, skip = data["continue"], 0
+        if len(self.revisions) == 0 and cursor is None:
+            raise NoRevisionsException("No revisions matching filter parameters")
+        return None
+
+    async def fetch(self, client=None):
+        """ asynchronous fill_revisions(): awaits each page of revisions
+        instead of blocking a thread on it, so many histories can be fetched
+        concurrently on one event loop. pass an httpx.AsyncClient to share its
+        connections between fetches; otherwise one is opened for this fetch.
+        filtering runs in a worker thread, since keyword filters fetch diffs """
+        if client is None:
+            async with upstream.make_async_client() as own_client:
+                return await self.fetch(own_client)
+        self.revisions = RevisionTable()
+        param_sets = self.revision_param_sets()
+        for params in param_sets:
+            async for data in self.paginate_async(params, client):
+                batch = self.batch_from_page(data)
+                if batch is None:
+                    break
+                self.revisions.extend(batch)
+        if len(param_sets) > 1:
+            self.revisions = self.revisions.sorted_by_time(self.newest_first)
+        await asyncio.to_thread(self.filter)
+        if len(self.revisions) == 0:
+            raise NoRevisionsException("No revisions matching filter parameters")
+        return self
+
+    def iter_filtered_batches(self):
+        """ yields each page of revisions as it arrives from the API, with
+        every filter already applied; pages left empty are skipped """
+        _, pipeline = self.plan_query()
+        for batch in self.iter_revision_batches():
+            if len(pipeline) > 0:
+                batch = pipeline.apply(batch)
+            if len(batch) > 0:
+                yield batch
+
+    def stream_revisions(self):
+        """ returns an iterator of revision dicts which fetches and filters
+        one page of revisions at a time, without keeping earlier pages.
+        the first matching page is fetched before returning, so a query
+        which matches nothing raises NoRevisionsException up front """
+        batches = self.iter_filtered_batches()
+        first = next(batches, None)
+        if first is None:
+            raise NoRevisionsException("No revisions matching filter parameters")
+        return (row for batch in itertools.chain([first], batches)
+                for row in batch.iter_json())
@@ -1,10 +1,9 @@
 """ Pie chart for visualizing which articles a user has edited
 or which users have edited an article
 """
-from math import ceil
-import matplotlib.pyplot as plt
-from random import random
+from collections import Counter
 from datetime import datetime
+from matplotlib.figure import Figure
 import numpy as np
 try:
     from src.exceptions import BadRequestException
@@ -13,44 +12,68 @@ try:
     from src.userhistory import UserHistory
     from src.articlehistory import ArticleHistory
 except ModuleNotFoundError:
-    from exceptions import NoRevisionsException
+    from exceptions import BadRequestException
     from plot import Plot
     from history import History
+    from userhistory import UserHistory
+    from articlehistory import ArticleHistory
+
+DEFAULT_TOP_N = 30 # wedges drawn before the rest are folded into "Other"
+OTHER_LABEL = "Other"
+WEDGE_COUNTS = (1, 10, 20, 30, 100)
+SIDE_INCHES = (8, 10, 12, 16, 20)
+PCT_DISTANCES = (1.4, 1.4, 1.3, 1.2, 1.1)
+LABEL_DISTANCES = (1.8, 1.8, 1.6, 1.4, 1.2)
+FONT_SIZES = (12, 12, 12, 10, 8)
 
 class Pie(Plot):
     """ representst the pie chart associated with the history object passed in
-    returns a pyplot.Figure from its get_graph() method
+    returns a matplotlib Figure from its get_graph() method
+    only the top_n largest categories get their own wedge; the remainder are
+    combined into a single "Other" wedge (top_n of None or 0 draws every category)
     """
-    def __init__(self, history):
+    def __init__(self, history, top_n: int = DEFAULT_TOP_N):
         super().__init__(history)
+        if top_n is not None and top_n < 0:
+            raise BadRequestException("top_n must not be negative")
+        self.top_n = top_n or None
 
+        counts = Counter()
         if isinstance(self.history, UserHistory):
-            self.x_axis = self.get_x_axis_data("title")
+            counts = self.history.revisions.value_counts("title")
         elif isinstance(self.history, ArticleHistory):
-            self.x_axis = self.get_x_axis_data("user")
-        self.labels = tuple(set(self.x_axis))
-        self.sizes = [self.x_axis.count(category) for category in self.labels]
+            counts = self.history.revisions.value_counts("user")
+        top = counts.most_common(self.top_n)
+        self.labels = tuple(label for label, _ in top)
+        self.sizes = [size for _, size in top]
+        other = sum(counts.values()) - sum(self.sizes)
+        if other > 0:
+            self.labels += (OTHER_LABEL,)
+            self.sizes.append(other)
 
-    def get_graph(self) -> plt.Figure:
-        """ sets up the pychart.Figure object and returns it """
+    def render_data(self) -> dict:
+        """ returns the label/size pairs and layout needed to draw this chart """
         if not self.history.titles is None and not self.history.user is None:
             raise BadRequestException(
                 "Specifying both user and article title - pie chart redundant")
         fig_size_inches, pct_distance, label_distance, fontsize = self.size_of_png()
-        fig, axes = plt.subplots(layout="constrained", figsize=fig_size_inches)
-        autopct_string = make_autopct(self.sizes)
+        return {
+            "labels": self.labels,
+            "sizes": self.sizes,
+            "fig_size_inches": fig_size_inches,
+            "pct_distance": pct_distance,
+            "label_distance": label_distance,
+            "fontsize": fontsize,
+            "title": self.generate_pie_title(),
+        }
+
+    def drawing_function(self):
+        """ the module-level function which turns render_data() into a Figure """
+        return draw_pie
 
-        _, labels, percents = axes.pie(self.sizes, labels=self.labels, autopct=autopct_string,
-               pctdistance=pct_distance, labeldistance=label_distance, rotatelabels=True,
-               textprops={"fontsize": fontsize})
-        for label, percent in zip(labels, percents):
-            percent.set_rotation(label.get_rotation())
-            if len(label.get_text()) > 20:
-                label.set_text(label.get_text()[0:21] + "...")
-        title = self.generate_pie_title()
-        fig.suptitle(title)
-        #plt.rcParams["figure.constrained_layout.use"] = True
-        return fig
+    def get_graph(self) -> Figure:
+        """ sets up the Figure object and returns it """
+        return draw_pie(self.render_data())
 
     def size_of_png(self):
         """ uses number of wedges to determine necessary image size and chart parameters
@@ -59,37 +82,15 @@ class Pie(Plot):
             distance_to_percent: float,
             distance_to_label: float,
             fontsize: int
-        ) Need to improve this to use some mathematical algorithm instead of cases
+        ) each value is interpolated between the settings which suit
+        1, 10, 20, 30 and 100 or more wedges
         """
-        fig_size_inches = (-1,-1)
-        pct_distance = -1.0
-        label_distance = -1.0
-        fontsize = 12
         num_labels = len(self.labels)
-        match num_labels:
-            case _ if 1 < num_labels < 10:
-                fig_size_inches = (8,8)
-                pct_distance = 1.4
-                label_distance = 1.8
-            case _ if 10 < num_labels < 20:
-                fig_size_inches = (10,10)
-                pct_distance = 1.4
-                label_distance = 1.8
-            case _ if 20 < num_labels < 30:
-                fig_size_inches = (12,12)
-                pct_distance = 1.3
-                label_distance = 1.6
-            case _ if 30 < num_labels < 100:
-                fig_size_inches = (16,16)
-                pct_distance = 1.2
-                label_distance = 1.4
-                fontsize -= 2
-            case _:
-                fig_size_inches = (20,20)
-                pct_distance = 1.1
-                label_distance = 1.2
-                fontsize -= 4
-        return (fig_size_inches, pct_distance, label_distance, fontsize)
+        side_inches = round(float(np.interp(num_labels, WEDGE_COUNTS, SIDE_INCHES)), 1)
+        pct_distance = float(np.interp(num_labels, WEDGE_COUNTS, PCT_DISTANCES))
+        label_distance = float(np.interp(num_labels, WEDGE_COUNTS, LABEL_DISTANCES))
+        fontsize = int(np.interp(num_labels, WEDGE_COUNTS, FONT_SIZES))
+        return ((side_inches, side_inches), pct_distance, label_distance, fontsize)
 
     def generate_pie_title(self) -> str:
         """ Generates a title for the graph depending on what was requested """
@@ -104,6 +105,24 @@ class Pie(Plot):
             title += f"to {datetime.fromisoformat(self.history.rvend)}\n"
         return title
 
+def draw_pie(data: dict) -> Figure:
+    """ draws a pie chart from Pie.render_data() output
+    needs no History, so it can run in a separate rendering process """
+    fig = Figure(layout="constrained", figsize=data["fig_size_inches"])
+    axes = fig.add_subplot()
+    autopct_string = make_autopct(data["sizes"])
+
+    _, labels, percents = axes.pie(data["sizes"], labels=data["labels"],
+                                   autopct=autopct_string, pctdistance=data["pct_distance"],
+                                   labeldistance=data["label_distance"], rotatelabels=True,
+                                   textprops={"fontsize": data["fontsize"]})
+    for label, percent in zip(labels, percents):
+        percent.set_rotation(label.get_rotation())
+        if len(label.get_text()) > 20:
+            label.set_text(label.get_text()[0:21] + "...")
+    fig.suptitle(data["title"])
+    return fig
+
 def make_autopct(values) -> str:
     """ see
     https://stackoverflow.com/questions/6170246/
@@ -113,8 +132,8 @@ def make_autopct(values) -> str:
     returning a string containing formatted percent and count values
     for each value
     """
+    total = sum(values)
     def make_percent_and_count_string(value):
-        total = sum(values)
         val = int(round(value*total/100.0))
         return f"{value:.2f}% ({val:d})"
     return make_percent_and_count_string
@@ -23,6 +23,16 @@ class Plot:
         """set x graphing data to any parameter in revision object"""
         return self.history.get_list_of_revision_key_data(revision_property)
 
+    @abstractmethod
+    def render_data(self) -> dict:
+        """ returns the aggregated data the chart is drawn from
+        (small and picklable, so it can be sent to a rendering process) """
+
+    @abstractmethod
+    def drawing_function(self):
+        """ returns a module-level function taking render_data() output
+        and returning a matplotlib.figure.Figure """
+
     @abstractmethod
     def get_graph(self):
-        """ returns a plt.Figure of the finished graph """
+        """ returns a matplotlib.figure.Figure of the finished graph """
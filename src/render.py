@@ -0,0 +1,145 @@
+""" Turns chart figures into image bytes and caches the results.
+Figures are built with matplotlib.figure.Figure directly rather than through
+pyplot, so nothing is registered in pyplot's global figure manager and
+rendering is safe from multiple threads. Rendered bytes are cached under a
+fingerprint of the history query, chart type and chart options.
+
+Drawing is CPU-bound, so it happens in a small pool of worker processes.
+Only a chart's aggregated render data (bin edges and counts, or labels and
+sizes) crosses the process boundary. The number of charts queued or being
+drawn is capped; requests beyond that cap, and renders which take too long,
+raise RenderUnavailableException instead of tying up the web worker.
+"""
+import io
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+try:
+    from src import metrics
+    from src.cache import LRUCache
+    from src.exceptions import BadRequestException, RenderUnavailableException
+except ModuleNotFoundError:
+    import metrics
+    from cache import LRUCache
+    from exceptions import BadRequestException, RenderUnavailableException
+
+IMAGE_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+CHART_CACHE_BYTES = 32 * 1024 * 1024
+OPEN_ENDED_CHART_TIMEOUT = 120 # seconds; charts of histories running up to "now" go stale
+
+RENDER_WORKERS = 2      # 0 draws in the calling thread instead
+RENDER_QUEUE_DEPTH = 8  # charts queued or drawing at once before refusing more
+RENDER_TIMEOUT = 30     # seconds
+
+chart_cache = LRUCache(CHART_CACHE_BYTES)
+# the rendering pool lives as long as the process: it is started on first use
+# and only replaced by configure(); concurrent.futures shuts it down at exit
+POOL: ProcessPoolExecutor = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(RENDER_QUEUE_DEPTH)
+
+
+def chart_fingerprint(history, chart_type: str, options: dict, image_format: str) -> str:
+    """ identifies a rendered chart by everything which affects its pixels
+    charts whose history has no end date also carry the current time bucket,
+    since new revisions can arrive at any moment """
+    key = [history.query_key(), chart_type, sorted(options.items()), image_format]
+    if history.rvend is None:
+        key.append(int(time.time() // OPEN_ENDED_CHART_TIMEOUT))
+    return hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+
+def render_figure(figure, image_format: str = "png") -> bytes:
+    """ draws a matplotlib Figure into an image and releases the figure's artists """
+    if image_format not in IMAGE_FORMATS:
+        raise BadRequestException("image format must be one of " + ", ".join(IMAGE_FORMATS))
+    output = io.BytesIO()
+    try:
+        figure.savefig(output, format=image_format)
+    finally:
+        figure.clear()
+    return output.getvalue()
+
+
+def draw_to_bytes(draw, data: dict, image_format: str) -> bytes:
+    """ runs in a rendering process: draws a chart from its render data """
+    return render_figure(draw(data), image_format)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """ returns the rendering process pool, starting it on first use
+    workers are spawned rather than forked, since the web server is threaded """
+    global POOL # pylint: disable=global-statement
+    with _pool_lock:
+        if POOL is None:
+            # not a with block: the pool outlives this call, see POOL above
+            POOL = ProcessPoolExecutor( # pylint: disable=consider-using-with
+                max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return POOL
+
+
+def configure(workers: int = None, queue_depth: int = None, timeout: float = None):
+    """ changes rendering settings; the pool is restarted on next use """
+    global POOL, _slots, RENDER_WORKERS, RENDER_QUEUE_DEPTH, RENDER_TIMEOUT # pylint: disable=global-statement
+    with _pool_lock:
+        if workers is not None:
+            RENDER_WORKERS = workers
+        if queue_depth is not None:
+            RENDER_QUEUE_DEPTH = queue_depth
+            _slots = threading.BoundedSemaphore(queue_depth) if queue_depth else None
+        if timeout is not None:
+            RENDER_TIMEOUT = timeout
+        old_pool = POOL
+        POOL = None
+    if old_pool is not None:
+        old_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_in_pool(draw, data: dict, image_format: str) -> bytes:
+    """ draws a chart in the rendering pool and waits for its bytes """
+    if RENDER_WORKERS == 0:
+        return draw_to_bytes(draw, data, image_format)
+    slots = _slots
+    # the slot is held until the chart is drawn, and released by the future's
+    # callback rather than a with block, since a timed-out draw keeps running
+    if slots is None or not slots.acquire(blocking=False): # pylint: disable=consider-using-with
+        raise RenderUnavailableException("too many charts are being drawn, try again shortly")
+    try:
+        future = get_pool().submit(draw_to_bytes, draw, data, image_format)
+    except (BrokenProcessPool, RuntimeError) as pool_err:
+        slots.release()
+        configure()
+        raise RenderUnavailableException("chart renderer unavailable") from pool_err
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=RENDER_TIMEOUT)
+    except FutureTimeout as timeout_err:
+        raise RenderUnavailableException("chart took too long to draw") from timeout_err
+    except BrokenProcessPool as pool_err:
+        configure()
+        raise RenderUnavailableException("chart renderer crashed") from pool_err
+
+
+def render_chart(history, chart_type: str, options: dict, image_format: str,
+                 make_chart) -> bytes:
+    """ returns the image bytes of a chart, rendering it only on a cache miss
+    make_chart is called with the history (filling its revisions first if
+    it has not been fetched yet) and must return a Plot, which is aggregated
+    here and drawn in the rendering pool """
+    if image_format not in IMAGE_FORMATS:
+        raise BadRequestException("image format must be one of " + ", ".join(IMAGE_FORMATS))
+    key = chart_fingerprint(history, chart_type, options, image_format)
+    image = chart_cache.get(key)
+    metrics.record_cache("chart", image is not None)
+    if image is None:
+        if history.revisions is None:
+            history.fill_revisions()
+        chart = make_chart(history)
+        with metrics.timed("render"):
+            image = render_in_pool(chart.drawing_function(), chart.render_data(), image_format)
+        chart_cache.set(key, image)
+    return image
@@ -1,9 +1,63 @@
 """defines revision base class"""
 from datetime import datetime
-import requests
-import mwparserfromhell as mwp
+try:
+    from src import upstream
+    from src.cache import revision_cache, content_key, diff_key, wikitext_key
+    from src.singleflight import revision_flights
+except ModuleNotFoundError:
+    import upstream
+    from cache import revision_cache, content_key, diff_key, wikitext_key
+    from singleflight import revision_flights
 
-URL = "https://www.wikipedia.org/w/api.php"
+CONTENT_BATCH_SIZE = 50 # most revids the API accepts per content request
+
+def wikitext_params(revids) -> dict:
+    """ query parameters for the raw wikitext of up to CONTENT_BATCH_SIZE revisions """
+    return {
+        "action": "query",
+        "format": "json",
+        "formatversion": "2",
+        "prop": "revisions",
+        "revids": "|".join(str(revid) for revid in revids),
+        "rvprop": "ids|content",
+        "rvslots": "main",
+    }
+
+def wikitext_from_response(data: dict) -> dict:
+    """ maps revid to wikitext for every revision in a prop=revisions response
+    and stores each one in the revision cache
+    revisions whose content is hidden or missing are left out """
+    ret = {}
+    for page in data.get("query", {}).get("pages", []):
+        for each_revision in page.get("revisions", []):
+            main_slot = each_revision.get("slots", {}).get("main", {})
+            if "content" in main_slot:
+                ret[each_revision["revid"]] = main_slot["content"]
+                revision_cache.set(wikitext_key(each_revision["revid"]), main_slot["content"])
+    return ret
+
+def fetch_wikitext(revids) -> dict:
+    """ returns a dict of revid to raw wikitext for the given revids
+    cached revisions are skipped and the rest are requested
+    CONTENT_BATCH_SIZE at a time, following continuation when the API
+    truncates a batch; fetched content fills the revision cache """
+    ret = {}
+    missing = []
+    for revid in revids:
+        cached = revision_cache.get(wikitext_key(revid))
+        if cached is None:
+            missing.append(revid)
+        else:
+            ret[revid] = cached
+    for i in range(0, len(missing), CONTENT_BATCH_SIZE):
+        params = wikitext_params(missing[i:i + CONTENT_BATCH_SIZE])
+        while True:
+            data = upstream.get(params)
+            ret |= wikitext_from_response(data)
+            if data.get("continue") is None:
+                break
+            params = params | data["continue"]
+    return ret
 
 class Revision():
     """revision object parses json revision info into consistent """
@@ -33,7 +87,7 @@ class Revision():
 
     def contains_tag(self, tag_list):
         """checks if a revision contains any tags from the parameter list of tags"""
-        return all(item in self.tags for item in tag_list)
+        return frozenset(tag_list).issubset(self.tags)
 
     def contains_keyword(self, keyword):
         """checks if a revision contains any keywords inside of the revision content"""
@@ -43,33 +97,63 @@ class Revision():
         return False
 
     def get_content(self):  # start and end time stamps???
-        """ Returns the content of the page at this revision"""
-
-        session = requests.Session()
+        """ Returns the content of the page at this revision
+        concurrent requests for the same revision share one upstream fetch"""
+        if self.revid is None:
+            raise AttributeError("Revision ID missing")
+        cached = revision_cache.get(content_key(self.revid))
+        if cached is not None:
+            return cached
+        return revision_flights.do(content_key(self.revid), self.fetch_content)
 
+    def fetch_content(self):
+        """ requests, parses and caches the content of the page at this revision """
         params = {
             "action": "parse",
             "format": "json",
             "oldid": self.revid,
             "prop": "text",
         }
+        # mwparserfromhell is only needed here, so it is not loaded at startup
+        import mwparserfromhell as mwp # pylint: disable=import-outside-toplevel
+        data = upstream.get(params)["parse"]["text"]["*"]
+        ret = mwp.parse(data)
+        content = str("".join(ret).replace("\n", ""))
+        revision_cache.set(content_key(self.revid), content)
+        return content
+
+    def get_wikitext(self):
+        """ Returns the raw wikitext of the page at this revision
+        concurrent requests for the same revision share one upstream fetch"""
         if self.revid is None:
             raise AttributeError("Revision ID missing")
-        request = session.get(url=URL, params=params, timeout=5)
-        data = request.json()["parse"]["text"]["*"]
-        ret = mwp.parse(data)
-        return str("".join(ret).replace("\n", ""))
+        cached = revision_cache.get(wikitext_key(self.revid))
+        if cached is not None:
+            return cached
+        return revision_flights.do(wikitext_key(self.revid),
+                                   lambda: fetch_wikitext([self.revid]).get(self.revid))
 
     def get_diff(self, to_id: int = None):
         """ Returns the difference between this revision and its parent
         in this revision's article's history, unless a toId is specified in
         which case this revision is compared with toId.
+        concurrent requests for the same diff share one upstream fetch
         """
         if to_id is None:
             if self.parentid is None:
                 raise AttributeError("Revision parent ID missing")
             to_id = self.parentid
-        session = requests.Session()
+        cached = revision_cache.get(diff_key(self.revid, to_id))
+        if cached is not None:
+            return cached
+        diff_html = revision_flights.do(diff_key(self.revid, to_id), self.fetch_diff, to_id)
+        if diff_html is None:
+            return self.get_content()
+        return diff_html
+
+    def fetch_diff(self, to_id: int):
+        """ requests and caches the difference between this revision and to_id
+        returns None if the Compare API could not produce one """
         params = {
             # params for Compare API
             # https://www.mediawiki.org/wiki/API:Compare
@@ -78,14 +162,15 @@ class Revision():
             "fromrev": self.revid,
             "torev": to_id
         }
-        wp_response = session.get(url=URL, params=params).json()
+        wp_response = upstream.get(params)
         # Can we return something more user-friendly?
         # Automatically color ins and del tags?
         try:
             diff_html = wp_response['compare']['*']
+            revision_cache.set(diff_key(self.revid, to_id), diff_html)
             return diff_html
         except (KeyError, ValueError):
-            return self.get_content()
+            return None
 
     def get_revision_key(self, attr):
         """gets the revision attribute, which is passed in as a string"""
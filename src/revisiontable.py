@@ -0,0 +1,290 @@
+""" defines a compact columnar container for revisions
+A RevisionTable stores each revision field as one NumPy array (or, for the
+free-text comment, one object array) instead of one dict per revision.
+Repeated strings such as user names, titles and tags are interned so each
+distinct value is stored once. Revision objects are only built when a row
+is indexed or iterated over.
+"""
+from collections import Counter
+import numpy as np
+try:
+    from src.revision import Revision
+except ModuleNotFoundError:
+    from revision import Revision
+
+MISSING = -1  # stands in for None in integer and interned-string columns
+INT_COLUMNS = ("pageid", "revid", "parentid", "userid", "size")
+STRING_COLUMNS = ("user", "title")
+FIELDS = ("pageid", "title", "revid", "parentid", "minor", "user", "userid",
+          "timestamp", "size", "comment", "tags")
+
+
+class StringPool:
+    """ interns strings, mapping each distinct value to a small integer code """
+
+    def __init__(self):
+        self.strings: list[str] = []
+        self.codes: dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        """ returns the code for value, adding it to the pool if it is new """
+        if value is None:
+            return MISSING
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.strings)
+            self.codes[value] = code
+            self.strings.append(value)
+        return code
+
+    def lookup(self, code: int):
+        """ returns the string for code, or None for MISSING """
+        return None if code == MISSING else self.strings[code]
+
+
+def parse_timestamps(timestamps) -> np.ndarray:
+    """ converts API timestamp strings (e.g. 2022-12-13T11:41:23Z) into
+    a datetime64[s] array in one call; None becomes NaT """
+    return np.array([ts.rstrip("Z") if ts else "NaT" for ts in timestamps],
+                    dtype="datetime64[s]")
+
+
+def format_timestamps(timestamps: np.ndarray) -> list:
+    """ converts a datetime64 array back into API-style timestamp strings """
+    strings = np.datetime_as_string(timestamps, unit="s")
+    return [None if ts == "NaT" else ts + "Z" for ts in strings.tolist()]
+
+
+class RevisionTable:
+    """ columnar storage for a sequence of revisions
+    supports len(), indexing (returning Revision objects), slicing and
+    iteration like the list of Revisions it replaces """
+
+    def __init__(self, pools: dict = None):
+        self.pools: dict[str, StringPool] = pools or \
+            {name: StringPool() for name in STRING_COLUMNS + ("tags",)}
+        self.columns: dict[str, np.ndarray] = self.empty_columns()
+        self.tag_offsets = np.zeros(1, dtype=np.int64)
+        self._pending: list[dict] = []
+        self._length = 0
+
+    @staticmethod
+    def empty_columns() -> dict:
+        """ zero-length arrays for every column """
+        columns = {name: np.empty(0, dtype=np.int64) for name in INT_COLUMNS}
+        columns |= {name: np.empty(0, dtype=np.int32) for name in STRING_COLUMNS}
+        columns["timestamp"] = np.empty(0, dtype="datetime64[s]")
+        columns["minor"] = np.empty(0, dtype=bool)
+        columns["comment"] = np.empty(0, dtype=object)
+        columns["extra"] = np.empty(0, dtype=object)
+        columns["tags"] = np.empty(0, dtype=np.int32)
+        return columns
+
+    @classmethod
+    def from_json(cls, rows: list[dict], pools: dict = None):
+        """ builds a table from revision dicts as returned by the API """
+        table = cls(pools)
+        table.append_json(rows)
+        return table
+
+    @classmethod
+    def from_revisions(cls, revisions):
+        """ builds a table from Revision objects, preferring their attributes
+        over their original JSON where the two differ """
+        rows = []
+        for rev in revisions:
+            row = dict(rev.json)
+            for field in FIELDS:
+                value = getattr(rev, field, None)
+                if value is not None:
+                    row[field] = value
+            rows.append(row)
+        return cls.from_json(rows)
+
+    def append_json(self, rows: list[dict]):
+        """ appends revision dicts; they are packed into arrays immediately
+        and concatenated with the rest of the table on next access """
+        if not rows:
+            return
+        chunk = {}
+        for name in INT_COLUMNS:
+            chunk[name] = np.fromiter(
+                (MISSING if row.get(name) is None else row[name] for row in rows),
+                dtype=np.int64, count=len(rows))
+        for name in STRING_COLUMNS:
+            pool = self.pools[name]
+            chunk[name] = np.fromiter((pool.intern(row.get(name)) for row in rows),
+                                      dtype=np.int32, count=len(rows))
+        chunk["timestamp"] = parse_timestamps([row.get("timestamp") for row in rows])
+        chunk["minor"] = np.fromiter((bool(row.get("minor")) for row in rows),
+                                     dtype=bool, count=len(rows))
+        chunk["comment"] = np.empty(len(rows), dtype=object)
+        chunk["comment"][:] = [row.get("comment") for row in rows]
+        chunk["extra"] = np.empty(len(rows), dtype=object)
+        chunk["extra"][:] = [{key: value for key, value in row.items() if key not in FIELDS}
+                             or None for row in rows]
+        tag_pool = self.pools["tags"]
+        row_tags = [row.get("tags") or [] for row in rows]
+        chunk["tags"] = np.array([tag_pool.intern(tag) for tags in row_tags for tag in tags],
+                                 dtype=np.int32)
+        chunk["tag_lengths"] = np.array([len(tags) for tags in row_tags], dtype=np.int64)
+        self._pending.append(chunk)
+        self._length += len(rows)
+
+    def extend(self, other):
+        """ appends every row of another RevisionTable or iterable of Revisions """
+        if not isinstance(other, RevisionTable):
+            other = RevisionTable.from_revisions(other)
+        if len(other) == 0:
+            return
+        if other.pools is self.pools:
+            chunk = dict(other.consolidated())
+        else:
+            chunk = {}
+            for name, column in other.consolidated().items():
+                if name in STRING_COLUMNS + ("tags",):
+                    recode = np.array([self.pools[name].intern(value)
+                                       for value in other.pools[name].strings] + [MISSING],
+                                      dtype=np.int32)
+                    column = recode[column]  # MISSING (-1) indexes the trailing MISSING
+                chunk[name] = column
+        chunk["tag_lengths"] = np.diff(other.tag_offsets)
+        self._pending.append(chunk)
+        self._length += len(other)
+
+    def consolidated(self) -> dict:
+        """ returns the column arrays, merging any pending chunks first """
+        if self._pending:
+            chunks = [self.columns] + self._pending
+            lengths = np.concatenate([np.diff(self.tag_offsets)] +
+                                     [chunk["tag_lengths"] for chunk in self._pending])
+            self.columns = {name: np.concatenate([chunk[name] for chunk in chunks])
+                            for name in self.columns}
+            self.tag_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+            self._pending = []
+        return self.columns
+
+    def column(self, name: str) -> np.ndarray:
+        """ returns the raw array for a column
+        integer columns use MISSING for absent values, interned columns hold codes """
+        return self.consolidated()[name]
+
+    def values(self, name: str) -> list:
+        """ returns a column as a list of plain Python values, as the
+        equivalent Revision attributes would hold them """
+        if name == "":
+            raise KeyError(name)
+        columns = self.consolidated()
+        if name in INT_COLUMNS:
+            return [None if value == MISSING else value for value in columns[name].tolist()]
+        if name in STRING_COLUMNS:
+            strings = self.pools[name].strings
+            return [None if code == MISSING else strings[code]
+                    for code in columns[name].tolist()]
+        if name == "timestamp":
+            return format_timestamps(columns["timestamp"])
+        if name == "tags":
+            return self.tag_lists()
+        if name in ("minor", "comment"):
+            return columns[name].tolist()
+        return [None] * len(self)
+
+    def tag_lists(self) -> list[list[str]]:
+        """ returns each row's tags as a list of strings """
+        strings = self.pools["tags"].strings
+        codes = self.column("tags").tolist()
+        offsets = self.tag_offsets.tolist()
+        return [[strings[code] for code in codes[offsets[i]:offsets[i + 1]]]
+                for i in range(len(self))]
+
+    def tag_mask(self, tags) -> np.ndarray:
+        """ boolean mask of rows carrying every one of the given tags """
+        mask = np.ones(len(self), dtype=bool)
+        codes = self.column("tags")
+        row_of_code = np.repeat(np.arange(len(self)), np.diff(self.tag_offsets))
+        for tag in set(tags):
+            code = self.pools["tags"].codes.get(tag)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            has_tag = np.zeros(len(self), dtype=bool)
+            has_tag[row_of_code[codes == code]] = True
+            mask &= has_tag
+        return mask
+
+    def value_counts(self, name: str) -> Counter:
+        """ counts how many rows hold each value of an interned string column """
+        codes = self.column(name)
+        counts = np.bincount(codes[codes != MISSING], minlength=len(self.pools[name].strings))
+        strings = self.pools[name].strings
+        return Counter({strings[code]: int(count)
+                        for code, count in enumerate(counts.tolist()) if count})
+
+    def select(self, index):
+        """ returns a new table holding the rows picked out by a boolean mask
+        or an array of row positions, in that order """
+        columns = self.consolidated()
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        table = RevisionTable(self.pools)
+        table.columns = {name: column[index] for name, column in columns.items()
+                         if name != "tags"}
+        lengths = np.diff(self.tag_offsets)[index]
+        starts = self.tag_offsets[:-1][index]
+        new_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        flat = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1] - starts, lengths)
+        table.columns["tags"] = columns["tags"][flat]
+        table.tag_offsets = new_offsets
+        table._length = len(index) # pylint: disable=protected-access
+        return table
+
+    def sorted_by_time(self, newest_first: bool = False):
+        """ returns a new table with the rows in timestamp order
+        rows with equal timestamps keep their relative order """
+        seconds = self.column("timestamp").astype(np.int64)
+        return self.select(np.argsort(-seconds if newest_first else seconds, kind="stable"))
+
+    def split_by(self, name: str) -> dict:
+        """ splits the table on an interned string column, returning a dict
+        of each value to a table of its rows, which keep their order """
+        codes = self.column(name)
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        pool = self.pools[name]
+        return {pool.lookup(int(codes[rows[0]])): self.select(rows)
+                for rows in np.split(order, boundaries) if len(rows)}
+
+    def iter_json(self):
+        """ yields each row as a dict shaped like the API's revision JSON """
+        columns = self.consolidated()
+        lists = {name: self.values(name) for name in FIELDS}
+        extras = columns["extra"].tolist()
+        for i in range(len(self)):
+            row = {}
+            for name in FIELDS:
+                value = lists[name][i]
+                if value is not None:
+                    row[name] = value
+            if extras[i]:
+                row |= extras[i]
+            yield row
+
+    def row_json(self, i: int) -> dict:
+        """ returns a single row as a dict shaped like the API's revision JSON """
+        return next(self.select([i]).iter_json())
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(np.arange(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("revision index out of range")
+        return Revision(self.row_json(index))
+
+    def __iter__(self):
+        for row in self.iter_json():
+            yield Revision(row)
@@ -0,0 +1,159 @@
+""" Paces every request this process sends to the MediaWiki API.
+All upstream calls take a token from one shared token bucket before they go
+out, so a keyword search fanning out into hundreds of diff requests cannot
+flood the API. Requests wait in priority lanes: while an INTERACTIVE request
+(a history page someone is looking at) is waiting, BULK work (keyword diff
+scans, bulk histories) does not take tokens. When the API says it is
+throttling us or its replicas are lagging, the whole bucket pauses for as
+long as it asks, rather than every thread retrying on its own.
+
+The lane a request waits in is taken from the calling context; wrap bulk
+work in `with in_lane(BULK):`. Time spent waiting is recorded per lane.
+"""
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = ("interactive", "bulk")
+
+RATE = 10.0         # requests per second, on average; None for no limit
+BURST = 20          # requests which may go out at once after a quiet spell
+PRIORITY_POLL = 0.05  # seconds between checks while a higher lane is waiting
+
+current_lane = contextvars.ContextVar("current_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def in_lane(lane: int):
+    """ sends upstream requests made inside the block through the given lane """
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class LaneStats:
+    """ how many requests went through a lane and how long they waited """
+
+    def __init__(self):
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        """ counts one request which waited wait seconds for a token """
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> dict:
+        """ returns the counts, with the mean wait, as a JSON-ready dict """
+        return {"requests": self.requests,
+                "total_wait": round(self.total_wait, 6),
+                "mean_wait": round(self.total_wait / self.requests, 6) if self.requests else 0.0,
+                "max_wait": round(self.max_wait, 6)}
+
+
+class Scheduler:
+    """ a token bucket with priority lanes and a shared pause """
+
+    def __init__(self, rate: float = RATE, burst: int = BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.waiting = [0] * len(LANE_NAMES)
+        self.lanes = [LaneStats() for _ in LANE_NAMES]
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float = None, burst: int = None):
+        """ changes the rate limit; a rate of 0 removes it """
+        with self._lock:
+            if rate is not None:
+                self.rate = rate or None
+            if burst is not None:
+                self.burst = burst
+                self.tokens = min(self.tokens, float(burst))
+
+    def backoff(self, seconds: float):
+        """ pauses every lane for seconds, because the API asked us to slow down """
+        with self._lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def try_take(self, lane: int) -> float:
+        """ takes a token for lane if one is free, returning 0, or else
+        returns how many seconds to wait before trying again """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if any(self.waiting[:lane]):
+                return PRIORITY_POLL
+            if not self.rate:
+                return 0.0
+            self.tokens = min(float(self.burst),
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def _enter(self, lane: int):
+        with self._lock:
+            self.waiting[lane] += 1
+
+    def _leave(self, lane: int, wait: float):
+        with self._lock:
+            self.waiting[lane] -= 1
+            self.lanes[lane].record(wait)
+
+    def acquire(self, lane: int = None) -> float:
+        """ blocks until a request in lane may go out; returns the seconds waited """
+        lane = current_lane.get() if lane is None else lane
+        start = time.monotonic()
+        self._enter(lane)
+        try:
+            delay = self.try_take(lane)
+            while delay > 0:
+                time.sleep(delay)
+                delay = self.try_take(lane)
+        finally:
+            wait = time.monotonic() - start
+            self._leave(lane, wait)
+        return wait
+
+    async def acquire_async(self, lane: int = None) -> float:
+        """ acquire() for coroutines: sleeps without blocking the event loop """
+        lane = current_lane.get() if lane is None else lane
+        start = time.monotonic()
+        self._enter(lane)
+        try:
+            delay = self.try_take(lane)
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self.try_take(lane)
+        finally:
+            wait = time.monotonic() - start
+            self._leave(lane, wait)
+        return wait
+
+    def stats(self) -> dict:
+        """ returns per-lane request counts and queue waits, as a JSON-ready dict """
+        with self._lock:
+            lanes = {}
+            for name, lane, waiting in zip(LANE_NAMES, self.lanes, self.waiting):
+                lanes[name] = lane.as_dict() | {"waiting": waiting}
+            return {"rate": self.rate, "burst": self.burst,
+                    "throttled": self.throttled, "lanes": lanes}
+
+
+scheduler = Scheduler()
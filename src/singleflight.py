@@ -0,0 +1,63 @@
+""" Collapses concurrent identical work into a single call.
+When several threads ask for the same thing at once (the same history
+query, or the same revision's content), only the first one does the work;
+the rest wait for it and receive its result, or its exception. Once the
+call finishes the key is forgotten, so later callers go through the caches
+as usual rather than reusing a stale result from here.
+"""
+import threading
+
+
+class Flight:
+    """ one in-progress call and the outcome shared with its waiters """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """ runs at most one call per key at a time, sharing its outcome """
+
+    def __init__(self):
+        self._flights: dict = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """ calls func(*args, **kwargs) unless a call for key is already in
+        progress, in which case waits for that call and returns its result
+        (or raises its exception) instead """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self._flights[key] = flight
+            else:
+                flight.waiters += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = func(*args, **kwargs)
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def in_flight(self) -> int:
+        """ number of keys with a call in progress """
+        with self._lock:
+            return len(self._flights)
+
+
+history_flights = SingleFlight()   # keyed by a history's normalized query
+revision_flights = SingleFlight()  # keyed by revision cache key (content, diff, wikitext)
@@ -0,0 +1,220 @@
+""" Process-wide HTTP client for all MediaWiki API traffic.
+Every module in src/ should go through get() rather than building its own
+requests.Session, so that TCP and TLS connections are pooled and reused
+across page fetches, content fetches and diffs. Requests go to URL, which
+is English Wikipedia unless WIKIWATCHER_API_URL names another MediaWiki API
+(such as the stand-in in benchmarks/replay_server.py).
+
+Coroutines use aget() instead, with an httpx.AsyncClient from
+make_async_client(). An AsyncClient belongs to the event loop it was first
+used on, so callers open one per loop (typically one per fetch or per
+request) rather than sharing a process-wide instance.
+
+Both record each call's bytes and timings in metrics, and both go
+through the shared scheduler, which paces requests and pauses
+them all when the API answers 429, 503 or a maxlag error. Every request
+carries maxlag, so the API refuses us rather than adding load while its
+database replicas are behind.
+"""
+import os
+import time
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from src import metrics
+    from src.scheduler import scheduler
+    from src.exceptions import UpstreamUnavailableException
+except ModuleNotFoundError:
+    import metrics
+    from scheduler import scheduler
+    from exceptions import UpstreamUnavailableException
+
+DEFAULT_URL = "https://www.wikipedia.org/w/api.php"
+URL = os.environ.get("WIKIWATCHER_API_URL", DEFAULT_URL)
+
+POOL_SIZE = 20          # keep-alive connections kept open per host
+TIMEOUT = (3.05, 30)    # (connect, read) seconds
+RETRIES = 3
+BACKOFF_FACTOR = 0.5    # sleeps 0.5s, 1s, 2s, ... between retries
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)  # answers which pause all traffic, not just the retry
+MAXLAG = 5              # seconds of replica lag at which the API should refuse us
+USER_AGENT = "WikiWatcher (https://github.com/wikiwatchers/WikiWatcher)"
+
+# the shared session lives as long as the process: it is built on first use
+# and only replaced by configure(), which closes the one it replaces
+SESSION: requests.Session = None
+_session_lock = threading.Lock()
+
+
+def make_session(pool_size: int = POOL_SIZE, retries: int = RETRIES,
+                 backoff_factor: float = BACKOFF_FACTOR) -> requests.Session:
+    """ builds a requests.Session with a pooled adapter mounted which retries
+    connection errors; error statuses are retried by get(), through the scheduler """
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status=0,
+                  allowed_methods=("GET",), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def get_session() -> requests.Session:
+    """ returns the shared session, creating it on first use """
+    global SESSION # pylint: disable=global-statement
+    if SESSION is None:
+        with _session_lock:
+            if SESSION is None:
+                SESSION = make_session()
+    return SESSION
+
+
+def configure(pool_size: int = None, timeout=None, retries: int = None,
+              backoff_factor: float = None, url: str = None):
+    """ changes client settings; the shared session is rebuilt on next use """
+    global SESSION, POOL_SIZE, TIMEOUT, RETRIES, BACKOFF_FACTOR, URL # pylint: disable=global-statement
+    with _session_lock:
+        if url is not None:
+            URL = url
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if timeout is not None:
+            TIMEOUT = timeout
+        if retries is not None:
+            RETRIES = retries
+        if backoff_factor is not None:
+            BACKOFF_FACTOR = backoff_factor
+        old_session = SESSION
+        SESSION = make_session(POOL_SIZE, RETRIES, BACKOFF_FACTOR)
+    if old_session is not None:
+        old_session.close()
+
+
+def with_maxlag(params: dict) -> dict:
+    """ drops unset parameters and adds maxlag, unless the caller chose one """
+    return {"maxlag": MAXLAG} | {key: value for key, value in params.items()
+                                 if value is not None}
+
+
+def decode(status: int, response) -> dict:
+    """ the JSON body of a response, or None for an error status """
+    if status in RETRY_STATUSES:
+        return None
+    with metrics.timed("json"):
+        return response.json()
+
+
+def is_lagged(body: dict) -> bool:
+    """ whether a response body is the API refusing us because of maxlag """
+    return isinstance(body, dict) and \
+        isinstance(body.get("error"), dict) and body["error"].get("code") == "maxlag"
+
+
+def throttle_delay(status: int, body: dict, headers, attempt: int) -> float:
+    """ seconds all upstream traffic should pause for when a response says
+    the API is throttling us or lagging, or None if it does not """
+    if status in THROTTLE_STATUSES or is_lagged(body):
+        return retry_delay(attempt, headers.get("Retry-After"))
+    return None
+
+
+def last_answer(status: int, body: dict) -> dict:
+    """ returns the body of the response to the last retry, or raises
+    UpstreamUnavailableException if it is still an error status or a maxlag
+    error, which would otherwise be taken for an empty page of results """
+    if body is None or is_lagged(body):
+        raise UpstreamUnavailableException(
+            f"Wikipedia's API did not answer after {RETRIES + 1} attempts "
+            f"(last status {status}); try again shortly")
+    return body
+
+
+def get(params: dict, timeout=None, lane: int = None) -> dict:
+    """ sends a GET request to the MediaWiki API and returns the decoded JSON body
+    waits for the scheduler first, in lane (by default the caller's current lane);
+    RETRY_STATUSES responses and maxlag errors are retried up to RETRIES times,
+    after which UpstreamUnavailableException is raised """
+    params = with_maxlag(params)
+    attempt = 0
+    while True:
+        metrics.record_time("queue", scheduler.acquire(lane))
+        start = time.perf_counter()
+        response = get_session().get(url=URL, params=params, timeout=timeout or TIMEOUT)
+        metrics.record_upstream_call(len(response.content), time.perf_counter() - start)
+        body = decode(response.status_code, response)
+        if attempt >= RETRIES:
+            return last_answer(response.status_code, body)
+        pause = throttle_delay(response.status_code, body, response.headers, attempt)
+        if pause is not None:
+            scheduler.backoff(pause)
+        elif body is not None:
+            return body
+        else:
+            time.sleep(retry_delay(attempt))
+        attempt += 1
+
+
+def make_async_client(pool_size: int = None, timeout=None):
+    """ builds an httpx.AsyncClient with the same pool size, timeout and
+    User-Agent as the blocking session; use it as an async context manager """
+    import httpx # pylint: disable=import-outside-toplevel
+    pool_size = pool_size or POOL_SIZE
+    timeout = timeout or TIMEOUT
+    if isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+    return httpx.AsyncClient(
+        timeout=timeout, headers={"User-Agent": USER_AGENT},
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+
+def retry_delay(attempt: int, retry_after: str = None) -> float:
+    """ seconds to wait before retry number attempt (counting from 0),
+    honouring a Retry-After header given in seconds """
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return BACKOFF_FACTOR * (2 ** attempt)
+
+
+async def aget(params: dict, client, timeout=None, lane: int = None) -> dict:
+    """ asynchronous get(): sends a GET request to the MediaWiki API through
+    an AsyncClient and returns the decoded JSON body
+    connection errors, RETRY_STATUSES responses and maxlag errors are retried
+    up to RETRIES times, with the same backoff and scheduling as get() """
+    import httpx # pylint: disable=import-outside-toplevel
+    params = with_maxlag(params)
+    if isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+    request_args = {} if timeout is None else {"timeout": timeout}
+    attempt = 0
+    while True:
+        metrics.record_time("queue", await scheduler.acquire_async(lane))
+        start = time.perf_counter()
+        try:
+            response = await client.get(URL, params=params, **request_args)
+            metrics.record_upstream_call(len(response.content), time.perf_counter() - start)
+        except httpx.TransportError:
+            if attempt >= RETRIES:
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+            attempt += 1
+            continue
+        body = decode(response.status_code, response)
+        if attempt >= RETRIES:
+            return last_answer(response.status_code, body)
+        pause = throttle_delay(response.status_code, body, response.headers, attempt)
+        if pause is not None:
+            scheduler.backoff(pause)
+        elif body is not None:
+            return body
+        else:
+            await asyncio.sleep(retry_delay(attempt))
+        attempt += 1
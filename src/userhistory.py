@@ -1,58 +1,154 @@
 """defines user history class"""
-import requests
+import json
 try:
-    from revision import Revision, URL
-    from history import History
-    from exceptions import NoRevisionsException, BadRequestException
-except ModuleNotFoundError:
-    from src.revision import Revision, URL
+    from src.revisiontable import RevisionTable
+    from src.filters import TitlePredicate, TagPredicate, MinorPredicate, normalize_title
     from src.history import History
     from src.exceptions import NoRevisionsException, BadRequestException
+except ModuleNotFoundError:
+    from revisiontable import RevisionTable
+    from filters import TitlePredicate, TagPredicate, MinorPredicate, normalize_title
+    from history import History
+    from exceptions import NoRevisionsException, BadRequestException
+
+USERS_PER_REQUEST = 50  # most users the API accepts in one ucuser parameter
+MAX_COHORT_USERS = 500  # most users one MultiUserHistory may list
 
 class UserHistory(History):
     """ UserHistory object parses json user contributions """
+    limit_param = "uclimit"
+    continue_param = "uccontinue"
     def __init__(self, user, startyear=None, startmonth=None, startday=None,
                 starthour=None, startminute=None, startsecond=None,
                 endyear=None, endmonth=None, endday=None, endhour=None,
-                endminute=None, endsecond=None, tags=None, titles=None, keyword=None):
+                endminute=None, endsecond=None, tags=None, titles=None, keyword=None,
+                minor=None, min_size=None, max_size=None, comment=None, namespace=None,
+                newest_first=False, fetch=True):
         super().init_to_none()
         self.init_to_none()
         super().__init__(titles, user, keyword, tags, startyear, startmonth, startday,
                          starthour, startminute, startsecond, endyear, endmonth, endday,
-                         endhour, endminute, endsecond)
-        self.fill_revisions()
+                         endhour, endminute, endsecond, minor, min_size, max_size, comment,
+                         newest_first)
+        self.namespace = namespace
+        if fetch:
+            self.fill_revisions()
 
     def init_to_none(self):
         """ Sets up class data members and initializes them to None """
         self.user: str = None
+        self.namespace: int = None
 
-    def call_wikipedia_api(self):
-        """ Pulls down user's edit history from Wikipedia API """
-        session = requests.Session()
+    def query_key(self):
+        """ adds the namespace filter to the base class query key """
+        return super().query_key() | {"namespace": self.namespace}
 
-        params = {
+    def filter_pipeline(self):
+        """ adds the article title filter, which the API cannot apply
+        to a user's contributions, to the base class filters """
+        pipeline = super().filter_pipeline()
+        if self.titles is not None:
+            pipeline.add(TitlePredicate(self.titles))
+        return pipeline
+
+    def push_down(self, predicate):
+        """ list=usercontribs can filter by a single tag (uctag)
+        and by the minor flag (ucshow) """
+        if isinstance(predicate, TagPredicate):
+            tag, residual = predicate.split()
+            if tag is not None:
+                return {"uctag": tag}, residual
+        if isinstance(predicate, MinorPredicate):
+            return {"ucshow": "minor" if predicate.minor else "!minor"}, None
+        return None, predicate
+
+    def user_params(self):
+        """ parameters choosing whose contributions are listed """
+        if self.user is None:
+            raise BadRequestException("User name missing")
+        return {"ucuser": self.user}
+
+    def listing_params(self, user_params: dict) -> dict:
+        """ parameters listing the contributions of the users chosen by user_params """
+        return {
             "list": "usercontribs",
             "ucprop": "comment|ids|title|flags|size|tags|timestamp|user|userid",
-            "ucuser": self.user,
-            "ucstart": self.rvstart, # pylint: disable=access-member-before-definition
-            "ucend" : self.rvend,
-            "ucdir": "newer",
+            "ucnamespace": self.namespace,
             "uclimit": "500"
-        } | self.base_params
-        if self.user is None:
-            raise BadRequestException("User name missing")
+        } | user_params \
+          | dict(zip(("ucstart", "ucend", "ucdir"), self.direction_params())) \
+          | self.base_params | self.plan_query()[0]
 
-        request = session.get(url=URL, params=params)
-        data = request.json()
+    def revision_params(self):
+        """ parameters requesting a user's edit history from the API """
+        return self.listing_params(self.user_params())
 
+    def batch_from_page(self, data):
+        """ reads one page of a user's contributions """
         try:
-            self.json = data["query"]["usercontribs"]
-            for each_revision in self.json:
-                self.revisions.append(Revision(each_revision))
-            if not data.get("continue") is None:
-                wp_continue_timestamp_and_id = data["continue"]["uccontinue"]
-                separator_index = wp_continue_timestamp_and_id.index("|")
-                self.rvstart = wp_continue_timestamp_and_id[:separator_index]
-                self.call_wikipedia_api()
-        except BadRequestException:
+            return RevisionTable.from_json(data["query"]["usercontribs"])
+        except KeyError:
             print("Data not found")
+            return None
+
+
+class MultiUserHistory(UserHistory):
+    """ the contributions of a cohort of users, listed together in time order
+    users are requested USERS_PER_REQUEST at a time, and a user_prefix lists
+    everyone whose user name starts with it in a single listing.
+    takes the same filters as UserHistory """
+    def __init__(self, users=None, user_prefix=None, fetch=True, **filters):
+        super().__init__(None, fetch=False, **filters)
+        if (users is None) == (user_prefix is None):
+            raise BadRequestException("give either a list of users or a user name prefix")
+        if isinstance(users, str):
+            users = users.split("|")
+        if users is not None:
+            self.users = [user for user in users if user]
+            if not self.users or len(self.users) > MAX_COHORT_USERS:
+                raise BadRequestException(f"give between 1 and {MAX_COHORT_USERS} users")
+        self.user_prefix = user_prefix
+        if fetch:
+            self.fill_revisions()
+
+    def init_to_none(self):
+        """ Sets up class data members and initializes them to None """
+        super().init_to_none()
+        self.users: list[str] = None
+        self.user_prefix: str = None
+
+    def query_key(self):
+        """ adds the cohort, in a normalized order, to the base class query key """
+        users = sorted({normalize_title(user) for user in self.users}) if self.users else None
+        return super().query_key() | {"users": users, "user_prefix": self.user_prefix}
+
+    def user_params(self):
+        """ chooses every user in the cohort, or every user matching the prefix
+        a single listing holds at most USERS_PER_REQUEST users """
+        if self.user_prefix is not None:
+            return {"ucuserprefix": self.user_prefix}
+        if len(self.users) > USERS_PER_REQUEST:
+            raise BadRequestException(
+                f"only {USERS_PER_REQUEST} users can be listed a page at a time")
+        return {"ucuser": "|".join(self.users)}
+
+    def revision_param_sets(self):
+        """ one listing per USERS_PER_REQUEST users """
+        if self.user_prefix is not None or len(self.users) <= USERS_PER_REQUEST:
+            return [self.revision_params()]
+        return [self.listing_params({"ucuser": "|".join(self.users[i:i + USERS_PER_REQUEST])})
+                for i in range(0, len(self.users), USERS_PER_REQUEST)]
+
+    def per_user(self) -> dict:
+        """ splits the revisions by user, returning a dict of user name to
+        RevisionTable; every requested user is present, even with no revisions """
+        tables = self.revisions.split_by("user") if self.revisions is not None else {}
+        tables.pop(None, None)
+        for user in self.users or []:
+            tables.setdefault(normalize_title(user), RevisionTable())
+        return dict(sorted(tables.items()))
+
+    def revisions_by_user_as_json(self) -> str:
+        """ returns a JSON object mapping each user name to a list of their revisions """
+        return json.dumps({user: list(table.iter_json())
+                           for user, table in self.per_user().items()})
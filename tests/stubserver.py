@@ -0,0 +1,81 @@
+"""A local stand-in for the MediaWiki API, for tests which go over real HTTP"""
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+class StubServer:
+    """serves canned API responses on 127.0.0.1 from a background thread
+    respond is called with each request's query parameters and returns
+    either a JSON body or a tuple of (status, body, headers)
+    benchmarks/replay_server.py serves its stand-in API through one too,
+    on a fixed port and without keeping every request"""
+    def __init__(self, respond, port=0, keep_requests=True):
+        self.respond = respond
+        self.requests = []
+        self.keep_requests = keep_requests
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """hands every GET to the stub's respond function"""
+            def do_GET(self): # pylint: disable=invalid-name
+                """answers one request"""
+                params = dict(parse_qsl(urlparse(self.path).query))
+                if stub.keep_requests:
+                    stub.requests.append(params)
+                reply = stub.respond(params)
+                status, body, headers = reply if isinstance(reply, tuple) \
+                    else (200, reply, {})
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args): # pylint: disable=arguments-differ
+                """keeps test output quiet"""
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """the stub's API endpoint"""
+        return f"http://127.0.0.1:{self.server.server_port}/w/api.php"
+
+    def start(self):
+        """starts serving from the background thread"""
+        self.thread.start()
+        return self
+
+    def close(self):
+        """stops serving and releases the port"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def usercontribs_pages(user, pages, per_page):
+    """returns a respond function serving pages of a user's contributions,
+    chained together by uccontinue"""
+    def respond(params):
+        page = int(params.get("uccontinue", 0))
+        contribs = [{"user": params.get("ucuser", user), "userid": 1,
+                     "revid": page * per_page + i + 1, "parentid": 0,
+                     "pageid": 7, "title": "Stub", "ns": 0,
+                     "timestamp": f"2023-01-0{page + 1}T00:00:0{i}Z",
+                     "minor": False, "size": 100 + i, "comment": "edit",
+                     "tags": []} for i in range(per_page)]
+        body = {"batchcomplete": True, "query": {"usercontribs": contribs}}
+        if page + 1 < pages:
+            body["continue"] = {"uccontinue": str(page + 1), "continue": "-||"}
+        return body
+    return respond
@@ -0,0 +1,197 @@
+"""tests for the Flask app"""
+import __init__
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import pytest
+from tests.stubserver import StubServer, usercontribs_pages
+try:
+    from src import upstream, revision
+    from src.cache import TieredCache, LRUCache
+except ModuleNotFoundError:
+    import upstream
+    import revision
+    from cache import TieredCache, LRUCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.environ.setdefault("WIKIWATCHER_RESPONSE_CACHE_DIR", tempfile.mkdtemp())
+
+@pytest.fixture(autouse=True)
+def empty_response_cache():
+    """every test starts with a cold response cache"""
+    from app import mem_cache # pylint: disable=import-outside-toplevel
+    mem_cache.clear()
+
+def test_app_import_defers_heavy_packages():
+    """importing app must not load charting, parsing or markdown libraries"""
+    probe = ("import sys, app; print(','.join(name for name in "
+             "('matplotlib', 'mwparserfromhell', 'markdown', 'dateutil') "
+             "if name in sys.modules))")
+    completed = subprocess.run([sys.executable, "-c", probe], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    assert completed.stdout.strip() == ""
+
+def test_async_user_history_route(monkeypatch):
+    """the async route serves the same JSON as the blocking one"""
+    from app import app # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    with StubServer(usercontribs_pages("QuicoleJR", pages=2, per_page=3)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        async_response = client.get("/async/userHistory/QuicoleJR?minsize=101")
+        blocking_response = client.get("/userHistory/QuicoleJR?minsize=101")
+    assert async_response.status_code == 200
+    assert async_response.data == blocking_response.data
+    assert async_response.data.count(b'"revid"') == 4
+    assert client.get("/async/userHistory/QuicoleJR?minor=perhaps").status_code == 400
+
+def test_streamed_listing_formats(monkeypatch):
+    """format=json and format=ndjson stream valid JSON"""
+    from app import app # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    with StubServer(usercontribs_pages("QuicoleJR", pages=2, per_page=3)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        as_json = client.get("/userHistory/QuicoleJR?format=json")
+        assert as_json.is_streamed
+        as_ndjson = client.get("/userHistory/QuicoleJR?format=ndjson&minsize=101")
+        async_ndjson = client.get("/async/userHistory/QuicoleJR?format=ndjson&minsize=101")
+        missing = client.get("/userHistory/QuicoleJR?format=json&minsize=500")
+        for response in (as_json, as_ndjson, async_ndjson):
+            response.get_data()  # streamed bodies are read lazily
+    assert as_json.mimetype == "application/json"
+    assert [row["revid"] for row in json.loads(as_json.data)] == [1, 2, 3, 4, 5, 6]
+    assert as_ndjson.mimetype == "application/x-ndjson"
+    lines = as_ndjson.data.decode("utf-8").splitlines()
+    assert [json.loads(line)["revid"] for line in lines] == [2, 3, 5, 6]
+    assert async_ndjson.data == as_ndjson.data
+    assert missing.status_code == 404
+    assert client.get("/userHistory/QuicoleJR?format=xml").status_code == 400
+
+def test_limited_listing_links_next_page(monkeypatch):
+    """limit returns one page and the Link header resumes mid-way through
+    an upstream page"""
+    from app import app # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    with StubServer(usercontribs_pages("QuicoleJR", pages=2, per_page=3)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        first = client.get("/userHistory/QuicoleJR?limit=2&format=ndjson")
+        first.get_data()
+        next_url = first.headers["Link"].split(">")[0][1:]
+        second = client.get(next_url)
+        second.get_data()
+        unlimited_cursor = client.get("/userHistory/QuicoleJR?cursor=abc")
+    assert [json.loads(line)["revid"] for line in first.data.splitlines()] == [1, 2]
+    assert first.headers["X-Next-Cursor"] in next_url
+    assert [json.loads(line)["revid"] for line in second.data.splitlines()] == [3, 4]
+    assert unlimited_cursor.status_code == 400
+
+def test_equivalent_queries_share_a_cached_response(monkeypatch):
+    """differently spelled but equivalent queries are answered from one cache entry,
+    which every worker process can read"""
+    from app import app, mem_cache, response_cache_stats # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    with StubServer(usercontribs_pages("QuicoleJR", pages=1, per_page=3)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        before = response_cache_stats.as_dict()
+        first = client.get("/userHistory/QuicoleJR?tags=[a]&startyear=2023&minor=false")
+        second = client.get("/userHistory/quicoleJR?minor=no&startmonth=1&startyear=2023"
+                            "&tags=[a,a]&order=oldest")
+        different = client.get("/userHistory/QuicoleJR?tags=[a]&startyear=2023&minor=false"
+                               "&minsize=102")
+    assert len(stub.requests) == 2
+    assert first.data.count(b'"revid"') == 3
+    assert second.data == first.data
+    assert different.data.count(b'"revid"') == 1
+    after = client.get("/cacheStats").get_json()["responses"]
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 2
+    assert type(mem_cache.cache).__name__ == "FileSystemCache"
+
+ARTICLE_REVISIONS = [(1, "2023-01-01T00:00:00"), (2, "2023-01-10T00:00:00"),
+                     (3, "2023-02-01T00:00:00")]
+
+def article_api(params):
+    """answers single-revision lookups, diffs and parses for a three-revision article"""
+    if params["action"] == "compare":
+        return {"compare": {"*": f"<tr>{params['fromrev']} to {params['torev']}</tr>"}}
+    if params["action"] == "parse":
+        return {"parse": {"text": {"*": f"<p>revision {params['oldid']}</p>"}}}
+    start = params.get("rvstart")
+    if params["rvdir"] == "newer":
+        matches = [rev for rev in ARTICLE_REVISIONS if start is None or rev[1] >= start]
+    else:
+        matches = [rev for rev in ARTICLE_REVISIONS[::-1] if start is None or rev[1] <= start]
+    return {"query": {"pages": [{"pageid": 9, "title": "Cat", "revisions": [
+        {"revid": revid, "timestamp": timestamp + "Z"} for revid, timestamp in matches[:1]]}]}}
+
+def test_compare_revisions_looks_up_two_revisions(monkeypatch):
+    """comparing fetches only the two bounding revisions, their diff and contents"""
+    from app import app # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    monkeypatch.setattr(revision, "revision_cache", TieredCache(LRUCache()))
+    with StubServer(article_api) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        compared = client.get("/compareRevisions/Cat?startyear=2023&startday=5"
+                              "&endyear=2023&endmonth=2&endday=5")
+        lookups = [params for params in stub.requests if params["action"] == "query"]
+        single = client.get("/getRevision/Cat?startyear=2023&startday=5")
+        empty_range = client.get("/compareRevisions/Cat?startyear=2023&startday=11"
+                                 "&endyear=2023&endday=20")
+    assert compared.status_code == 200
+    assert b"2 to 3" in compared.data
+    assert len(lookups) == 2 and all(params["rvlimit"] == "1" for params in lookups)
+    assert {params["rvdir"] for params in lookups} == {"newer", "older"}
+    assert json.loads(single.data) == "<p>revision 2</p>"
+    assert empty_range.status_code == 404
+
+def test_server_timing_and_metrics(monkeypatch):
+    """each response describes its upstream work in Server-Timing, and
+    /metrics adds it up per route"""
+    from app import app # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    with StubServer(usercontribs_pages("QuicoleJR", pages=2, per_page=3)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        fetched = client.get("/async/userHistory/QuicoleJR?minsize=101")
+        cached = client.get("/async/userHistory/QuicoleJR?minsize=101")
+    timing = fetched.headers["Server-Timing"]
+    assert 'desc="2 calls' in timing and "filter;dur=" in timing
+    assert "cache-response-miss" in timing
+    assert 'desc="0 calls' in cached.headers["Server-Timing"]
+    assert "cache-response-hit" in cached.headers["Server-Timing"]
+    exposition = client.get("/metrics").data.decode("utf-8")
+    route = 'route="/async/userHistory/<username>"'
+    assert f"wikiwatcher_upstream_calls_total{{{route}}}" in exposition
+    assert f'wikiwatcher_request_duration_seconds_bucket{{{route},le="+Inf"}}' in exposition
+
+def test_error_responses_are_not_cached(monkeypatch):
+    """a 503 from a busy renderer is not replayed from the response cache"""
+    import app as app_module # pylint: disable=import-outside-toplevel
+    calls = []
+    def busy_renderer(*args):
+        calls.append(args)
+        raise app_module.RenderUnavailableException("too many charts are being drawn")
+    monkeypatch.setattr(app_module, "render_chart", busy_renderer)
+    client = app_module.app.test_client()
+    for _ in range(2):
+        response = client.get("/articleHistory/Cat?visualize=revisions_per_time")
+        assert response.status_code == 503
+    assert len(calls) == 2
+    assert not app_module.is_cacheable(("<h1>No Revisions</h1>", 404))
+    assert app_module.is_cacheable(("[]", 200))
+
+def test_unavailable_upstream_is_a_503(monkeypatch):
+    """when the API keeps failing, routes answer 503 instead of an empty or broken result"""
+    from app import app # pylint: disable=import-outside-toplevel
+    client = app.test_client()
+    monkeypatch.setattr(upstream, "RETRIES", 1)
+    with StubServer(lambda params: (503, {"error": "busy"}, {"Retry-After": "0"})) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        listing = client.get("/userHistory/QuicoleJR")
+        single = client.get("/getRevision/Cat?startyear=2023")
+    assert listing.status_code == 503 and single.status_code == 503
+    assert b"try again shortly" in listing.data
+    assert len(stub.requests) == 4
+
+if __name__ == "__main__":
+    pytest.main([__file__])
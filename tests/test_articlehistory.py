@@ -1,7 +1,15 @@
 """test for article history subclass"""
 import __init__
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pytest
+import articlehistory
 from articlehistory import ArticleHistory
+try:
+    from src import upstream
+except ModuleNotFoundError:
+    import upstream
 from exceptions import BadRequestException, NoRevisionsException
 
 def test___init__():
@@ -106,5 +114,71 @@ def test_filter():
     assert art.keyword is None
 
 
+def test_plan_query_pushes_tags_down(monkeypatch):
+    """one tag is sent to the API as rvtag, the rest are checked locally"""
+    sent_params = []
+    def fake_get(params):
+        sent_params.append(params)
+        return {"query": {"pages": [{"pageid": 1, "title": "Cat", "revisions": [
+            {"revid": 1, "tags": ["mobile edit", "mw-reverted"], "size": 10, "minor": False},
+            {"revid": 2, "tags": ["mobile edit"], "size": 10, "minor": False},
+        ]}]}}
+    monkeypatch.setattr(upstream, "get", fake_get)
+    art = ArticleHistory(titles="Cat", tags=["mw-reverted", "mobile edit"], min_size=5)
+    api_params, pipeline = art.plan_query()
+    assert api_params == {"rvtag": "mobile edit"}
+    assert sorted(type(predicate).__name__ for predicate in pipeline.predicates) == \
+        ["SizeRangePredicate", "TagPredicate"]
+    assert sent_params[0]["rvtag"] == "mobile edit"
+    assert art.revisions.values("revid") == [1]
+
+    with pytest.raises(articlehistory.NoRevisionsException):
+        ArticleHistory(titles="Cat", tags=[""])
+    assert "rvtag" not in sent_params[-1]
+
+
+def test_concurrent_identical_histories_share_one_fetch(monkeypatch):
+    """identical queries arriving together wait on a single paginated fetch"""
+    calls = []
+    started = threading.Event()
+    def fake_get(params):
+        calls.append(params)
+        started.set()
+        time.sleep(0.2)
+        return {"query": {"pages": [{"pageid": 9, "title": "Cat", "revisions": [
+            {"revid": 1, "user": "A", "timestamp": "2023-01-01T00:00:00Z"},
+            {"revid": 2, "user": "B", "timestamp": "2023-01-02T00:00:00Z"}]}]}}
+    monkeypatch.setattr(upstream, "get", fake_get)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        first = pool.submit(ArticleHistory, "cat", startyear=2023)
+        started.wait()
+        others = [pool.submit(ArticleHistory, "Cat", startyear=2023) for _ in range(2)]
+        histories = [first.result()] + [other.result() for other in others]
+    assert len(calls) == 1
+    for history in histories:
+        assert history.pageid == 9
+        assert history.revisions.values("revid") == [1, 2]
+        # rows carry the API's title, not whichever spelling fetched them
+        assert history.revisions.values("title") == ["Cat", "Cat"]
+
+def test_revision_at_requests_one_revision(monkeypatch):
+    """revision_at asks the API for a single revision in the given direction"""
+    sent_params = []
+    def fake_get(params):
+        sent_params.append(params)
+        if params["rvstart"] is None:
+            return {"query": {"pages": [{"pageid": 9, "title": "Cat", "missing": True}]}}
+        return {"query": {"pages": [{"pageid": 9, "title": "Cat", "revisions": [
+            {"revid": 4, "user": "A", "timestamp": "2023-01-01T00:00:00Z"}]}]}}
+    monkeypatch.setattr(upstream, "get", fake_get)
+    revision = ArticleHistory.revision_at("cat", "2023-01-01T00:00:00", "newer")
+    assert (revision.revid, revision.pageid, revision.title) == (4, 9, "Cat")
+    assert sent_params[0]["rvlimit"] == "1"
+    assert sent_params[0]["rvdir"] == "newer"
+    with pytest.raises(articlehistory.NoRevisionsException):
+        ArticleHistory.revision_at("cat")
+    with pytest.raises(articlehistory.BadRequestException):
+        ArticleHistory.revision_at("cat", direction="sideways")
+
 if __name__ == "__main__":
     test_filter_by_keyword()
@@ -0,0 +1,90 @@
+"""Tests for bulk article histories"""
+import __init__
+import pytest
+import bulkhistory
+from bulkhistory import BulkArticleHistory
+try:
+    from src import upstream
+except ModuleNotFoundError:
+    import upstream
+
+def fake_wikipedia(titles_edited, sent_params):
+    """returns a fake upstream.get for articles named Article 0, Article 1, ...
+    where titles_edited maps a title to the timestamp of its latest edit"""
+    def latest(title):
+        if title not in titles_edited:
+            return {"title": title, "missing": True}
+        return {"pageid": int(title.split()[-1]), "title": title,
+                "revisions": [{"revid": 1000, "timestamp": titles_edited[title]}]}
+    def fake_get(params):
+        sent_params.append(dict(params))
+        if params.get("generator") == "categorymembers":
+            members = sorted(titles_edited)
+            start = int(params.get("gcmcontinue", 0))
+            end = start + int(params["gcmlimit"])
+            data = {"query": {"pages": [latest(title) for title in members[start:end]]}}
+            if end < len(members):
+                data["continue"] = {"gcmcontinue": str(end), "continue": "gcmcontinue||"}
+            return data
+        titles = params["titles"].split("|")
+        if len(titles) > 1 or "rvlimit" not in params:
+            return {"query": {"pages": [latest(title) for title in titles]}}
+        page = latest(titles[0])
+        page["revisions"] = [{"revid": 1, "user": "A",
+                              "timestamp": page["revisions"][0]["timestamp"]}]
+        return {"query": {"pages": [page]}}
+    return fake_get
+
+def test_bulk_history_fetches_only_changed_articles(monkeypatch):
+    """latest revisions are looked up 50 titles per request, and only articles
+    edited since the start date get a full history request"""
+    edited = {f"Article {i}": "2022-06-01T00:00:00Z" for i in range(120)}
+    edited["Article 7"] = edited["Article 93"] = "2023-03-01T00:00:00Z"
+    sent_params = []
+    monkeypatch.setattr(upstream, "get", fake_wikipedia(edited, sent_params))
+    titles = "|".join(list(edited) + ["Nonexistent"])
+    bulk = BulkArticleHistory(titles=titles, startyear=2023)
+    lookups = [params for params in sent_params if "rvlimit" not in params]
+    histories = [params for params in sent_params if "rvlimit" in params]
+    assert len(lookups) == 3
+    assert sorted(params["titles"] for params in histories) == ["Article 7", "Article 93"]
+    pages = {page["title"]: page for page in bulk.as_json()["pages"]}
+    assert len(pages) == 121
+    assert pages["Nonexistent"]["missing"] is True
+    assert [rev["revid"] for rev in pages["Article 93"]["revisions"]] == [1]
+    assert pages["Article 0"]["revisions"] == []
+
+def test_bulk_history_by_category(monkeypatch):
+    """category members are listed and followed across continuations"""
+    edited = {f"Article {i}": "2023-03-01T00:00:00Z" for i in range(60)}
+    sent_params = []
+    monkeypatch.setattr(upstream, "get", fake_wikipedia(edited, sent_params))
+    bulk = BulkArticleHistory(category="Cats", startyear=2023)
+    lookups = [params for params in sent_params if params.get("generator")]
+    assert [params["gcmtitle"] for params in lookups] == ["Category:Cats"] * 2
+    assert len(bulk.histories) == 60
+
+def test_bulk_history_without_start_date_is_capped(monkeypatch):
+    """without a start date every article needs its full history, so only
+    BULK_MAX_UNDATED_PAGES articles may be covered, and a larger category is
+    refused before any full history is requested"""
+    edited = {f"Article {i}": "2023-03-01T00:00:00Z" for i in range(60)}
+    sent_params = []
+    monkeypatch.setattr(upstream, "get", fake_wikipedia(edited, sent_params))
+    with pytest.raises(bulkhistory.BadRequestException):
+        BulkArticleHistory(titles="|".join(edited), fetch=False)
+    with pytest.raises(bulkhistory.BadRequestException):
+        BulkArticleHistory(category="Cats")
+    assert not [params for params in sent_params if "rvlimit" in params]
+    bulk = BulkArticleHistory(titles="|".join(list(edited)[:bulkhistory.BULK_MAX_UNDATED_PAGES]))
+    assert len(bulk.histories) == bulkhistory.BULK_MAX_UNDATED_PAGES
+
+def test_bulk_history_needs_titles_or_category():
+    """exactly one of titles and category must be given"""
+    with pytest.raises(bulkhistory.BadRequestException):
+        BulkArticleHistory(fetch=False)
+    with pytest.raises(bulkhistory.BadRequestException):
+        BulkArticleHistory(titles="Cat", category="Cats", fetch=False)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,46 @@
+"""Tests for the revision content and diff caches"""
+import __init__
+import pytest
+from cache import LRUCache, DiskStore, TieredCache, content_key, diff_key
+
+def test_lru_evicts_by_bytes():
+    """oldest entries are dropped once the byte budget is exceeded"""
+    lru = LRUCache(max_bytes=10)
+    lru.set("a", "1234")
+    lru.set("b", "1234")
+    assert lru.get("a") == "1234"  # a is now most recently used
+    lru.set("c", "1234")
+    assert lru.get("b") is None
+    assert lru.get("a") == "1234"
+    assert lru.get("c") == "1234"
+    assert lru.current_bytes == 8
+    lru.set("huge", "x" * 11)
+    assert lru.get("huge") is None
+    assert len(lru) == 2
+
+def test_disk_store_round_trip(tmp_path):
+    """values written to disk are read back by a fresh store"""
+    DiskStore(str(tmp_path)).set(diff_key(1, 2), "<td>diff</td>")
+    assert DiskStore(str(tmp_path)).get(diff_key(1, 2)) == "<td>diff</td>"
+    assert DiskStore(str(tmp_path)).get(diff_key(2, 1)) is None
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    """a disk hit is copied into the memory tier"""
+    disk = DiskStore(str(tmp_path))
+    disk.set(content_key(5), "content")
+    tiered = TieredCache(LRUCache(), disk)
+    assert tiered.memory.get(content_key(5)) is None
+    assert tiered.get(content_key(5)) == "content"
+    assert tiered.memory.get(content_key(5)) == "content"
+
+def test_tiered_cache_counts_hits_and_misses():
+    """every lookup is counted as a hit or a miss"""
+    tiered = TieredCache(LRUCache())
+    tiered.get(content_key(1))
+    tiered.set(content_key(1), "content")
+    tiered.get(content_key(1))
+    tiered.get(content_key(1))
+    assert tiered.stats.as_dict() == {"hits": 2, "misses": 1, "hit_ratio": 2 / 3}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,113 @@
+"""Tests for revision filter predicates and the filter pipeline"""
+import __init__
+import pytest
+try:
+    from src import revision as revision_module
+    from src.revision import Revision
+    from src.cache import TieredCache, LRUCache
+    from src.revisiontable import RevisionTable
+    from src.filters import (FilterPipeline, TagPredicate, TitlePredicate,
+                             SizeRangePredicate, MinorPredicate, CommentPredicate,
+                             KeywordPredicate)
+except ModuleNotFoundError:
+    import revision as revision_module
+    from revision import Revision
+    from cache import TieredCache, LRUCache
+    from revisiontable import RevisionTable
+    from filters import (FilterPipeline, TagPredicate, TitlePredicate,
+                         SizeRangePredicate, MinorPredicate, CommentPredicate,
+                         KeywordPredicate)
+
+def make_table():
+    """ten revisions with varied users, sizes, flags, tags and comments"""
+    return RevisionTable.from_json([
+        {"revid": i, "user": "Even" if i % 2 == 0 else "Odd", "title": "Cat",
+         "size": 100 * i, "minor": i % 3 == 0, "comment": f"edit {i}",
+         "tags": ["mobile edit"] if i < 5 else ["mw-reverted", "mobile edit"]}
+        for i in range(10)])
+
+def test_local_predicates():
+    """each cheap predicate picks out the expected rows"""
+    table = make_table()
+    assert TagPredicate(["mw-reverted"]).mask(table).sum() == 5
+    assert TitlePredicate("cat").mask(table).all()
+    assert TitlePredicate("Dog").mask(table).sum() == 0
+    assert SizeRangePredicate(200, 400).mask(table).sum() == 3
+    assert SizeRangePredicate(max_size=100).mask(table).sum() == 2
+    assert MinorPredicate(True).mask(table).sum() == 4
+    assert CommentPredicate(r"edit [78]$").mask(table).sum() == 2
+
+def test_pipeline_runs_keyword_last(monkeypatch):
+    """the keyword diff fetch only happens for rows surviving the cheap filters"""
+    checked = []
+    def fake_contains_keyword(self, keyword): # pylint: disable=unused-argument
+        checked.append(self.revid)
+        return True
+    monkeypatch.setattr(Revision, "contains_keyword", fake_contains_keyword)
+    pipeline = FilterPipeline([KeywordPredicate("cat", max_in_flight=1),
+                               TagPredicate(["mw-reverted"]),
+                               CommentPredicate(r"[02468]$")])
+    assert [type(predicate) for predicate in pipeline.predicates][-1] is KeywordPredicate
+    result = pipeline.apply(make_table())
+    assert result.values("revid") == [6, 8]
+    assert checked == [6, 8]
+
+def test_keyword_skips_diffs_where_no_text_has_the_keyword(monkeypatch):
+    """revisions whose own and parent's wikitext lack the keyword are ruled out
+    from one batched content request, without fetching their diffs"""
+    texts = {1: "a cat", 2: "a cat sat", 3: "a dog sat", 4: "a dog", 5: "a dog ran"}
+    requested = []
+    def fake_get(params):
+        requested.append(params["revids"])
+        return {"query": {"pages": [{"revisions": [
+            {"revid": int(revid), "slots": {"main": {"content": texts[int(revid)]}}}
+            for revid in params["revids"].split("|")]}]}}
+    checked = []
+    def fake_contains_keyword(self, keyword): # pylint: disable=unused-argument
+        checked.append(self.revid)
+        return True
+    monkeypatch.setattr(revision_module.upstream, "get", fake_get)
+    monkeypatch.setattr(revision_module, "revision_cache", TieredCache(LRUCache()))
+    monkeypatch.setattr(Revision, "contains_keyword", fake_contains_keyword)
+    table = RevisionTable.from_json([{"revid": revid, "parentid": revid - 1}
+                                     for revid in range(2, 6)] + [{"revid": 9, "parentid": 0}])
+    result = FilterPipeline([KeywordPredicate("cat", max_in_flight=1)]).apply(table)
+    assert requested == ["1|2|3|4|5"]
+    assert checked == [2, 3, 9]
+    assert result.values("revid") == [2, 3, 9]
+
+def test_pipeline_narrow():
+    """narrow gives the passing rows and their positions in the original table"""
+    pipeline = FilterPipeline([CommentPredicate(r"[13579]$"), SizeRangePredicate(min_size=300)])
+    narrowed, positions = pipeline.narrow(make_table())
+    assert positions.tolist() == [3, 5, 7, 9]
+    assert narrowed.values("revid") == [3, 5, 7, 9]
+    assert pipeline.apply(make_table()).values("revid") == [3, 5, 7, 9]
+
+def test_pipeline_first_stops_checking_diffs_once_full(monkeypatch):
+    """first only fetches diffs for about count rows, and says where it stopped"""
+    checked = []
+    def fake_contains_keyword(self, keyword): # pylint: disable=unused-argument
+        checked.append(self.revid)
+        return self.revid % 3 == 0
+    monkeypatch.setattr(Revision, "contains_keyword", fake_contains_keyword)
+    pipeline = FilterPipeline([KeywordPredicate("cat", max_in_flight=1),
+                               CommentPredicate(r"[02468]$")])
+    positions, examined = pipeline.first(make_table(), 1)
+    assert positions.tolist() == [0] and examined == 1
+    assert checked == [0]
+    checked.clear()
+    positions, examined = pipeline.first(make_table(), 2)
+    assert positions.tolist() == [0, 6] and examined == 7
+    assert checked == [0, 2, 4, 6]
+    positions, examined = FilterPipeline([CommentPredicate(r"[13579]$")]).first(make_table(), 10)
+    assert positions.tolist() == [1, 3, 5, 7, 9] and examined == 10
+
+def test_contains_tag_subset():
+    """contains_tag requires every listed tag"""
+    rev = Revision({"tags": ["a", "b"]})
+    assert rev.contains_tag(frozenset(["a"]))
+    assert not rev.contains_tag(["a", "c"])
+
+if __name__ == "__main__":
+    pytest.main([__file__])
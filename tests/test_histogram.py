@@ -4,12 +4,18 @@ import numpy as np
 import matplotlib.dates as mdates
 try:
     from src.plot import Plot
+    from src.history import History
     from src.articlehistory import ArticleHistory
     from src.histogram import Histogram
+    from src.revisiontable import RevisionTable
+    from src.exceptions import BadRequestException
 except ModuleNotFoundError:
     from plot import Plot
+    from history import History
     from articlehistory import ArticleHistory
     from histogram import Histogram
+    from revisiontable import RevisionTable
+    from exceptions import BadRequestException
 
 def test_get_x_axis_data():
     """test for get_x_axis_data in Histogram"""
@@ -33,6 +39,38 @@ def test_set_num_bins():
                                            18676, 18677, 18678, 18679, 18680, 18681, 18682, 18683,
                                            18684, 18685, 18686, 18687])
 
+def test_granularity_binning():
+    """timestamps are counted per hour, day, week or month"""
+    history = History()
+    history.revisions = RevisionTable.from_json([
+        {"revid": 1, "timestamp": "2021-02-01T10:15:00Z"},  # a Monday
+        {"revid": 2, "timestamp": "2021-02-01T10:45:00Z"},
+        {"revid": 3, "timestamp": "2021-02-03T23:59:59Z"},
+        {"revid": 4, "timestamp": "2021-02-08T00:00:00Z"},  # the next Monday
+        {"revid": 5, "timestamp": "2021-03-01T00:00:00Z"},
+    ])
+    hist = Histogram(history, "day")
+    hist.set_num_bins()
+    assert hist.counts.sum() == 5
+    assert hist.counts[:3].tolist() == [2, 0, 1]
+    assert len(hist.num_bins) == len(hist.counts) + 1
+    assert hist.num_bins[0] == mdates.date2num(np.datetime64("2021-02-01"))
+
+    hist = Histogram(history, "week")
+    hist.set_num_bins()
+    assert hist.counts.tolist() == [3, 1, 0, 0, 1]
+    assert hist.num_bins[0] == mdates.date2num(np.datetime64("2021-02-01"))
+
+    hist = Histogram(history, "month")
+    hist.set_num_bins()
+    assert hist.counts.tolist() == [4, 1]
+
+    hist = Histogram(history)
+    assert hist.resolve_granularity() == "day"
+
+    with pytest.raises(BadRequestException):
+        Histogram(history, "fortnight")
+
 if __name__ == "__main__":
     test_get_x_axis_data()
     test_set_num_bins()
@@ -1,15 +1,21 @@
 """test for article history subclass"""
 import __init__
-import pytest
 import json
+import threading
+import time
+import pytest
 try:
+    from src import upstream
     from src.history import History
     from src.exceptions import BadRequestException
     from src.revision import Revision
+    from src.cache import revision_cache, LRUCache, DiskStore
 except ModuleNotFoundError:
+    import upstream
     from history import History
     from exceptions import BadRequestException
     from revision import Revision
+    from cache import revision_cache, LRUCache, DiskStore
 
 def test_get_list_of_revision_key_data():
     """tests get_list_of_revision_key_data"""
@@ -39,3 +45,66 @@ def test_get_list_of_revision_key_data():
         rev_key_list_timestamp.append(each_rev.timestamp)
 
     assert history_test.get_list_of_revision_key_data("timestamp") == rev_key_list_timestamp
+
+def test_paginate_follows_continuation(monkeypatch):
+    """paginate passes each page's continue block into the next request"""
+    pages = [
+        {"continue": {"rvcontinue": "20230101000000|42", "continue": "||"}, "query": {}},
+        {"query": {}},
+    ]
+    sent_params = []
+    def fake_get(params):
+        sent_params.append(dict(params))
+        return pages[len(sent_params) - 1]
+    monkeypatch.setattr(upstream, "get", fake_get)
+    assert list(History.paginate({"action": "query"})) == pages
+    assert "rvcontinue" not in sent_params[0]
+    assert sent_params[1]["rvcontinue"] == "20230101000000|42"
+    assert sent_params[1]["continue"] == "||"
+
+def test_filter_by_keyword_concurrent(monkeypatch):
+    """keyword filtering runs in parallel, bounded, and keeps order"""
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_contains_keyword(self, keyword): # pylint: disable=unused-argument
+        """simulates a network round trip per revision"""
+        with lock:
+            in_flight.append(self.revid)
+            peak.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(self.revid)
+        return self.revid % 3 == 0
+
+    monkeypatch.setattr(Revision, "contains_keyword", slow_contains_keyword)
+    history_test = History()
+    history_test.keyword = "anything"
+    history_test.max_in_flight = 4
+    history_test.revisions = [Revision({"revid": i}) for i in range(30)]
+    history_test.filter_by_keyword()
+    assert [rev.revid for rev in history_test.revisions] == list(range(0, 30, 3))
+    assert 1 < max(peak) <= 4
+
+def test_fetch_wikitext_batches(monkeypatch, tmp_path):
+    """raw content is requested 50 revids at a time and served from cache afterwards"""
+    requested = []
+    def fake_get(params):
+        revids = [int(revid) for revid in params["revids"].split("|")]
+        requested.append(revids)
+        return {"query": {"pages": [{"revisions": [
+            {"revid": revid, "slots": {"main": {"content": f"text {revid}"}}}
+            for revid in revids]}]}}
+    monkeypatch.setattr(upstream, "get", fake_get)
+    monkeypatch.setattr(revision_cache, "memory", LRUCache())
+    monkeypatch.setattr(revision_cache, "disk", DiskStore(str(tmp_path)))
+    history_test = History()
+    history_test.revisions = [Revision({"revid": i}) for i in range(120)]
+    wikitext = history_test.fetch_wikitext()
+    assert [len(batch) for batch in requested] == [50, 50, 20]
+    assert wikitext[119] == "text 119"
+    assert len(wikitext) == 120
+    assert history_test.revisions[3].get_wikitext() == "text 3"
+    assert history_test.fetch_wikitext([1, 2, 500])[500] == "text 500"
+    assert requested[-1] == [500]
@@ -0,0 +1,36 @@
+"""Tests for per-request metrics and their Prometheus exposition"""
+import __init__
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import metrics
+
+def test_request_metrics_follow_the_request():
+    """records made during a request, even on pool threads, land in its metrics"""
+    request_metrics = metrics.start_request("/test")
+    metrics.record_upstream_call(100, 0.25)
+    metrics.record_cache("revision", True)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(metrics.carry(lambda _: metrics.record_time("filter", 0.5)), range(2)))
+    assert metrics.finish_request(200) is request_metrics
+    assert request_metrics.upstream_calls == 1 and request_metrics.upstream_bytes == 100
+    assert request_metrics.seconds["filter"] == 1.0
+    timing = request_metrics.server_timing()
+    assert 'upstream;dur=250.0;desc="1 calls, 100 bytes"' in timing
+    assert 'cache-revision-hit;desc="1"' in timing
+    assert metrics.finish_request(200) is None
+
+def test_exposition_format():
+    """counters and histograms are written in the Prometheus text format"""
+    registry = metrics.Registry()
+    registry.inc("wikiwatcher_upstream_calls_total", 3, route='/a"b')
+    registry.observe("wikiwatcher_request_duration_seconds", 0.2, route="/a")
+    registry.observe("wikiwatcher_request_duration_seconds", 3.0, route="/a")
+    lines = registry.exposition().splitlines()
+    assert "# TYPE wikiwatcher_request_duration_seconds histogram" in lines
+    assert 'wikiwatcher_upstream_calls_total{route="/a\\"b"} 3' in lines
+    assert 'wikiwatcher_request_duration_seconds_bucket{route="/a",le="0.25"} 1' in lines
+    assert 'wikiwatcher_request_duration_seconds_bucket{route="/a",le="+Inf"} 2' in lines
+    assert 'wikiwatcher_request_duration_seconds_count{route="/a"} 2' in lines
+
+if __name__ == "__main__":
+    pytest.main([__file__])
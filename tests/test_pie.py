@@ -0,0 +1,46 @@
+"""tests for Pie class"""
+import __init__
+import pytest
+try:
+    from src.articlehistory import ArticleHistory
+    from src.pie import Pie, OTHER_LABEL
+    from src.revisiontable import RevisionTable
+    from src.exceptions import BadRequestException
+except ModuleNotFoundError:
+    from articlehistory import ArticleHistory
+    from pie import Pie, OTHER_LABEL
+    from revisiontable import RevisionTable
+    from exceptions import BadRequestException
+
+def make_article_history(users):
+    """an ArticleHistory holding one revision per entry in users, built offline"""
+    art = ArticleHistory.__new__(ArticleHistory)
+    art.init_to_none()
+    art.titles = "Cat"
+    art.revisions = RevisionTable.from_json([{"revid": i, "user": user}
+                                             for i, user in enumerate(users)])
+    return art
+
+def test_top_n_folds_tail_into_other():
+    """only the largest top_n users get their own wedge"""
+    art = make_article_history(["a"] * 5 + ["b"] * 3 + ["c"] * 2 + ["d", "e"])
+    pie = Pie(art, top_n=2)
+    assert pie.labels == ("a", "b", OTHER_LABEL)
+    assert pie.sizes == [5, 3, 4]
+    pie = Pie(art, top_n=0)
+    assert len(pie.labels) == 5
+    assert sum(pie.sizes) == 12
+    with pytest.raises(BadRequestException):
+        Pie(art, top_n=-1)
+
+def test_size_of_png_grows_with_wedges():
+    """figure size follows the number of wedges actually drawn"""
+    small = Pie(make_article_history(["a", "b"]))
+    big = Pie(make_article_history([str(i) for i in range(500)]), top_n=100)
+    assert small.size_of_png()[0][0] < big.size_of_png()[0][0] <= 20
+    capped = Pie(make_article_history([str(i) for i in range(500)]))
+    assert len(capped.labels) == 31
+    assert capped.size_of_png()[0][0] < big.size_of_png()[0][0]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,78 @@
+"""tests for chart rendering and the chart cache"""
+import __init__
+import time
+import pytest
+import matplotlib.pyplot as plt
+try:
+    from src import render
+    from src.history import History
+    from src.histogram import Histogram
+    from src.cache import LRUCache
+    from src.revisiontable import RevisionTable
+    from src.exceptions import BadRequestException, RenderUnavailableException
+except ModuleNotFoundError:
+    import render
+    from history import History
+    from histogram import Histogram
+    from cache import LRUCache
+    from revisiontable import RevisionTable
+    from exceptions import BadRequestException, RenderUnavailableException
+
+def make_history(tags):
+    """a closed-ended history with a few revisions, built offline"""
+    history = History(tags=tags, end_year=2021)
+    history.revisions = RevisionTable.from_json([
+        {"revid": i, "timestamp": f"2021-02-0{i}T00:00:00Z"} for i in range(1, 5)])
+    return history
+
+def test_render_chart_is_cached(monkeypatch):
+    """the second identical request is served from bytes without drawing"""
+    monkeypatch.setattr(render, "chart_cache", LRUCache())
+    monkeypatch.setattr(render, "RENDER_WORKERS", 0)
+    drawn = []
+    def make_chart(history):
+        drawn.append(history)
+        return Histogram(history, "day")
+    first = render.render_chart(make_history(["a", "b"]), "revisions_per_time",
+                                {"granularity": "day"}, "png", make_chart)
+    second = render.render_chart(make_history(["b", "a"]), "revisions_per_time",
+                                 {"granularity": "day"}, "png", make_chart)
+    assert first.startswith(b"\x89PNG")
+    assert first == second
+    assert len(drawn) == 1
+    svg = render.render_chart(make_history(["a", "b"]), "revisions_per_time",
+                              {"granularity": "day"}, "svg", make_chart)
+    assert b"<svg" in svg
+    assert len(drawn) == 2
+    assert not plt.get_fignums()
+
+def test_render_rejects_unknown_format():
+    """only png and svg can be requested"""
+    with pytest.raises(BadRequestException):
+        render.render_chart(make_history(None), "revisions_per_time", {}, "gif", Histogram)
+
+def test_render_in_process_pool():
+    """charts are drawn in worker processes from their aggregated data only"""
+    hist = Histogram(make_history(None), "day")
+    render.configure(workers=1, queue_depth=2, timeout=60)
+    try:
+        image = render.render_in_pool(hist.drawing_function(), hist.render_data(), "png")
+        assert image.startswith(b"\x89PNG")
+        render.configure(queue_depth=0)
+        with pytest.raises(RenderUnavailableException):
+            render.render_in_pool(hist.drawing_function(), hist.render_data(), "png")
+    finally:
+        render.configure(workers=2, queue_depth=8, timeout=30)
+
+def test_slow_render_times_out():
+    """a chart outlasting RENDER_TIMEOUT is refused rather than left to hang"""
+    render.configure(workers=1, queue_depth=2, timeout=0.5)
+    try:
+        # time.sleep stands in for a draw function which takes 3 seconds
+        with pytest.raises(RenderUnavailableException):
+            render.render_in_pool(time.sleep, 3, "png")
+    finally:
+        render.configure(workers=2, queue_depth=8, timeout=30)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
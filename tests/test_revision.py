@@ -1,8 +1,13 @@
 """Tests for class revision"""
 import __init__
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pytest
-from revision import Revision, URL, datetime
+import revision
+from revision import Revision, datetime
+from cache import LRUCache, DiskStore, TieredCache
 
 def test_revision_init():
     """Tests initialization of a single revision
@@ -92,6 +97,42 @@ def test_get_revision_key():
     assert test_revision.get_revision_key("user") == "Ss112"
     assert test_revision.get_revision_key("userid") == 1286970
 
+def test_get_diff_is_cached(monkeypatch, tmp_path):
+    """a diff is fetched from upstream once and then served from the cache"""
+    calls = []
+    def fake_get(params):
+        calls.append(params)
+        return {"compare": {"*": "<tr>diff</tr>"}}
+    monkeypatch.setattr(revision, "revision_cache",
+                        TieredCache(LRUCache(), DiskStore(str(tmp_path))))
+    monkeypatch.setattr(revision.upstream, "get", fake_get)
+    test_revision = Revision({"revid": 2, "parentid": 1})
+    assert test_revision.get_diff() == "<tr>diff</tr>"
+    assert test_revision.contains_keyword("diff") is True
+    assert Revision({"revid": 2, "parentid": 1}).get_diff() == "<tr>diff</tr>"
+    assert len(calls) == 1
+
+def test_concurrent_diffs_share_one_fetch(monkeypatch, tmp_path):
+    """simultaneous requests for the same diff make one upstream call"""
+    calls = []
+    started = threading.Event()
+    def fake_get(params):
+        calls.append(params)
+        started.set()
+        time.sleep(0.2)
+        return {"compare": {"*": "<tr>diff</tr>"}}
+    monkeypatch.setattr(revision, "revision_cache",
+                        TieredCache(LRUCache(), DiskStore(str(tmp_path))))
+    monkeypatch.setattr(revision.upstream, "get", fake_get)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(Revision({"revid": 2, "parentid": 1}).get_diff)
+        started.wait()
+        others = [pool.submit(Revision({"revid": 2, "parentid": 1}).get_diff)
+                  for _ in range(3)]
+        diffs = [first.result()] + [other.result() for other in others]
+    assert diffs == ["<tr>diff</tr>"] * 4
+    assert len(calls) == 1
+
 if __name__ == "__main__":
     # print("run python -m pytest")
     test_get_content()
@@ -0,0 +1,80 @@
+"""Tests for the columnar revision container"""
+import __init__
+import json
+import numpy as np
+import pytest
+try:
+    from src.revision import Revision
+    from src.revisiontable import RevisionTable
+except ModuleNotFoundError:
+    from revision import Revision
+    from revisiontable import RevisionTable
+
+ROWS = [
+    {"revid": 3, "parentid": 2, "minor": False, "user": "Ss112", "userid": 1286970,
+     "timestamp": "2022-12-13T11:41:23Z", "size": 63658, "comment": "add peak",
+     "tags": ["wikieditor"], "pageid": 61495838, "title": "100 Gecs"},
+    {"revid": 4, "parentid": 3, "minor": True, "user": "203.0.113.9", "anon": True,
+     "userid": 0, "timestamp": "2022-12-14T00:00:00Z", "size": 63600, "comment": "",
+     "tags": ["mobile edit", "mw-reverted"], "pageid": 61495838, "title": "100 Gecs"},
+    {"revid": 5, "parentid": 4, "minor": False, "user": "Ss112", "userid": 1286970,
+     "timestamp": "2022-12-15T08:30:00Z", "size": 63700, "comment": "rv",
+     "tags": [], "pageid": 61495838, "title": "100 Gecs"},
+]
+
+def test_rows_round_trip():
+    """rows come back out of the table as the JSON that went in"""
+    table = RevisionTable.from_json(ROWS)
+    assert len(table) == 3
+    for original, row in zip(ROWS, table.iter_json()):
+        assert row == original
+    assert table[1].user == "203.0.113.9"
+    assert table[-1].revid == 5
+    assert isinstance(table[0], Revision)
+    with pytest.raises(IndexError):
+        table[3] # pylint: disable=pointless-statement
+
+def test_columns_are_arrays():
+    """columns are typed numpy arrays with interned strings"""
+    table = RevisionTable.from_json(ROWS)
+    assert table.column("size").dtype == np.int64
+    assert table.column("timestamp").dtype == np.dtype("datetime64[s]")
+    assert table.pools["user"].strings == ["Ss112", "203.0.113.9"]
+    assert table.values("user") == ["Ss112", "203.0.113.9", "Ss112"]
+    assert table.values("timestamp")[0] == "2022-12-13T11:41:23Z"
+    assert table.values("tags") == [["wikieditor"], ["mobile edit", "mw-reverted"], []]
+    assert table.value_counts("user") == {"Ss112": 2, "203.0.113.9": 1}
+
+def test_select_and_tag_mask():
+    """selecting rows keeps each row's own tags"""
+    table = RevisionTable.from_json(ROWS)
+    assert table.tag_mask(["mw-reverted"]).tolist() == [False, True, False]
+    assert table.tag_mask(["mobile edit", "mw-reverted"]).tolist() == [False, True, False]
+    assert table.tag_mask(["spam"]).tolist() == [False, False, False]
+    picked = table.select([2, 1])
+    assert picked.values("revid") == [5, 4]
+    assert picked.values("tags") == [[], ["mobile edit", "mw-reverted"]]
+    assert table[1:].values("revid") == [4, 5]
+
+def test_extend_recodes_strings():
+    """tables built separately can be appended to one another"""
+    table = RevisionTable.from_json(ROWS[:1])
+    table.extend(RevisionTable.from_json(ROWS[1:]))
+    table.extend([Revision(dict(ROWS[0], revid=6))])
+    assert table.values("revid") == [3, 4, 5, 6]
+    assert table.values("user") == ["Ss112", "203.0.113.9", "Ss112", "Ss112"]
+    assert table.values("tags")[1] == ["mobile edit", "mw-reverted"]
+    assert json.dumps(list(table.iter_json()))
+
+def test_sorted_by_time_and_split_by():
+    """tables can be put in time order and split by a string column"""
+    table = RevisionTable.from_json([ROWS[2], ROWS[0], ROWS[1]])
+    assert table.sorted_by_time().values("revid") == [3, 4, 5]
+    assert table.sorted_by_time(newest_first=True).values("revid") == [5, 4, 3]
+    by_user = table.sorted_by_time().split_by("user")
+    assert set(by_user) == {"Ss112", "203.0.113.9"}
+    assert by_user["Ss112"].values("revid") == [3, 5]
+    assert by_user["203.0.113.9"].values("revid") == [4]
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,43 @@
+"""Tests for the upstream request scheduler"""
+import __init__
+import time
+import asyncio
+import pytest
+from scheduler import Scheduler, in_lane, current_lane, INTERACTIVE, BULK
+
+def test_token_bucket_paces_requests():
+    """a burst goes out at once, then requests are spaced by the rate"""
+    scheduler = Scheduler(rate=50, burst=2)
+    start = time.monotonic()
+    for _ in range(5):
+        scheduler.acquire()
+    assert time.monotonic() - start >= 3 / 50 * 0.9
+    stats = scheduler.stats()["lanes"]["interactive"]
+    assert stats["requests"] == 5 and stats["max_wait"] > 0
+
+def test_bulk_lane_yields_to_interactive():
+    """bulk requests take no tokens while an interactive request waits"""
+    scheduler = Scheduler(rate=None)
+    assert scheduler.try_take(BULK) == 0
+    scheduler.waiting[INTERACTIVE] = 1
+    assert scheduler.try_take(BULK) > 0
+    assert scheduler.try_take(INTERACTIVE) == 0
+
+def test_backoff_pauses_every_lane():
+    """a throttling answer holds back sync and async requests alike"""
+    scheduler = Scheduler(rate=None)
+    scheduler.backoff(0.05)
+    assert scheduler.acquire(BULK) >= 0.04
+    scheduler.backoff(0.05)
+    assert asyncio.run(scheduler.acquire_async()) >= 0.04
+    assert scheduler.stats()["throttled"] == 2
+
+def test_in_lane_sets_current_lane():
+    """the lane is taken from the calling context"""
+    assert current_lane.get() == INTERACTIVE
+    with in_lane(BULK):
+        assert current_lane.get() == BULK
+    assert current_lane.get() == INTERACTIVE
+
+if __name__ == "__main__":
+    pytest.main([__file__])
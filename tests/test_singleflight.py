@@ -0,0 +1,47 @@
+"""Tests for single-flight call deduplication"""
+import __init__
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    """callers arriving while a call is in flight wait for it and get its result"""
+    flights = SingleFlight()
+    calls = []
+    started = threading.Event()
+    def work():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return ["result"]
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        leader = pool.submit(flights.do, "key", work)
+        started.wait()
+        followers = [pool.submit(flights.do, "key", work) for _ in range(5)]
+        results = [leader.result()] + [follower.result() for follower in followers]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.in_flight() == 0
+
+def test_errors_are_shared_and_keys_released():
+    """waiters see the leader's exception, and later calls run afresh"""
+    flights = SingleFlight()
+    started = threading.Event()
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("upstream down")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flights.do, "key", fail)
+        started.wait()
+        follower = pool.submit(flights.do, "key", fail)
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+    assert flights.do("key", lambda: "fresh") == "fresh"
+    assert flights.do("other", lambda: "other") == "other"
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,115 @@
+"""Tests for the shared upstream client"""
+import __init__
+import json
+import asyncio
+import pytest
+import upstream
+from tests.stubserver import StubServer
+
+class FakeResponse:
+    """stands in for requests.Response"""
+    def __init__(self, body, status_code=200, headers=None):
+        self.body = body
+        self.content = json.dumps(body).encode("utf-8")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        """returns the canned body"""
+        return self.body
+
+def test_get_session_is_shared():
+    """the same pooled session is reused between calls"""
+    assert upstream.get_session() is upstream.get_session()
+    adapter = upstream.get_session().get_adapter(upstream.URL)
+    assert adapter.max_retries.total == upstream.RETRIES
+
+def test_configure_rebuilds_session():
+    """configure() swaps in a session with the new pool size"""
+    old_session = upstream.get_session()
+    upstream.configure(pool_size=5)
+    try:
+        assert upstream.get_session() is not old_session
+        adapter = upstream.get_session().get_adapter(upstream.URL)
+        assert adapter._pool_maxsize == 5 # pylint: disable=protected-access
+    finally:
+        upstream.configure(pool_size=20)
+
+def test_configure_changes_api_url(monkeypatch):
+    """requests go to whichever API URL was configured last"""
+    calls = []
+    def fake_get(url, params, timeout):
+        calls.append((url, params["action"], timeout))
+        return FakeResponse({"ok": True})
+    monkeypatch.setattr(upstream, "URL", upstream.URL)
+    upstream.configure(url="http://127.0.0.1:8001/w/api.php")
+    monkeypatch.setattr(upstream.get_session(), "get", fake_get)
+    upstream.get({"action": "query"})
+    assert calls == [("http://127.0.0.1:8001/w/api.php", "query", upstream.TIMEOUT)]
+
+def test_get_passes_timeout(monkeypatch):
+    """every upstream call carries a timeout"""
+    calls = []
+    def fake_get(url, params, timeout):
+        calls.append((url, params, timeout))
+        return FakeResponse({"ok": True})
+    monkeypatch.setattr(upstream.get_session(), "get", fake_get)
+    assert upstream.get({"action": "query"}) == {"ok": True}
+    assert calls[0][2] == upstream.TIMEOUT
+    upstream.get({"action": "query"}, timeout=1)
+    assert calls[1][2] == 1
+
+def test_aget_retries_unavailable_upstream(monkeypatch):
+    """aget retries a 503, waiting as long as Retry-After asks"""
+    replies = [(503, {"error": "busy"}, {"Retry-After": "0"}), {"ok": True}]
+    with StubServer(lambda params: replies.pop(0)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        async def fetch():
+            async with upstream.make_async_client() as client:
+                return await upstream.aget({"action": "query", "titles": None}, client)
+        assert asyncio.run(fetch()) == {"ok": True}
+    assert len(stub.requests) == 2
+    assert stub.requests[0] == {"action": "query", "maxlag": str(upstream.MAXLAG)}
+
+def test_get_retries_maxlag(monkeypatch):
+    """a maxlag error pauses the scheduler and the request is tried again"""
+    replies = [FakeResponse({"error": {"code": "maxlag"}}, headers={"Retry-After": "0"}),
+               FakeResponse({"ok": True})]
+    sent_params = []
+    def fake_get(url, params, timeout):
+        assert (url, timeout) == (upstream.URL, upstream.TIMEOUT)
+        sent_params.append(params)
+        return replies.pop(0)
+    monkeypatch.setattr(upstream.get_session(), "get", fake_get)
+    throttled = upstream.scheduler.stats()["throttled"]
+    assert upstream.get({"action": "query"}) == {"ok": True}
+    assert len(sent_params) == 2 and sent_params[0]["maxlag"] == upstream.MAXLAG
+    assert upstream.scheduler.stats()["throttled"] == throttled + 1
+
+def test_get_gives_up_after_retries(monkeypatch):
+    """an error status or maxlag error still there after the last retry is
+    raised, rather than decoded or returned as if it were results"""
+    monkeypatch.setattr(upstream, "RETRIES", 1)
+    monkeypatch.setattr(upstream, "BACKOFF_FACTOR", 0)
+    sent = []
+    for reply in (FakeResponse("<html>busy</html>", 503, {"Retry-After": "0"}),
+                  FakeResponse("<html>oops</html>", 500),
+                  FakeResponse({"error": {"code": "maxlag"}}, headers={"Retry-After": "0"})):
+        sent.clear()
+        def fake_get(url, params, timeout, reply=reply):
+            sent.append((url, params["action"], timeout))
+            return reply
+        monkeypatch.setattr(upstream.get_session(), "get", fake_get)
+        with pytest.raises(upstream.UpstreamUnavailableException):
+            upstream.get({"action": "query"})
+        assert sent == [(upstream.URL, "query", upstream.TIMEOUT)] * 2
+
+def test_retry_delay():
+    """backoff doubles per attempt unless Retry-After says otherwise"""
+    assert upstream.retry_delay(0) == upstream.BACKOFF_FACTOR
+    assert upstream.retry_delay(2) == upstream.BACKOFF_FACTOR * 4
+    assert upstream.retry_delay(1, "7") == 7
+    assert upstream.retry_delay(1, "soon") == upstream.BACKOFF_FACTOR * 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
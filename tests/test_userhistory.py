@@ -1,6 +1,19 @@
 """ Tests for user history class """
 import __init__
-from userhistory import UserHistory
+import asyncio
+import itertools
+import pytest
+import userhistory as user_history_module
+from userhistory import UserHistory, MultiUserHistory
+from tests.stubserver import StubServer, usercontribs_pages
+try:
+    from src import upstream
+    from src import pagination
+    from src.revision import Revision
+except ModuleNotFoundError:
+    import upstream
+    import pagination
+    from revision import Revision
 
 def test_userhistory_init():
     """Tests user history init"""
@@ -51,5 +64,169 @@ def test_userhistory_timestamps():
     assert user_history.revisions[0].title == "Bernie Ecclestone"
 
 
+def test_userhistory_pushes_filters_down(monkeypatch):
+    """tag, minor and namespace filters are sent to the API"""
+    sent_params = []
+    def fake_get(params):
+        sent_params.append(params)
+        return {"query": {"usercontribs": [
+            {"revid": 1, "user": "QuicoleJR", "title": "Cat", "ns": 0,
+             "tags": ["mobile edit"], "minor": True},
+        ]}}
+    monkeypatch.setattr(upstream, "get", fake_get)
+    user_history = UserHistory("QuicoleJR", tags=["mobile edit"], minor=True, namespace=0,
+                               titles="cat")
+    assert sent_params[0]["uctag"] == "mobile edit"
+    assert sent_params[0]["ucshow"] == "minor"
+    assert sent_params[0]["ucnamespace"] == 0
+    assert len(user_history.plan_query()[1]) == 1  # only the title is checked locally
+    assert len(user_history.revisions) == 1
+
+def test_userhistory_fetch_async(monkeypatch):
+    """fetch() follows continuation over HTTP, and histories sharing a client
+    can be fetched concurrently"""
+    with StubServer(usercontribs_pages("QuicoleJR", pages=3, per_page=4)) as stub:
+        monkeypatch.setattr(upstream, "URL", stub.url)
+        async def fetch_both():
+            async with upstream.make_async_client() as client:
+                return await asyncio.gather(
+                    UserHistory("QuicoleJR", fetch=False).fetch(client),
+                    UserHistory("Greatgiant19", min_size=102, fetch=False).fetch(client))
+        everything, large = asyncio.run(fetch_both())
+    assert len(stub.requests) == 6
+    assert len(everything.revisions) == 12
+    assert everything.revisions.values("revid") == list(range(1, 13))
+    assert set(large.revisions.values("size")) == {102, 103}
+    assert large.revisions[0].user == "Greatgiant19"
+
+def test_userhistory_stream_revisions(monkeypatch):
+    """stream_revisions fetches pages only as rows are consumed"""
+    sent_params = []
+    respond = usercontribs_pages("QuicoleJR", pages=3, per_page=4)
+    def fake_get(params):
+        sent_params.append(dict(params))
+        return respond(params)
+    monkeypatch.setattr(upstream, "get", fake_get)
+    user_history = UserHistory("QuicoleJR", min_size=102, fetch=False)
+    rows = user_history.stream_revisions()
+    assert len(sent_params) == 1
+    assert [row["revid"] for row in itertools.islice(rows, 2)] == [3, 4]
+    assert len(sent_params) == 1
+    assert [row["revid"] for row in rows] == [7, 8, 11, 12]
+    assert len(sent_params) == 3
+    assert user_history.revisions is None
+
+    with pytest.raises(user_history_module.NoRevisionsException):
+        UserHistory("QuicoleJR", min_size=500, fetch=False).stream_revisions()
+
+def fake_contribs(count, sent_params):
+    """returns a fake upstream.get serving count contributions, honouring
+    uclimit and resuming from an offset passed as uccontinue"""
+    contribs = [{"revid": i + 1, "user": "QuicoleJR", "title": "Cat", "ns": 0,
+                 "size": 100 * (i % 4), "timestamp": "2023-01-01T00:00:00Z"}
+                for i in range(count)]
+    def fake_get(params):
+        sent_params.append(dict(params))
+        start = int(params.get("uccontinue", 0))
+        end = start + int(params["uclimit"])
+        data = {"query": {"usercontribs": [dict(row) for row in contribs[start:end]]}}
+        if end < count:
+            data["continue"] = {"uccontinue": str(end), "continue": "-||"}
+        return data
+    return fake_get
+
+def test_userhistory_fill_page(monkeypatch):
+    """a page without local filters costs one request, and cursors resume exactly"""
+    sent_params = []
+    monkeypatch.setattr(upstream, "get", fake_contribs(25, sent_params))
+    user_history = UserHistory("QuicoleJR", fetch=False)
+    cursor = user_history.fill_page(10)
+    assert len(sent_params) == 1 and sent_params[0]["uclimit"] == "10"
+    assert user_history.revisions.values("revid") == list(range(1, 11))
+    cursor = user_history.fill_page(10, cursor)
+    assert len(sent_params) == 2
+    assert user_history.revisions.values("revid") == list(range(11, 21))
+    assert user_history.fill_page(10, cursor) is None
+    assert user_history.revisions.values("revid") == list(range(21, 26))
+
+    with pytest.raises(user_history_module.BadRequestException):
+        UserHistory("QuicoleJR", min_size=100, fetch=False).fill_page(10, cursor)
+    forged = pagination.encode_cursor(user_history.query_key(), {"ucuser": "Someone"}, 0)
+    with pytest.raises(user_history_module.BadRequestException):
+        user_history.fill_page(10, forged)
+    forged = pagination.encode_cursor(user_history.query_key(), {"uccontinue": ["1"]}, 0)
+    with pytest.raises(user_history_module.BadRequestException):
+        user_history.fill_page(10, forged)
+
+def test_userhistory_fill_page_with_local_filter(monkeypatch):
+    """pages of locally filtered revisions resume part-way through an upstream page"""
+    sent_params = []
+    monkeypatch.setattr(upstream, "get", fake_contribs(1200, sent_params))
+    user_history = UserHistory("QuicoleJR", titles="cat", min_size=300, fetch=False)
+    seen = []
+    cursor = None
+    while True:
+        cursor = user_history.fill_page(70, cursor)
+        seen += user_history.revisions.values("revid")
+        if cursor is None:
+            break
+    assert seen == list(range(4, 1201, 4))
+    assert {params["uclimit"] for params in sent_params} == {"500"}
+
+def test_userhistory_fill_page_with_keyword(monkeypatch):
+    """a short keyword page fetches diffs for a few rows, not the whole upstream page"""
+    sent_params = []
+    checked = []
+    def fake_contains_keyword(self, keyword): # pylint: disable=unused-argument
+        checked.append(self.revid)
+        return self.revid % 2 == 0
+    monkeypatch.setattr(upstream, "get", fake_contribs(1200, sent_params))
+    monkeypatch.setattr(Revision, "contains_keyword", fake_contains_keyword)
+    user_history = UserHistory("QuicoleJR", keyword="cat", fetch=False)
+    cursor = user_history.fill_page(5)
+    assert user_history.revisions.values("revid") == [2, 4, 6, 8, 10]
+    assert len(checked) <= 15
+    cursor = user_history.fill_page(5, cursor)
+    assert user_history.revisions.values("revid") == [12, 14, 16, 18, 20]
+    assert len(sent_params) == 2 and len(checked) <= 30
+
+def test_userhistory_newest_first():
+    """listing newest first walks backwards from the end bound"""
+    user_history = UserHistory("QuicoleJR", startyear=2022, endyear=2023,
+                               newest_first=True, fetch=False)
+    params = user_history.revision_params()
+    assert params["ucdir"] == "older"
+    assert params["ucstart"].startswith("2023")
+    assert params["ucend"].startswith("2022")
+
+def test_multiuserhistory_batches_users(monkeypatch):
+    """a cohort is listed 50 users per request, merged in time order
+    and split per user"""
+    sent_params = []
+    def fake_get(params):
+        sent_params.append(dict(params))
+        users = params["ucuser"].split("|")
+        return {"query": {"usercontribs": [
+            {"revid": int(user[4:]) + 1, "user": user, "title": "Cat", "ns": 0,
+             "timestamp": f"2023-01-01T00:{59 - int(user[4:]) // 2:02d}:00Z"}
+            for user in users if int(user[4:]) % 2 == 0]}}
+    monkeypatch.setattr(upstream, "get", fake_get)
+    users = [f"User{i}" for i in range(120)]
+    history = MultiUserHistory(users="|".join(users))
+    assert [len(params["ucuser"].split("|")) for params in sent_params] == [50, 50, 20]
+    timestamps = history.revisions.values("timestamp")
+    assert timestamps == sorted(timestamps) and len(timestamps) == 60
+    per_user = history.per_user()
+    assert len(per_user) == 120
+    assert per_user["User4"].values("revid") == [5]
+    assert len(per_user["User5"]) == 0
+
+    prefixed = MultiUserHistory(user_prefix="Quicole", fetch=False).revision_params()
+    assert prefixed["ucuserprefix"] == "Quicole" and "ucuser" not in prefixed
+    with pytest.raises(user_history_module.BadRequestException):
+        MultiUserHistory(fetch=False)
+    assert MultiUserHistory(users="a_b|C", fetch=False).query_key() == \
+        MultiUserHistory(users=["c", "A b"], fetch=False).query_key()
+
 if __name__ == "__main__":
     test_userhistory_keyword_filters()